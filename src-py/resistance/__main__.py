@@ -1,48 +1,128 @@
 # type: ignore
 
-from random_agent import RandomAgent
-from bayes_agent import BayesAgent
-from monte_agent import MonteAgent
-from game import Game
-
-agents = [RandomAgent(name='r1'),
-          RandomAgent(name='r2'),
-          RandomAgent(name='r3'),
-          RandomAgent(name='r4'),
-          RandomAgent(name='r5'),
-          RandomAgent(name='r6'),
-          MonteAgent()]
-
-# agents = [BayesAgent(name='b1'),
-#           BayesAgent(name='b2'),
-#           BayesAgent(name='b3'),
-#           BayesAgent(name='b4'),
-#           BayesAgent(name='b5'),
-#           BayesAgent(name='b6'),
-#           BayesAgent(name='b7')]
-
-times_won = 0
-trials = 1
-
-for i in range(trials):
-    game = Game(agents)
-    game.play()
-
-    monte_spy = False
-    for spy in game.spies:
-        if agents[spy].name == 'Mr. Monte':
-            monte_spy = True
-
-    spys_won = game.missions_lost >= 3
-
-    won_as_spy = monte_spy and spys_won
-    won_as_resistance = not (monte_spy or spys_won)
-
-    if won_as_spy or won_as_resistance:
-        times_won += 1
-
-print(f"{times_won * 100 / trials}%")
-
-# textfile = open("game.txt", "w")
-# textfile.write(game.__str__())
-# textfile.close()
+# Optional executors and outputs are imported only when their flags are given,
+# so a plain run (and each worker it spawns) loads just the engine and the agents in the pool.
+from registry import AGENTS, parse_roster
+from tournament import Tournament, Scheduler, SerialExecutor, ParallelExecutor, Checkpoint
+import argparse
+import os
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='resistance',
+        description='Plays a tournament of The Resistance between registered agents.')
+    parser.add_argument('-a', '--agents', nargs='+', default=['random:6', 'monte'], metavar='KEY[:COUNT]',
+                        help='agents in the pool, from: ' + ', '.join(AGENTS) + ' (default: random:6 monte)')
+    parser.add_argument('-p', '--players', nargs='+', type=int, metavar='N',
+                        help='table sizes to play, 5-10 (default: the whole pool, at most 10)')
+    parser.add_argument('-t', '--trials', type=int, default=1,
+                        help='number of games to play (default: 1)')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='worker processes, 0 for one per CPU (default: 1)')
+    parser.add_argument('--tables', type=int, metavar='N',
+                        help='play N games at a time as coroutines in one process (games are then not reproducible)')
+    parser.add_argument('--batch', type=int, metavar='N',
+                        help='play N games at a time in lock-step, calling agents\' batch methods where they have them '
+                        '(each game is reproducible from its seed, but differs from those of other executors)')
+    parser.add_argument('-s', '--seed', type=int,
+                        help='seed for the schedule and games (default: random)')
+    parser.add_argument('-r', '--results', metavar='DIR',
+                        help='result store to append every game to')
+    parser.add_argument('--cache', metavar='FILE',
+                        help='database of game results to reuse for games between unchanged agents')
+    parser.add_argument('--cache-size', type=int, default=256, metavar='MB',
+                        help='most results to keep in the cache, in megabytes (default: 256)')
+    parser.add_argument('-c', '--checkpoint', metavar='FILE',
+                        help='file to save progress to, and to resume from if it exists')
+    parser.add_argument('--checkpoint-interval', type=float, default=30.0, metavar='SECONDS',
+                        help='least time between checkpoints (default: 30)')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help='serve live metrics at http://127.0.0.1:PORT/metrics')
+    parser.add_argument('--metrics-file', metavar='FILE',
+                        help='file to write live metrics to periodically')
+    parser.add_argument('--metrics-interval', type=float, default=10.0, metavar='SECONDS',
+                        help='least time between metrics file writes (default: 10)')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='profile the games with cProfile, merging every worker\'s statistics into FILE '
+                        '(for pstats or other viewers) and a summary into FILE.txt')
+    parser.add_argument('--profile-sample', type=float, default=1.0, metavar='FRACTION',
+                        help='fraction of games to profile (default: 1)')
+    parser.add_argument('--profile-sort', default='cumulative', metavar='KEY',
+                        help='pstats sort key for the summary (default: cumulative)')
+    args = parser.parse_args(argv)
+    if args.profile and (args.tables or args.batch):
+        parser.error('--profile cannot be used with --tables or --batch')
+    if args.cache and (args.tables or args.batch):
+        parser.error('--cache cannot be used with --tables or --batch, whose games differ from the cached ones')
+    live = args.metrics_port is not None or args.metrics_file is not None
+
+    try:
+        agents = parse_roster(args.agents)
+        players = args.players or [min(len(agents), 10)]
+        scheduler = Scheduler(len(agents), players, args.seed)
+    except Exception as e:
+        parser.error(str(e))
+
+    if args.profile:
+        from profiling import ProfiledExecutor
+        profiler = executor = ProfiledExecutor(args.workers or None, args.profile_sample, timed=live)
+    elif args.tables:
+        from async_game import AsyncExecutor
+        executor = AsyncExecutor(args.tables)
+    elif args.batch:
+        from batch_game import BatchExecutor
+        executor = BatchExecutor(args.batch, timed=live)
+    elif args.workers == 1:
+        executor = SerialExecutor(timed=live)
+    else:
+        executor = ParallelExecutor(args.workers or None, timed=live)
+    cache = None
+    if args.cache:
+        from result_cache import ResultCache, CachingExecutor
+        cache = ResultCache(args.cache, args.cache_size << 20)
+        executor = CachingExecutor(executor, cache)
+
+    tournament = Tournament(agents, scheduler, executor)
+    names = [spec.name for spec in agents.specs]
+    callbacks = []
+    closing = []
+    store = None
+    if args.results:
+        from result_store import ResultStore
+        store = ResultStore(args.results)
+        callbacks.append(store.recorder(names))
+        closing.append(store)
+    checkpoint = Checkpoint(args.checkpoint, args.checkpoint_interval, store) if args.checkpoint else None
+    if live:
+        from metrics import TournamentMetrics, MetricsServer, MetricsFile
+        workers = 1 if args.tables or args.batch else args.workers or os.cpu_count()
+        metrics = TournamentMetrics(tournament, names, args.trials, workers)
+        callbacks.append(metrics.record)
+        if args.metrics_port is not None:
+            closing.append(MetricsServer(metrics, args.metrics_port))
+        if args.metrics_file is not None:
+            snapshots = MetricsFile(metrics, args.metrics_file, args.metrics_interval)
+            callbacks.append(snapshots.record)
+            closing.append(snapshots)
+
+    def callback(result):
+        for c in callbacks:
+            c(result)
+
+    try:
+        tournament.run(args.trials, callback, checkpoint)
+    finally:
+        for c in closing:
+            c.close()
+    print(tournament, end='')
+    if args.profile:
+        profiler.write(args.profile, args.profile_sort)
+        print(f'{profiler.games} games profiled, statistics in {args.profile} and summary in {args.profile}.txt')
+    if cache is not None:
+        print(f'{cache.hits} of {cache.hits + cache.misses} cacheable games reused from {args.cache}')
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,7 @@
-from typing import List
+from typing import Any, Dict, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from history import HistoryView
 
 
 class Agent:
@@ -52,6 +55,14 @@ class Agent:
         '''
         return self.__str__()
 
+    def observe_history(self, history: 'HistoryView') -> None:
+        '''
+        basic informative function, called before new_game with a read-only view of the game's public history
+        (teams, votes, leaders and betrayals of every proposal, with per player counts),
+        which the game keeps up to date as it is played.
+        '''
+        self.history = history
+
     def new_game(self, number_of_players: int, player_number: int, spies: List[int]) -> None:
         '''
         initialises the game, informing the agent of the number_of_players, 
@@ -124,3 +135,25 @@ class Agent:
         spies, a list of the player indexes for the spies.
         '''
         pass
+
+    @classmethod
+    def cacheable(cls, kwargs: Dict[str, Any]) -> bool:
+        '''
+        returns True if an agent constructed with kwargs plays every seeded game the same way,
+        whatever games it has played before, so the results of its games may be cached.
+        Agents that learn across games, or are otherwise non-deterministic, should return False.
+        '''
+        return True
+
+    def learning_state(self) -> Any:
+        '''
+        returns a picklable snapshot of whatever the agent has learnt across games,
+        so a checkpointed tournament can be resumed exactly, or None if the agent does not learn.
+        '''
+        return None
+
+    def restore_learning_state(self, state: Any) -> None:
+        '''
+        restores what the agent had learnt from a snapshot returned by learning_state.
+        '''
+        pass
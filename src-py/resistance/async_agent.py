@@ -0,0 +1,151 @@
+from typing import Any, List, Optional, Protocol, TYPE_CHECKING
+from concurrent.futures import Executor
+from functools import partial
+from agent import Agent
+import asyncio
+import sys
+
+if TYPE_CHECKING:
+    from history import HistoryView
+    from monte_agent import MonteAgent
+    from monte_node import Phase
+
+
+class AsyncAgent(Protocol):
+    '''
+    The Agent interface for games played as coroutines (see async_game.py).
+    propose_mission, vote and betray are coroutines, so an agent can await between steps of its thinking
+    and let the other games on the event loop progress.
+    The informative methods are the same as Agent's and are called directly.
+    '''
+
+    def observe_history(self, history: 'HistoryView') -> None:
+        ...
+
+    def new_game(self, number_of_players: int, player_number: int, spies: List[int]) -> None:
+        ...
+
+    async def propose_mission(self, team_size: int, fails_required: int = 1) -> List[int]:
+        ...
+
+    async def vote(self, mission: List[int], proposer: int) -> bool:
+        ...
+
+    async def betray(self, mission: List[int], proposer: int) -> bool:
+        ...
+
+    def vote_outcome(self, mission: List[int], proposer: int, votes: List[int]) -> None:
+        ...
+
+    def mission_outcome(self, mission: List[int], proposer: int, num_fails: int, mission_success: bool) -> None:
+        ...
+
+    def round_outcome(self, rounds_complete: int, missions_failed: int) -> None:
+        ...
+
+    def game_outcome(self, spies_win: bool, spies: List[int]) -> None:
+        ...
+
+
+class SyncAgentAdapter(AsyncAgent):
+    '''
+    Plays a synchronous Agent in an async game.
+    Its decisions are made directly on the event loop,
+    or in executor (e.g. a ThreadPoolExecutor) if one is given, so slow agents do not hold up other games.
+    Every other attribute is passed through to the agent.
+    '''
+
+    def __init__(self, agent: Agent, executor: Optional[Executor] = None) -> None:
+        self.agent = agent
+        self.executor = executor
+
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr(self.agent, attribute)
+
+    def __str__(self) -> str:
+        return str(self.agent)
+
+    def __repr__(self) -> str:
+        return repr(self.agent)
+
+    def observe_history(self, history: 'HistoryView') -> None:
+        self.agent.observe_history(history)
+
+    def new_game(self, number_of_players: int, player_number: int, spies: List[int]) -> None:
+        self.agent.new_game(number_of_players, player_number, spies)
+
+    async def decide(self, method: Any, *args: Any) -> Any:
+        if self.executor is None:
+            return method(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(method, *args))
+
+    async def propose_mission(self, team_size: int, fails_required: int = 1) -> List[int]:
+        return await self.decide(self.agent.propose_mission, team_size, fails_required)  # type: ignore[no-any-return]
+
+    async def vote(self, mission: List[int], proposer: int) -> bool:
+        return await self.decide(self.agent.vote, mission, proposer)  # type: ignore[no-any-return]
+
+    async def betray(self, mission: List[int], proposer: int) -> bool:
+        return await self.decide(self.agent.betray, mission, proposer)  # type: ignore[no-any-return]
+
+    def vote_outcome(self, mission: List[int], proposer: int, votes: List[int]) -> None:
+        self.agent.vote_outcome(mission, proposer, votes)  # type: ignore[arg-type]
+
+    def mission_outcome(self, mission: List[int], proposer: int, num_fails: int, mission_success: bool) -> None:
+        self.agent.mission_outcome(mission, proposer, num_fails, mission_success)
+
+    def round_outcome(self, rounds_complete: int, missions_failed: int) -> None:
+        self.agent.round_outcome(rounds_complete, missions_failed)
+
+    def game_outcome(self, spies_win: bool, spies: List[int]) -> None:
+        self.agent.game_outcome(spies_win, spies)
+
+
+class AsyncMonteAgent(SyncAgentAdapter):
+    '''
+    Plays a MonteAgent in an async game, yielding to the event loop every yield_every search iterations.
+    Only flat UCB1 search without pondering is stepped; other configurations decide in one go
+    (or in the executor, if one is given).
+    '''
+
+    def __init__(self, agent: 'MonteAgent', yield_every: int = 1, executor: Optional[Executor] = None) -> None:
+        SyncAgentAdapter.__init__(self, agent, executor)
+        self.monte = agent
+        self.yield_every = yield_every
+
+    def steppable(self) -> bool:
+        return self.monte.mode == 'flat' and self.monte.allocator == 'ucb' and self.monte.ponderer is None
+
+    async def search(self, phase: 'Phase', team_size: int = 0, mission: List[int] = []) -> Any:
+        monte = self.monte
+        monte.begin_decision()
+        state = monte.root(phase, team_size=team_size, mission=mission)
+        for done in monte.steps(state):
+            if done % self.yield_every == 0:
+                await asyncio.sleep(0)
+        action = monte.choose(state)
+        monte.end_decision(phase)
+        return action
+
+    async def propose_mission(self, team_size: int, fails_required: int = 1) -> List[int]:
+        if not self.steppable():
+            return await SyncAgentAdapter.propose_mission(self, team_size, fails_required)
+        from monte_node import Phase
+        return (await self.search(Phase.PROPOSE, team_size=team_size)).proposal  # type: ignore[no-any-return]
+
+    async def vote(self, mission: List[int], proposer: int) -> bool:
+        if not self.steppable():
+            return await SyncAgentAdapter.vote(self, mission, proposer)
+        from monte_node import Phase
+        return (await self.search(Phase.VOTE, mission=mission)).vote  # type: ignore[no-any-return]
+
+
+def adapt(agent: Agent, executor: Optional[Executor] = None) -> AsyncAgent:
+    '''
+    Returns agent ready to play in an async game: MonteAgents step their search, other agents are adapted whole.
+    '''
+    # monte_agent is only imported if the pool has already loaded it, so other pools do not pay for it.
+    monte_agent = sys.modules.get('monte_agent')
+    if monte_agent is not None and isinstance(agent, monte_agent.MonteAgent):
+        return AsyncMonteAgent(agent, executor=executor)
+    return SyncAgentAdapter(agent, executor)
@@ -0,0 +1,143 @@
+# type: ignore
+
+from agent import Agent
+from async_agent import adapt
+from game import Game, Round, Mission
+from tournament import GameResult
+import asyncio
+
+
+class AsyncGame(Game):
+    '''
+    A game of The Resistance played as a coroutine,
+    so many games can progress together on one event loop.
+    agents must be AsyncAgents (see async_agent.adapt for synchronous agents),
+    and the game is played by awaiting play_async.
+    '''
+
+    async def play_async(self):
+        for i in range(5):
+            self.rounds.append(
+                AsyncRound(self.leader_id, self.agents, self.spies, i, self.history))
+            if not await self.rounds[i].play_async():
+                self.missions_lost += 1
+            self.leader_id = self.rounds[i].leader_id
+            for a in self.agents:
+                a.round_outcome(i+1, self.missions_lost)
+        for a in self.agents:
+            a.game_outcome(self.missions_lost >= 3, self.spies)
+
+    def play(self):
+        asyncio.run(self.play_async())
+
+
+class AsyncRound(Round):
+    '''
+    a round of an AsyncGame.
+    '''
+
+    async def play_async(self):
+        '''
+        runs team assignment until a team is approved
+        or five missions are proposed,
+        and returns True is the final mission was successful
+        '''
+        mission_size = Agent.mission_sizes[len(self.agents)][self.rnd]
+        fails_required = Agent.fails_required[len(self.agents)][self.rnd]
+        while len(self.missions) < 5:
+            team = await self.agents[self.leader_id].propose_mission(
+                mission_size, fails_required)
+            mission = AsyncMission(self.leader_id, team,
+                                   self.agents, self.spies, self.rnd, self.history)
+            await mission.run_async()
+            self.missions.append(mission)
+            self.leader_id = (self.leader_id+1) % len(self.agents)
+            if mission.is_approved():
+                break
+        return mission.is_successful()
+
+
+class AsyncMission(Mission):
+    '''
+    a proposed mission in an AsyncGame, which is run by awaiting run_async.
+    '''
+
+    def __init__(self, leader_id, team, agents, spies, rnd, history=None):
+        self.leader_id = leader_id
+        self.team = team
+        self.agents = agents
+        self.spies = spies
+        self.rnd = rnd
+        self.history = history
+
+    async def run_async(self):
+        '''
+        Runs the mission, by asking agents to vote (all at once),
+        and if the vote is in favour,
+        asking spies if they wish to fail the mission
+        '''
+        votes = await asyncio.gather(
+            *(a.vote(self.team, self.leader_id) for a in self.agents))
+        self.votes_for = [i for i in range(len(self.agents)) if votes[i]]
+        if self.history is not None:
+            self.history.propose(self.leader_id, self.team, self.votes_for)
+        for a in self.agents:
+            a.vote_outcome(self.team, self.leader_id, self.votes_for)
+        if 2*len(self.votes_for) > len(self.agents):
+            spies = [i for i in self.team if i in self.spies]
+            betrayals = await asyncio.gather(
+                *(self.agents[i].betray(self.team, self.leader_id) for i in spies))
+            self.fails = [i for i, b in zip(spies, betrayals) if b]
+            success = len(self.fails) < Agent.fails_required[len(
+                self.agents)][self.rnd]
+            if self.history is not None:
+                self.history.mission(len(self.fails))
+            for a in self.agents:
+                a.mission_outcome(self.team, self.leader_id,
+                                  len(self.fails), success)
+
+
+async def play_games(games):
+    '''
+    Plays every AsyncGame in games together, returning when all have finished.
+    '''
+    await asyncio.gather(*(game.play_async() for game in games))
+
+
+class AsyncExecutor:
+    '''
+    Plays up to tables games at a time as coroutines on one event loop in this process.
+    As concurrent games cannot share agents, each game is played by new agents built from the pool's specs
+    (so agents do not learn across games), and as they share the random module,
+    games are not reproducible from their seeds.
+    executor is an optional concurrent.futures executor for the decisions of agents that are not stepped.
+    Results are yielded in the same order as the specs.
+    '''
+
+    def __init__(self, tables=100, executor=None):
+        self.tables = tables
+        self.executor = executor
+
+    def run(self, agents, specs):
+        loop = asyncio.new_event_loop()
+        try:
+            batch = []
+            for spec in specs:
+                batch.append(spec)
+                if len(batch) == self.tables:
+                    yield from loop.run_until_complete(self.play(agents, batch))
+                    batch = []
+            if batch:
+                yield from loop.run_until_complete(self.play(agents, batch))
+        finally:
+            loop.close()
+
+    async def play(self, agents, specs):
+        games = []
+        for spec in specs:
+            seated = [adapt(agents.specs[i].create(), self.executor) for i in spec.seating]
+            games.append(AsyncGame(seated, spies=list(spec.spies), shuffle=False))
+        await play_games(games)
+        return [GameResult(spec, game.missions_lost >= 3, game.missions_lost, None,
+                           sum(1 << i for i, r in enumerate(game.rounds) if not r.is_successful()))
+                for spec, game in zip(specs, games)]
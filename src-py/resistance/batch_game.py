@@ -0,0 +1,385 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Protocol, Sequence, Tuple
+from agent import Agent
+from history import GameHistory, HistoryView
+from registry import Roster
+from tournament import DecisionTimer, GameResult, GameSpec, LATENCY_BUCKETS, latency_bucket
+from time import thread_time
+import random
+
+
+def seat_seed(seed: int, seat: int) -> int:
+    '''
+    Returns the seed of the random number generator of seat in a game seeded with seed.
+    '''
+    return seed << 4 | seat
+
+
+class BatchAgent(Protocol):
+    '''
+    The optional batch interface of an agent, which plays many games (lanes) of a BatchGame at once.
+    Every call gives the lanes it concerns, with the other arguments listed in the same order.
+    new_game_batch tells the agent its seat in each lane it plays,
+    and the *_outcome_batch methods may be left out if the agent does not need them.
+    If the lanes are seeded, new_game_batch is also given a random number generator for the agent's seat in each lane,
+    which its decisions in that lane should draw from (instead of the random module),
+    so that each game depends on its own seed only.
+    '''
+
+    def new_game_batch(self, lanes: Sequence[int], numbers_of_players: Sequence[int],
+                       player_numbers: Sequence[int], spy_lists: Sequence[List[int]],
+                       histories: Sequence[HistoryView], randoms: Optional[Sequence[random.Random]] = None) -> None:
+        ...
+
+    def propose_mission_batch(self, lanes: Sequence[int], team_sizes: Sequence[int],
+                              fails_required: Sequence[int]) -> List[List[int]]:
+        ...
+
+    def vote_batch(self, lanes: Sequence[int], missions: Sequence[List[int]], proposers: Sequence[int]) -> List[bool]:
+        ...
+
+    def betray_batch(self, lanes: Sequence[int], missions: Sequence[List[int]], proposers: Sequence[int]) -> List[bool]:
+        ...
+
+
+OUTCOMES = ('vote_outcome_batch', 'mission_outcome_batch', 'round_outcome_batch', 'game_outcome_batch')
+
+
+def is_batch_agent(agent: Any) -> bool:
+    return all(hasattr(agent, method) for method in
+               ('new_game_batch', 'propose_mission_batch', 'vote_batch', 'betray_batch'))
+
+
+class SingleGameAgent:
+    '''
+    Gives an ordinary agent the batch interface, for the one lane it plays.
+    Ordinary agents draw from the random module, which lanes share, so if the lane is seeded,
+    the random module is reseeded before each call from the seat's seed and the number of calls before it.
+    '''
+
+    def __init__(self, agent: Agent) -> None:
+        self.agent = agent
+        self.seed: Optional[int] = None
+        self.calls = 0
+
+    def call(self, method: Callable[..., Any], *args: Any) -> Any:
+        if self.seed is not None:
+            random.seed(self.seed << 16 | self.calls)
+            self.calls += 1
+        return method(*args)
+
+    def new_game_batch(self, lanes: Sequence[int], numbers_of_players: Sequence[int],
+                       player_numbers: Sequence[int], spy_lists: Sequence[List[int]],
+                       histories: Sequence[HistoryView], randoms: Optional[Sequence[random.Random]] = None) -> None:
+        if len(lanes) != 1:
+            raise Exception(f'{self.agent} can only play one game at a time')
+        self.seed = randoms[0].getrandbits(32) if randoms is not None else None
+        self.calls = 0
+        self.agent.observe_history(histories[0])
+        self.call(self.agent.new_game, numbers_of_players[0], player_numbers[0], spy_lists[0])
+
+    def propose_mission_batch(self, lanes: Sequence[int], team_sizes: Sequence[int],
+                              fails_required: Sequence[int]) -> List[List[int]]:
+        return [self.call(self.agent.propose_mission, team_sizes[0], fails_required[0])]
+
+    def vote_batch(self, lanes: Sequence[int], missions: Sequence[List[int]], proposers: Sequence[int]) -> List[bool]:
+        return [self.call(self.agent.vote, missions[0], proposers[0])]
+
+    def betray_batch(self, lanes: Sequence[int], missions: Sequence[List[int]], proposers: Sequence[int]) -> List[bool]:
+        return [self.call(self.agent.betray, missions[0], proposers[0])]
+
+    def vote_outcome_batch(self, lanes: Sequence[int], missions: Sequence[List[int]], proposers: Sequence[int],
+                           votes: Sequence[List[int]]) -> None:
+        self.call(self.agent.vote_outcome, missions[0], proposers[0], votes[0])
+
+    def mission_outcome_batch(self, lanes: Sequence[int], missions: Sequence[List[int]], proposers: Sequence[int],
+                              num_fails: Sequence[int], successes: Sequence[bool]) -> None:
+        self.call(self.agent.mission_outcome, missions[0], proposers[0], num_fails[0], successes[0])
+
+    def round_outcome_batch(self, lanes: Sequence[int], rounds_complete: Sequence[int],
+                            missions_failed: Sequence[int]) -> None:
+        self.call(self.agent.round_outcome, rounds_complete[0], missions_failed[0])
+
+    def game_outcome_batch(self, lanes: Sequence[int], spies_win: Sequence[bool],
+                           spies: Sequence[List[int]]) -> None:
+        self.call(self.agent.game_outcome, spies_win[0], spies[0])
+
+
+class BatchTimer:
+    '''
+    Stands in for a batch agent in a BatchGame, passing every call through
+    and adding up the CPU time spent in its decisions in each lane, as DecisionTimer does for a single game.
+    Each batch call's time is shared evenly between its lanes.
+    '''
+
+    def __init__(self, agent: Any) -> None:
+        self.agent = agent
+        self.seconds: Dict[int, float] = {}
+        self.decisions: Dict[int, int] = {}
+        self.histograms: Dict[int, List[int]] = {}
+
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr(self.agent, attribute)
+
+    def __str__(self) -> str:
+        return str(self.agent)
+
+    def timed(self, method: Callable[..., List[Any]], lanes: Sequence[int], *args: Any) -> List[Any]:
+        start = thread_time()
+        result = method(lanes, *args)
+        seconds = (thread_time() - start) / len(lanes)
+        bucket = latency_bucket(seconds)
+        for lane in lanes:
+            self.seconds[lane] = self.seconds.get(lane, 0.0) + seconds
+            self.decisions[lane] = self.decisions.get(lane, 0) + 1
+            self.histograms.setdefault(lane, [0] * LATENCY_BUCKETS)[bucket] += 1
+        return result
+
+    def timing(self, lane: int) -> Tuple[float, int, Tuple[int, ...]]:
+        '''
+        Returns the CPU seconds, number and histogram of the agent's decisions in lane.
+        '''
+        return (self.seconds.get(lane, 0.0), self.decisions.get(lane, 0),
+                tuple(self.histograms.get(lane, [0] * LATENCY_BUCKETS)))
+
+    def propose_mission_batch(self, lanes: Sequence[int], team_sizes: Sequence[int],
+                              fails_required: Sequence[int]) -> List[List[int]]:
+        return self.timed(self.agent.propose_mission_batch, lanes, team_sizes, fails_required)
+
+    def vote_batch(self, lanes: Sequence[int], missions: Sequence[List[int]], proposers: Sequence[int]) -> List[bool]:
+        return self.timed(self.agent.vote_batch, lanes, missions, proposers)
+
+    def betray_batch(self, lanes: Sequence[int], missions: Sequence[List[int]], proposers: Sequence[int]) -> List[bool]:
+        return self.timed(self.agent.betray_batch, lanes, missions, proposers)
+
+
+class BatchGame:
+    '''
+    Plays many independent games of The Resistance (lanes) in lock-step:
+    each step has every unfinished game propose, vote on and (if approved) run one mission,
+    calling each agent once per step and phase with every lane it plays in.
+    Agents with the batch methods of BatchAgent may sit in many lanes (in one seat of each);
+    any other agent is called one game at a time and must sit in one lane only.
+    '''
+
+    def __init__(self, tables: Sequence[Sequence[Any]], spies: Sequence[Sequence[int]],
+                 seeds: Optional[Sequence[int]] = None) -> None:
+        '''
+        tables holds the agents in each seat of each lane, and spies the spy seats of each lane.
+        seeds optionally seeds each lane, giving each of its seats a random number generator (see BatchAgent).
+        '''
+        self.tables = tables
+        self.spies = [[*s] for s in spies]
+        lanes = range(len(tables))
+        for lane in lanes:
+            n = len(tables[lane])
+            if n not in Agent.spy_count or len(set(self.spies[lane])) != Agent.spy_count[n]:
+                raise Exception(f'Lane {lane} has an invalid table or spy list')
+        self.num_players = [len(table) for table in tables]
+        self.histories = [GameHistory(len(table), [a.name for a in table]) for table in tables]
+        self.round = [0] * len(tables)
+        self.leader = [0] * len(tables)
+        self.rejections = [0] * len(tables)
+        self.missions_lost = [0] * len(tables)
+        self.failed_rounds = [0] * len(tables)
+
+        # Each distinct agent, batched, with the (lane, seat) places it plays, in lane order.
+        self.batched: Dict[int, Any] = {}
+        self.places: Dict[int, List[Tuple[int, int]]] = {}
+        self.keys = [[id(agent) for agent in table] for table in tables]
+        for lane in lanes:
+            for seat, agent in enumerate(tables[lane]):
+                key = self.keys[lane][seat]
+                if key not in self.batched:
+                    self.batched[key] = agent if is_batch_agent(agent) else SingleGameAgent(agent)
+                    self.places[key] = []
+                self.places[key].append((lane, seat))
+        # the agents with each outcome method
+        self.listeners = {method: [key for key, agent in self.batched.items() if hasattr(agent, method)]
+                          for method in OUTCOMES}
+
+        views = [history.view() for history in self.histories]
+        for key, places in self.places.items():
+            randoms = [random.Random(seat_seed(seeds[lane], seat)) for lane, seat in places] if seeds else None
+            self.batched[key].new_game_batch(
+                [lane for lane, _ in places], [self.num_players[lane] for lane, _ in places],
+                [seat for _, seat in places],
+                [self.spies[lane].copy() if seat in self.spies[lane] else [] for lane, seat in places],
+                [views[lane] for lane, _ in places], randoms)
+
+    def places_in(self, key: int, selected: Optional[List[bool]]) -> List[Tuple[int, int]]:
+        '''
+        Returns the places of the agent key in the selected lanes (every lane if selected is None).
+        '''
+        places = self.places[key]
+        return places if selected is None else [place for place in places if selected[place[0]]]
+
+    def notify(self, method: str, selected: List[bool], *columns: Sequence[Any]) -> None:
+        '''
+        Calls the outcome method on each agent that has it,
+        with its selected lanes and the values of columns in those lanes.
+        '''
+        for key in self.listeners[method]:
+            lanes = [lane for lane, _ in self.places_in(key, selected)]
+            if lanes:
+                getattr(self.batched[key], method)(lanes, *([column[lane] for lane in lanes] for column in columns))
+
+    def play(self) -> None:
+        size = len(self.tables)
+        lanes = [*range(size)]
+        while lanes:
+            self.step(lanes)
+            lanes = [lane for lane in lanes if self.round[lane] < 5]
+
+    def step(self, lanes: List[int]) -> None:
+        '''
+        Has every lane in lanes propose a mission, vote on it and, if it is approved, run it.
+        '''
+        size = len(self.tables)
+        in_play: Optional[List[bool]] = None
+        if len(lanes) < size:
+            in_play = [False] * size
+            for lane in lanes:
+                in_play[lane] = True
+        team_sizes = [0] * size
+        fails_required = [0] * size
+        for lane in lanes:
+            team_sizes[lane] = Agent.mission_sizes[self.num_players[lane]][self.round[lane]]
+            fails_required[lane] = Agent.fails_required[self.num_players[lane]][self.round[lane]]
+        missions: List[List[int]] = [[] for _ in range(size)]
+        proposers = self.leader.copy()
+
+        leading: Dict[int, List[int]] = {}
+        for lane in lanes:
+            leading.setdefault(self.keys[lane][proposers[lane]], []).append(lane)
+        for key, group in leading.items():
+            teams = self.batched[key].propose_mission_batch(
+                group, [team_sizes[lane] for lane in group], [fails_required[lane] for lane in group])
+            for lane, team in zip(group, teams):
+                missions[lane] = team
+
+        votes_for: List[List[int]] = [[] for _ in range(size)]
+        for key in self.batched:
+            places = self.places_in(key, in_play)
+            if not places:
+                continue
+            group = [lane for lane, _ in places]
+            votes = self.batched[key].vote_batch(
+                group, [missions[lane] for lane in group], [proposers[lane] for lane in group])
+            for (lane, seat), vote in zip(places, votes):
+                if vote:
+                    votes_for[lane].append(seat)
+        approved = [False] * size
+        for lane in lanes:
+            votes_for[lane].sort()
+            self.histories[lane].propose(proposers[lane], missions[lane], votes_for[lane])
+            self.leader[lane] = (self.leader[lane] + 1) % self.num_players[lane]
+            approved[lane] = 2 * len(votes_for[lane]) > self.num_players[lane]
+        self.notify('vote_outcome_batch', in_play or [True] * size, missions, proposers, votes_for)
+
+        betraying: Dict[int, List[int]] = {}
+        for lane in lanes:
+            if approved[lane]:
+                for seat in missions[lane]:
+                    if seat in self.spies[lane]:
+                        betraying.setdefault(self.keys[lane][seat], []).append(lane)
+        fails = [0] * size
+        for key, group in betraying.items():
+            betrayals = self.batched[key].betray_batch(
+                group, [missions[lane] for lane in group], [proposers[lane] for lane in group])
+            for lane, betrayed in zip(group, betrayals):
+                fails[lane] += bool(betrayed)
+        successes = [fails[lane] < fails_required[lane] for lane in range(size)]
+        for lane in lanes:
+            if approved[lane]:
+                self.histories[lane].mission(fails[lane])
+        self.notify('mission_outcome_batch', approved, missions, proposers, fails, successes)
+
+        ended = [False] * size
+        for lane in lanes:
+            if approved[lane] or self.rejections[lane] == 4:
+                if not approved[lane] or not successes[lane]:
+                    self.missions_lost[lane] += 1
+                    self.failed_rounds[lane] |= 1 << self.round[lane]
+                self.round[lane] += 1
+                self.rejections[lane] = 0
+                ended[lane] = True
+            else:
+                self.rejections[lane] += 1
+        self.notify('round_outcome_batch', ended, self.round, self.missions_lost)
+
+        finished = [ended[lane] and self.round[lane] == 5 for lane in range(size)]
+        spies_win = [lost >= 3 for lost in self.missions_lost]
+        self.notify('game_outcome_batch', finished, spies_win, self.spies)
+
+
+class BatchExecutor:
+    '''
+    Plays games in batches of batch_size lanes of a BatchGame.
+    Agents with batch methods play every game in the batch they sit in.
+    Other agents play one game at a time, so the pool's agent plays its first game in a batch
+    and further copies, built from the pool's specs and kept from batch to batch, play the rest.
+    Each game is seeded with its own seed (see BatchGame), so its result does not depend on the batch size,
+    though it differs from that of the other executors, which share one random module between the seats.
+    Results are yielded in the same order as the specs.
+    timed is True to time each seat's decisions.
+    '''
+
+    def __init__(self, batch_size: int = 64, timed: bool = False) -> None:
+        self.batch_size = batch_size
+        self.timed = timed
+        # the copies of each pool agent without batch methods, beyond the pool's own
+        self.copies: Dict[int, List[Agent]] = {}
+
+    def run(self, agents: Sequence[Agent], specs: Iterable[GameSpec]) -> Iterator[GameResult]:
+        batch: List[GameSpec] = []
+        for spec in specs:
+            batch.append(spec)
+            if len(batch) == self.batch_size:
+                yield from self.play(agents, batch)
+                batch = []
+        if batch:
+            yield from self.play(agents, batch)
+
+    def play(self, agents: Sequence[Agent], specs: List[GameSpec]) -> List[GameResult]:
+        # the games each pool agent without batch methods has been seated in so far
+        seated: Dict[int, int] = {}
+        timers: Dict[int, BatchTimer] = {}
+        tables: List[List[Any]] = []
+        for spec in specs:
+            table: List[Any] = []
+            for i in spec.seating:
+                agent: Any = agents[i]
+                if is_batch_agent(agent):
+                    if self.timed:
+                        agent = timers.setdefault(i, BatchTimer(agent))
+                else:
+                    agent = self.copy(agents, i, seated.get(i, 0))
+                    seated[i] = seated.get(i, 0) + 1
+                    if self.timed:
+                        agent = DecisionTimer(agent)
+                table.append(agent)
+            tables.append(table)
+        game = BatchGame(tables, [spec.spies for spec in specs], [spec.seed for spec in specs])
+        game.play()
+        results = []
+        for lane, spec in enumerate(specs):
+            timings = tuple(agent.timing(lane) if isinstance(agent, BatchTimer)
+                            else (agent.total_seconds(), agent.decisions, tuple(agent.histogram))
+                            for agent in tables[lane]) if self.timed else None
+            results.append(GameResult(spec, game.missions_lost[lane] >= 3, game.missions_lost[lane], timings,
+                                      game.failed_rounds[lane]))
+        return results
+
+    def copy(self, agents: Sequence[Agent], index: int, number: int) -> Agent:
+        '''
+        Returns the number-th instance of the pool's agent index: the pool's own, then copies built from its spec.
+        '''
+        if number == 0:
+            return agents[index]
+        copies = self.copies.setdefault(index, [])
+        while len(copies) < number:
+            if not isinstance(agents, Roster):
+                raise Exception(f'{agents[index]} has no batch methods, so the agents must be a Roster '
+                                'to build copies of it for the games it plays at once')
+            copies.append(agents.specs[index].create())
+        return copies[number - 1]
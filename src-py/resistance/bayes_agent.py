@@ -1,7 +1,13 @@
-from typing import List, Dict
+from typing import Any, List, Dict, Optional, TYPE_CHECKING
 from agent import Agent
+from opponent_model import OpponentModel
+from betray_table import default_table
 import random
 from heapq import nsmallest
+from math import exp, log
+
+if TYPE_CHECKING:
+    from history import HistoryView
 
 
 class BayesAgent(Agent):
@@ -9,11 +15,24 @@ class BayesAgent(Agent):
     Agent that uses Bayes' Theorem.
     '''
 
-    def __init__(self, name: str = 'Mr. Bayesian') -> None:
+    def __init__(self, name: str = 'Mr. Bayesian', model_path: Optional[str] = None) -> None:
         '''
         Initialises the agent.
+        model_path is an opponent model store to learn from and update between games.
         '''
         self.name = name
+        self.betray_table = default_table()
+        self.model = OpponentModel(model_path) if model_path else None
+        # the game's public history, if the engine shares one
+        self.history: Optional['HistoryView'] = None
+        self.observed = False
+        # the log odds that each other player is a spy, given their votes and the opponent model,
+        # kept apart from the heuristic suspicion scores
+        self.log_odds: Dict[int, float] = {}
+
+    def observe_history(self, history: 'HistoryView') -> None:
+        self.history = history
+        self.observed = True
 
     def new_game(self, number_of_players: int, player_number: int, spy_list: List[int]) -> None:
         '''
@@ -25,6 +44,17 @@ class BayesAgent(Agent):
         self.number_of_players = number_of_players
         self.player_number = player_number
         self.spy_list = spy_list
+        self.rounds_completed = 0
+        self.missions_failed = 0
+        if not self.observed:
+            self.history = None
+        self.observed = False
+        self.log_odds = {}
+        if self.model is not None and self.history is not None and self.history.names:
+            self.model.join(self.history, player_number)
+            if player_number not in spy_list:
+                prior = Agent.spy_count[number_of_players] / (number_of_players - 1)
+                self.log_odds = {p: log(prior / (1 - prior)) for p in range(number_of_players) if p != player_number}
 
         if self.player_number not in self.spy_list:
             self.suspicion = dict()
@@ -54,6 +84,16 @@ class BayesAgent(Agent):
         '''
         return self.player_number in self.spy_list
 
+    def score(self, player: int) -> float:
+        '''
+        returns the suspicion of player: the heuristic score from missions,
+        plus the probability that player is a spy given their votes, if the agent has an opponent model.
+        A probability is on the scale of one mission's evidence in the heuristic score.
+        '''
+        if player not in self.log_odds:
+            return self.suspicion[player]
+        return self.suspicion[player] + 1 / (1 + exp(-self.log_odds[player]))
+
     def propose_mission(self, team_size: int, betrayals_required: int = 1) -> List[int]:
         '''
         expects a team_size list of distinct agents with id between 
@@ -68,7 +108,7 @@ class BayesAgent(Agent):
                     team.append(agent)
             return team
 
-        team = nsmallest(team_size, self.suspicion, key=self.suspicion.get)
+        team = nsmallest(team_size, self.suspicion, key=self.score)
         return team
 
     def vote(self, mission: List[int], proposer: int) -> bool:
@@ -81,13 +121,13 @@ class BayesAgent(Agent):
         total_suspicion = 0
 
         for player in mission:
-            total_suspicion += self.suspicion[player]
+            total_suspicion += self.score(player)
 
-        total_suspicion += self.suspicion[player] / 2
+        total_suspicion += self.score(player) / 2
 
         if not self.is_spy():
             average_sus = total_suspicion / len(mission)
-            total_sus = sum(self.suspicion.values())
+            total_sus = sum(self.score(p) for p in self.suspicion)
             return average_sus < total_sus * 0.5
         else:
             return True
@@ -100,8 +140,19 @@ class BayesAgent(Agent):
         votes is a dictionary mapping player indexes to Booleans (True if they voted for the mission, False otherwise).
         No return value is required or expected.
         '''
-        # nothing to do here
-        pass
+        if self.model is None or not self.log_odds:
+            return
+
+        # Weigh each vote by how much more likely it is from that opponent as a spy than as resistance.
+        for p, name in enumerate(self.history.names):  # type: ignore[union-attr]
+            if p not in self.log_odds:
+                continue
+            spy_yes = self.model.vote_yes_rate(name, True)
+            resistance_yes = self.model.vote_yes_rate(name, False)
+            if p in votes:
+                self.log_odds[p] += log(spy_yes / resistance_yes)
+            else:
+                self.log_odds[p] += log((1 - spy_yes) / (1 - resistance_yes))
 
     def betray(self, mission: List[int], proposer: int) -> bool:
         '''
@@ -109,10 +160,13 @@ class BayesAgent(Agent):
         The agents on the mission are distinct and indexed between 0 and number_of_players, and include this agent.
         proposer is an int between 0 and number_of_players and is the index of the player who proposed the mission.
         The method should return True if this agent chooses to betray the mission, and False otherwise. 
-        By default, spies will betray 30% of the time. 
+        Spies betray with the probability in the precomputed betrayal table for the situation.
         '''
         if self.is_spy():
-            return random.random() < 1
+            return self.betray_table.betray(
+                self.number_of_players, self.rounds_completed, self.missions_failed,
+                len([p for p in mission if p in self.spy_list]),
+                Agent.fails_required[self.number_of_players][self.rounds_completed])
 
         return False
 
@@ -144,8 +198,8 @@ class BayesAgent(Agent):
         rounds_complete, the number of rounds (0-5) that have been completed
         missions_failed, the number of missions (0-3) that have failed.
         '''
-        # nothing to do here
-        pass
+        self.rounds_completed = rounds_complete
+        self.missions_failed = missions_failed
 
     def game_outcome(self, spies_win: bool, spies: List[int]) -> None:
         '''
@@ -153,5 +207,20 @@ class BayesAgent(Agent):
         spies_win, True iff the spies caused 3+ missions to fail
         spies, a list of the player indexes for the spies.
         '''
-        # nothing to do here
-        pass
+        if self.model is not None and self.history is not None and self.history.names:
+            if self.model.record_game(self.history, spies, self.player_number):
+                self.model.autosave()
+
+    @classmethod
+    def cacheable(cls, kwargs: Dict[str, Any]) -> bool:
+        return kwargs.get('model_path') is None
+
+    def learning_state(self) -> Optional[bytes]:
+        '''
+        returns the opponent model, if the agent has one.
+        '''
+        return self.model.to_bytes() if self.model is not None else None
+
+    def restore_learning_state(self, state: Optional[bytes]) -> None:
+        if self.model is not None and state is not None:
+            self.model.restore(state)
@@ -0,0 +1,179 @@
+'''
+Computes the betrayal table used by spies (see betray_table.py) by Monte Carlo control:
+plays games between agents that read the table, where each spy's betray decision
+follows the table or, with probability epsilon, is made at random,
+and sets each situation to the decision after which the spies won more often.
+Situations are only changed when the difference is significant, so rare situations keep their prior.
+
+e.g. from src-py:
+python3 resistance/betray_solver.py --agents bayes --games 200000 --workers 0
+'''
+
+from typing import List, Optional, Sequence, Tuple
+from array import array
+from betray_table import BetrayTable, ENTRIES, SCALE, TABLE_FILE, TABLE_SIZES, index
+from game import FastGame
+from registry import AGENTS, load
+from math import sqrt
+import argparse
+import multiprocessing
+import random
+
+
+class ExploringTable:
+    '''
+    Stands in for the BetrayTable of the agents in a game,
+    recording the situation and decision of every betrayal it is asked about.
+    '''
+
+    def __init__(self, table: BetrayTable, epsilon: float) -> None:
+        self.table = table
+        self.epsilon = epsilon
+        self.decisions: List[Tuple[int, bool]] = []
+
+    def betray(self, number_of_players: int, round: int, missions_failed: int,
+               spies_on_team: int, fails_required: int) -> bool:
+        if random.random() < self.epsilon:
+            betrayed = random.random() < 0.5
+        else:
+            betrayed = self.table.betray(number_of_players, round, missions_failed, spies_on_team, fails_required)
+        self.decisions.append((index(number_of_players, round, missions_failed, spies_on_team, fails_required),
+                               betrayed))
+        return betrayed
+
+
+def play_games(keys: Sequence[str], probabilities: bytes, epsilon: float,
+               games: int, seed: int) -> Tuple[array, array]:
+    '''
+    Plays games at random table sizes between agents of the given registry keys,
+    returning the times each decision was taken in each situation and the spies' wins after it,
+    indexed by 2 * situation + decision.
+    '''
+    random.seed(seed)
+    classes = [load(key) for key in keys]
+    explorer = ExploringTable(BetrayTable(array('B', probabilities)), epsilon)
+    taken = array('I', [0] * 2 * ENTRIES)
+    won = array('I', [0] * 2 * ENTRIES)
+    game = FastGame()
+    for _ in range(games):
+        n = random.choice(TABLE_SIZES)
+        agents = [random.choice(classes)(f'agent{i}') for i in range(n)]
+        for agent in agents:
+            agent.betray_table = explorer
+        game.reset(agents)
+        explorer.decisions.clear()
+        game.play()
+        spies_win = game.missions_lost >= 3
+        for situation, betrayed in explorer.decisions:
+            taken[2 * situation + betrayed] += 1
+            won[2 * situation + betrayed] += spies_win
+    return taken, won
+
+
+def _play_chunk(args: Tuple[Sequence[str], bytes, float, int, int]) -> Tuple[array, array]:
+    return play_games(*args)
+
+
+def prior() -> BetrayTable:
+    '''
+    Returns the table the solver starts from: betray when there are enough spies on the mission to fail it,
+    and never once the game is decided.
+    '''
+    table = BetrayTable()
+    for n in TABLE_SIZES:
+        for round in range(5):
+            for failed in range(round + 1):
+                decided = failed >= 3 or round - failed >= 3
+                for spies in range(1, 5):
+                    for fails in (1, 2):
+                        betray = not decided and spies >= fails
+                        table.probabilities[index(n, round, failed, spies, fails)] = SCALE if betray else 0
+    return table
+
+
+def improve(table: BetrayTable, taken: array, won: array, z: float, min_visits: int) -> int:
+    '''
+    Sets each situation whose decisions have been tried at least min_visits times
+    to the decision with the higher spy win rate, if they differ by more than z standard errors,
+    returning the number of situations changed.
+    '''
+    changed = 0
+    for situation in range(ENTRIES):
+        n0, n1 = taken[2 * situation], taken[2 * situation + 1]
+        if n0 < min_visits or n1 < min_visits:
+            continue
+        p0, p1 = won[2 * situation] / n0, won[2 * situation + 1] / n1
+        error = sqrt(p0 * (1 - p0) / n0 + p1 * (1 - p1) / n1)
+        if abs(p1 - p0) <= z * max(error, 1e-9):
+            continue
+        best = SCALE if p1 > p0 else 0
+        if table.probabilities[situation] != best:
+            table.probabilities[situation] = best
+            changed += 1
+    return changed
+
+
+def solve(keys: Sequence[str], games: int, iterations: int, epsilon: float = 0.2, z: float = 2.0,
+          min_visits: int = 200, workers: Optional[int] = 1, seed: int = 0,
+          table: Optional[BetrayTable] = None) -> BetrayTable:
+    '''
+    Improves table (by default, the prior) for iterations rounds of games games each,
+    played across workers processes.
+    '''
+    table = table if table is not None else prior()
+    chunks = max(workers or multiprocessing.cpu_count(), 1) * 4
+    pool = multiprocessing.Pool(workers) if workers != 1 else None
+    try:
+        for iteration in range(iterations):
+            probabilities = table.probabilities.tobytes()
+            jobs = [(keys, probabilities, epsilon, games // chunks + (i < games % chunks),
+                     seed + iteration * chunks + i) for i in range(chunks)]
+            results = pool.map(_play_chunk, jobs) if pool is not None else map(_play_chunk, jobs)
+            taken = array('I', [0] * 2 * ENTRIES)
+            won = array('I', [0] * 2 * ENTRIES)
+            for chunk_taken, chunk_won in results:
+                for i in range(2 * ENTRIES):
+                    taken[i] += chunk_taken[i]
+                    won[i] += chunk_won[i]
+            if not any(taken):
+                raise Exception('No betrayal decisions were recorded, as the agents do not read a betrayal table')
+            changed = improve(table, taken, won, z, min_visits)
+            print(f'iteration {iteration + 1}: {sum(taken)} decisions, {changed} situations changed', flush=True)
+            if changed == 0:
+                break
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return table
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog='betray_solver',
+        description='Computes the betrayal table used by spies.')
+    parser.add_argument('-a', '--agents', nargs='+', default=['bayes'], metavar='KEY',
+                        help='agents to play the games, chosen at random for each seat (default: bayes)')
+    parser.add_argument('-g', '--games', type=int, default=100000, help='games per iteration (default: 100000)')
+    parser.add_argument('-i', '--iterations', type=int, default=5, help='most iterations (default: 5)')
+    parser.add_argument('-e', '--epsilon', type=float, default=0.2,
+                        help='probability of a random decision (default: 0.2)')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='worker processes, 0 for one per CPU (default: 1)')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed for the games (default: 0)')
+    parser.add_argument('-o', '--output', default=TABLE_FILE, help='file to write the table to (default: the shipped table)')
+    args = parser.parse_args(argv)
+    for key in args.agents:
+        if key not in AGENTS:
+            parser.error(f'Unknown agent {key}, expected one of {", ".join(AGENTS)}')
+        # The solver explores through the table an agent's spies betray by, which only some agents have.
+        if not hasattr(load(key)(key), 'betray_table'):
+            parser.error(f'{key} agents do not betray by a betrayal table, so their decisions cannot be explored')
+
+    table = solve(args.agents, args.games, args.iterations, args.epsilon, workers=args.workers or None, seed=args.seed)
+    table.save(args.output)
+    print(f'Wrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
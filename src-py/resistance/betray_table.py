@@ -0,0 +1,87 @@
+from typing import Optional
+from array import array
+import os
+import random
+import struct
+
+
+# Dimensions of the table, in the order of its index.
+TABLE_SIZES = range(5, 11)
+ROUNDS = 5
+# missions failed before the mission, 0-4 (the game plays all five rounds)
+MISSIONS_FAILED = 5
+# spies on the mission, including the betrayer, 1-4
+SPIES_ON_TEAM = 4
+# betrayals required to fail the mission, 1-2
+FAILS_REQUIRED = 2
+ENTRIES = len(TABLE_SIZES) * ROUNDS * MISSIONS_FAILED * SPIES_ON_TEAM * FAILS_REQUIRED
+
+MAGIC = b'RBT1'
+HEADER = struct.Struct('<4sI')
+# probabilities are stored as bytes, 0 (never betray) to SCALE (always betray)
+SCALE = 255
+
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'betray_table.bin')
+# data files the agents using this module depend on, for result fingerprints
+DATA_FILES = ('betray_table.bin',)
+
+
+def index(number_of_players: int, round: int, missions_failed: int, spies_on_team: int, fails_required: int) -> int:
+    return ((((number_of_players - 5) * ROUNDS + round) * MISSIONS_FAILED + missions_failed)
+            * SPIES_ON_TEAM + spies_on_team - 1) * FAILS_REQUIRED + fails_required - 1
+
+
+class BetrayTable:
+    '''
+    The probability that a spy betrays a mission, in each situation a spy can be in when asked to betray:
+    the number of players, the round, the missions already failed,
+    the spies on the mission and the betrayals required to fail it.
+    The table is computed offline by betray_solver.py and stored as a byte per situation.
+    '''
+
+    def __init__(self, probabilities: Optional[array] = None) -> None:
+        '''
+        probabilities is the table's bytes, in index order (by default, always betray).
+        '''
+        self.probabilities = probabilities if probabilities is not None else array('B', [SCALE] * ENTRIES)
+
+    @classmethod
+    def load(cls, path: str = TABLE_FILE) -> 'BetrayTable':
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, entries = HEADER.unpack_from(data)
+        if magic != MAGIC or entries != ENTRIES or len(data) != HEADER.size + ENTRIES:
+            raise Exception(f'{path} is not a betrayal table')
+        return cls(array('B', data[HEADER.size:]))
+
+    def save(self, path: str = TABLE_FILE) -> None:
+        with open(path + '.tmp', 'wb') as f:
+            f.write(HEADER.pack(MAGIC, ENTRIES) + self.probabilities.tobytes())
+        os.replace(path + '.tmp', path)
+
+    def probability(self, number_of_players: int, round: int, missions_failed: int,
+                    spies_on_team: int, fails_required: int) -> float:
+        return self.probabilities[index(number_of_players, round, missions_failed,
+                                        spies_on_team, fails_required)] / SCALE
+
+    def betray(self, number_of_players: int, round: int, missions_failed: int,
+               spies_on_team: int, fails_required: int) -> bool:
+        '''
+        Returns True if the spy should betray the mission, drawn with the table's probability.
+        '''
+        p = self.probabilities[index(number_of_players, round, missions_failed, spies_on_team, fails_required)]
+        return p == SCALE or (p > 0 and random.random() * SCALE < p)
+
+
+_default: Optional[BetrayTable] = None
+
+
+def default_table() -> BetrayTable:
+    '''
+    Returns the table shipped with the package, loaded once per process
+    (or a table that always betrays, if it is missing).
+    '''
+    global _default
+    if _default is None:
+        _default = BetrayTable.load() if os.path.exists(TABLE_FILE) else BetrayTable()
+    return _default
@@ -0,0 +1,75 @@
+from typing import Dict, List, Tuple
+from array import array
+from itertools import combinations
+from agent import Agent
+from history import MEMBERS
+
+
+class CombinationTable:
+    '''
+    All the k player subsets of n players, in lexicographic order.
+    Subsets are bitmasks, with O(1) rank (mask to index) and unrank (index to mask).
+    '''
+
+    def __init__(self, n: int, k: int) -> None:
+        self.n = n
+        self.k = k
+        # members[r] is the tuple of players in the subset of rank r
+        self.members: List[Tuple[int, ...]] = [*combinations(range(n), k)]
+        self.masks = array('H', [sum(1 << p for p in c) for c in self.members])
+        self.ranks = array('h', [-1] * (1 << n))
+        for r, mask in enumerate(self.masks):
+            self.ranks[mask] = r
+        # membership[p][r] is 1 iff player p is in the subset of rank r
+        self.membership = [array('B', [mask >> p & 1 for mask in self.masks]) for p in range(n)]
+
+    def __len__(self) -> int:
+        return len(self.masks)
+
+    def rank(self, mask: int) -> int:
+        '''
+        Returns the index of the subset mask, or -1 if it does not have k members.
+        '''
+        return self.ranks[mask]
+
+    def unrank(self, r: int) -> int:
+        '''
+        Returns the bitmask of the subset with index r.
+        '''
+        return self.masks[r]
+
+
+# SPY_SETS[n] is the table of every possible set of spies in a game of n.
+SPY_SETS: Dict[int, CombinationTable] = {n: CombinationTable(n, k) for n, k in Agent.spy_count.items()}
+
+# TEAMS[n][size] is the table of every possible team of size in a game of n.
+TEAMS: Dict[int, Dict[int, CombinationTable]] = {
+    n: {size: CombinationTable(n, size) for size in set(sizes)} for n, sizes in Agent.mission_sizes.items()
+}
+
+_intersections: Dict[Tuple[int, int], bytes] = {}
+
+
+def intersections(n: int, size: int) -> bytes:
+    '''
+    Returns the number of spies on each team in a game of n,
+    as a row-major table indexed [team_rank * len(SPY_SETS[n]) + spy_rank].
+    Each table is built the first time it is asked for.
+    '''
+    key = (n, size)
+    if key not in _intersections:
+        spy_masks = SPY_SETS[n].masks
+        _intersections[key] = bytes(bin(team & spies).count('1')
+                                    for team in TEAMS[n][size].masks for spies in spy_masks)
+    return _intersections[key]
+
+
+def spies_on_team(n: int, team: int) -> memoryview:
+    '''
+    Returns the number of spies on the team bitmask team for every spy set in a game of n,
+    indexed by spy set rank.
+    '''
+    table = TEAMS[n][len(MEMBERS[team])]
+    width = len(SPY_SETS[n])
+    start = table.rank(team) * width
+    return memoryview(intersections(n, table.k))[start:start + width]
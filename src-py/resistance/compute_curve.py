@@ -0,0 +1,154 @@
+'''
+Measures what extra compute buys an agent.
+Sweeps the agent's constructor arguments over a grid and, at each point,
+plays the same seeded games against the same opponents,
+reporting win rate (with a 95% confidence interval) against mean CPU seconds per decision.
+
+e.g. from src-py:
+python3 resistance/compute_curve.py --agent monte --grid iterations=5,10,20,40 --opponents random:6 --games 200 --csv curve.csv
+'''
+
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from registry import AGENTS, AgentSpec, Roster, parse_roster
+from tournament import Tournament, Scheduler, SerialExecutor, ParallelExecutor, Executor, GameResult
+from itertools import product
+from math import sqrt
+import argparse
+import ast
+import csv
+
+
+class CurvePoint(NamedTuple):
+    '''
+    The strength of the agent at one point of the grid.
+    '''
+    config: Dict[str, Any]
+    games: int
+    wins: int
+    low: float
+    high: float
+    cpu_per_decision: float
+
+    def win_rate(self) -> float:
+        return self.wins / self.games if self.games else 0.0
+
+
+def wilson_interval(wins: int, games: int, z: float = 1.96) -> Tuple[float, float]:
+    '''
+    Returns the Wilson score interval for a win rate of wins out of games.
+    '''
+    if games == 0:
+        return 0.0, 1.0
+    rate = wins / games
+    centre = (rate + z * z / (2 * games)) / (1 + z * z / games)
+    spread = z * sqrt(rate * (1 - rate) / games + z * z / (4 * games * games)) / (1 + z * z / games)
+    return centre - spread, centre + spread
+
+
+def grid_points(grid: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    '''
+    Returns every combination of the values in grid, as constructor keyword arguments.
+    '''
+    keys = [*grid]
+    return [dict(zip(keys, values)) for values in product(*(grid[key] for key in keys))]
+
+
+def measure(key: str, config: Dict[str, Any], opponents: Iterable[AgentSpec], games: int,
+            seed: int, executor: Executor) -> CurvePoint:
+    '''
+    Plays games seeded by seed between the agent key (built with config) and opponents,
+    all at one table, and returns the agent's win rate and CPU time per decision.
+    The agent is always the first agent in the pool.
+    '''
+    roster = Roster([AgentSpec(key, 'subject', config), *opponents])
+    scheduler = Scheduler(len(roster), [len(roster)], seed)
+    wins = 0
+    seconds = 0.0
+    decisions = 0
+
+    def record(result: GameResult) -> None:
+        nonlocal wins, seconds, decisions
+        seat = result.spec.seating.index(0)
+        wins += (seat in result.spec.spies) == result.spies_win
+        if result.timings is not None:
+            seconds += result.timings[seat][0]
+            decisions += result.timings[seat][1]
+
+    Tournament(roster, scheduler, executor).run(games, record)
+    low, high = wilson_interval(wins, games)
+    return CurvePoint(config, games, wins, low, high, seconds / decisions if decisions else 0.0)
+
+
+def sweep(key: str, grid: Dict[str, Sequence[Any]], opponents: Sequence[AgentSpec], games: int,
+          seed: int = 0, workers: int = 1) -> List[CurvePoint]:
+    '''
+    Measures the agent key at every point of grid.
+    '''
+    executor: Executor = SerialExecutor(timed=True) if workers == 1 else ParallelExecutor(workers or None, timed=True)
+    return [measure(key, config, opponents, games, seed, executor) for config in grid_points(grid)]
+
+
+def cheapest(points: Iterable[CurvePoint], target: float) -> Optional[CurvePoint]:
+    '''
+    Returns the point with the least CPU per decision whose win rate's lower bound meets target.
+    '''
+    good = [p for p in points if p.low >= target]
+    return min(good, key=lambda p: p.cpu_per_decision) if good else None
+
+
+def write_csv(points: Iterable[CurvePoint], path: str) -> None:
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['config', 'games', 'wins', 'win_rate', 'low', 'high', 'cpu_per_decision'])
+        for p in points:
+            writer.writerow([repr(p.config), p.games, p.wins, p.win_rate(), p.low, p.high, p.cpu_per_decision])
+
+
+def parse_grid(entries: Iterable[str]) -> Dict[str, List[Any]]:
+    '''
+    Parses entries of the form NAME=VALUE,VALUE,... with Python literal values.
+    '''
+    grid: Dict[str, List[Any]] = {}
+    for entry in entries:
+        name, _, values = entry.partition('=')
+        grid[name] = [ast.literal_eval(value) for value in values.split(',')]
+    return grid
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog='compute_curve',
+        description='Sweeps an agent\'s compute budget and reports win rate against CPU seconds per decision.')
+    parser.add_argument('-a', '--agent', default='monte', help='agent to measure, from: ' + ', '.join(AGENTS))
+    parser.add_argument('-g', '--grid', nargs='+', default=['iterations=5,10,20'], metavar='NAME=V1,V2,...',
+                        help='constructor arguments to sweep (default: iterations=5,10,20)')
+    parser.add_argument('-o', '--opponents', nargs='+', default=['random:6'], metavar='KEY[:COUNT]',
+                        help='opponent pool, which with the agent makes up each table (default: random:6)')
+    parser.add_argument('-t', '--games', type=int, default=100, help='games per grid point (default: 100)')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed for the games (default: 0)')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='worker processes, 0 for one per CPU')
+    parser.add_argument('--target', type=float, help='report the cheapest point whose win rate is surely above this')
+    parser.add_argument('--csv', help='file to export the curve to')
+    args = parser.parse_args(argv)
+
+    try:
+        opponents = parse_roster(args.opponents).specs
+        grid = parse_grid(args.grid)
+        if not 4 <= len(opponents) <= 9:
+            raise Exception('The agent and its opponents must make a table of 5-10 players')
+    except Exception as e:
+        parser.error(str(e))
+
+    points = sweep(args.agent, grid, opponents, args.games, args.seed, args.workers)
+    for p in points:
+        print(f'{p.config}: {p.win_rate() * 100:.1f}% [{p.low * 100:.1f}%, {p.high * 100:.1f}%]'
+              f' at {p.cpu_per_decision * 1000:.3f} ms per decision')
+    if args.target is not None:
+        best = cheapest(points, args.target)
+        print(f'Cheapest setting meeting {args.target * 100:.1f}%: {best.config if best else None}')
+    if args.csv:
+        write_csv(points, args.csv)
+
+
+if __name__ == '__main__':
+    main()
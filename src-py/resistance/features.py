@@ -0,0 +1,130 @@
+from typing import Iterable, Optional
+from agent import Agent
+from history import GameState, HistoryView
+
+
+# Layout of a feature vector: one unsigned byte per feature, at these offsets.
+# Public state: one-hot table size (5-10), round (0-5), missions lost (0-3+), rejections (0-4) and leader.
+NUM_PLAYERS = 0
+ROUND = NUM_PLAYERS + 6
+MISSIONS_LOST = ROUND + 6
+REJECTIONS = MISSIONS_LOST + 4
+LEADER = REJECTIONS + 5
+# For each round: whether it is complete, whether it failed, the team and voters of its approved mission
+# (bit per player) and the betrayals on it.
+ROUNDS = LEADER + 10
+COMPLETE = 0
+FAILED = 1
+TEAM = 2
+VOTES = TEAM + 10
+BETRAYALS = VOTES + 10
+ROUND_FEATURES = BETRAYALS + 1
+# Per player counts of approved missions, failed missions, approving votes and proposals made.
+MISSIONS_BY_PLAYER = ROUNDS + 5 * ROUND_FEATURES
+FAILED_MISSIONS_BY_PLAYER = MISSIONS_BY_PLAYER + 10
+APPROVALS_BY_VOTER = FAILED_MISSIONS_BY_PLAYER + 10
+PROPOSALS_BY_LEADER = APPROVALS_BY_VOTER + 10
+# The proposal being decided on (voted on, or on a mission), if any: its team (bit per player) and one-hot proposer.
+# A proposal's rejections so far are REJECTIONS.
+PROPOSED_TEAM = PROPOSALS_BY_LEADER + 10
+PROPOSER = PROPOSED_TEAM + 10
+PUBLIC_FEATURES = PROPOSER + 10
+# Private knowledge of the acting seat: one-hot seat, whether it is a spy, and the spies it knows (bit per player).
+SEAT = PUBLIC_FEATURES
+SPY = SEAT + 10
+KNOWN_SPIES = SPY + 1
+FEATURES = KNOWN_SPIES + 10
+
+
+def failed_rounds(history: HistoryView) -> int:
+    '''
+    Returns the bitmask of the rounds complete in history that failed,
+    either on a mission or by five rejected proposals.
+    '''
+    n = history.num_players
+    failed = (1 << history.snapshot().round) - 1
+    for i in range(len(history)):
+        betrayals = history.betrayals[i]
+        if 0 <= betrayals < Agent.fails_required[n][history.round[i]]:
+            failed &= ~(1 << history.round[i])
+    return failed
+
+
+def encode_public(history: HistoryView, state: Optional[GameState] = None, failed: Optional[int] = None) -> bytearray:
+    '''
+    Returns a feature vector with the public features of the game in history filled in
+    (state is the current state of the game, by default the history's snapshot)
+    and the private features left zero.
+    When state is past the end of history (e.g. a search leaf), failed is the bitmask of its complete rounds
+    that failed, as history only tells the outcomes of its own rounds.
+    '''
+    if state is None:
+        state = history.snapshot()
+    n = state.num_players
+    features = bytearray(FEATURES)
+    features[NUM_PLAYERS + n - 5] = 1
+    features[ROUND + min(state.round, 5)] = 1
+    features[MISSIONS_LOST + min(state.missions_lost, 3)] = 1
+    features[REJECTIONS + state.rejections] = 1
+    features[LEADER + state.leader] = 1
+
+    for r in range(min(state.round, 5)):
+        # complete, and failed unless an approved mission succeeds below
+        features[ROUNDS + r * ROUND_FEATURES + COMPLETE] = 1
+        features[ROUNDS + r * ROUND_FEATURES + FAILED] = 1
+    for i in range(len(history)):
+        betrayals = history.betrayals[i]
+        if betrayals < 0:
+            continue
+        r = history.round[i]
+        offset = ROUNDS + r * ROUND_FEATURES
+        team, votes = history.team[i], history.votes[i]
+        for p in range(n):
+            features[offset + TEAM + p] = team >> p & 1
+            features[offset + VOTES + p] = votes >> p & 1
+        features[offset + BETRAYALS] = betrayals
+        features[offset + FAILED] = betrayals >= Agent.fails_required[n][r]
+    if failed is not None:
+        for r in range(min(state.round, 5)):
+            features[ROUNDS + r * ROUND_FEATURES + FAILED] = failed >> r & 1
+
+    features[MISSIONS_BY_PLAYER:MISSIONS_BY_PLAYER + 10] = history.missions_by_player
+    features[FAILED_MISSIONS_BY_PLAYER:FAILED_MISSIONS_BY_PLAYER + 10] = history.failed_missions_by_player
+    features[APPROVALS_BY_VOTER:APPROVALS_BY_VOTER + 10] = history.approvals_by_voter
+    features[PROPOSALS_BY_LEADER:PROPOSALS_BY_LEADER + 10] = history.proposals_by_leader
+    return features
+
+
+def set_proposal(features: bytearray, team: Iterable[int], proposer: int) -> None:
+    '''
+    Fills in the proposal being decided on: the players on its team and its proposer.
+    '''
+    features[PROPOSED_TEAM:PUBLIC_FEATURES] = bytes(PUBLIC_FEATURES - PROPOSED_TEAM)
+    for p in team:
+        features[PROPOSED_TEAM + p] = 1
+    features[PROPOSER + proposer] = 1
+
+
+def set_private(features: bytearray, seat: int, spies: int) -> None:
+    '''
+    Fills in the private features of the seat, given the bitmask of the spies it knows (0 if it is resistance).
+    '''
+    features[SEAT:FEATURES] = bytes(FEATURES - SEAT)
+    features[SEAT + seat] = 1
+    features[SPY] = spies >> seat & 1
+    for p in range(10):
+        features[KNOWN_SPIES + p] = spies >> p & 1
+
+
+def encode(history: HistoryView, seat: int, spies: int, state: Optional[GameState] = None,
+           team: Optional[Iterable[int]] = None, proposer: int = 0) -> bytearray:
+    '''
+    Returns the feature vector of the game in history as seen from seat,
+    which knows the spies in the bitmask spies (0 if it is resistance),
+    deciding on the proposal of team by proposer, if team is given.
+    '''
+    features = encode_public(history, state)
+    if team is not None:
+        set_proposal(features, team, proposer)
+    set_private(features, seat, spies)
+    return features
@@ -1,7 +1,8 @@
 # type: ignore
 
 from agent import Agent
-from random_agent import RandomAgent
+from history import GameHistory, MAX_PROPOSALS, MEMBERS, bitmask
+from array import array
 import random
 
 
@@ -13,10 +14,12 @@ class Game:
     to share information and get game actions
     '''
 
-    def __init__(self, agents):
+    def __init__(self, agents, spies=None, shuffle=True):
         '''
         agents is the list of agents playing the game
         the list must contain 5-10 agents
+        spies optionally forces the list of spy indexes (used by tournament schedulers)
+        shuffle is False if agents are already in their seating order
         This method initiaises the game by
         - shuffling the agents
         - randomly assigning spies
@@ -27,36 +30,55 @@ class Game:
             raise Exception('Agent array out of range')
         # clone and shuffle agent array
         self.agents = agents.copy()
-        random.shuffle(self.agents)
+        if shuffle:
+            random.shuffle(self.agents)
         self.num_players = len(agents)
         # allocate spies
-        self.spies = []
+        if spies is not None:
+            if len(set(spies)) != Agent.spy_count[self.num_players] \
+                    or any(s < 0 or s >= self.num_players for s in spies):
+                raise Exception('Spy list invalid for game size')
+            self.spies = list(spies)
+        else:
+            self.spies = []
         while len(self.spies) < Agent.spy_count[self.num_players]:
             spy = random.randrange(self.num_players)
             if spy not in self.spies:
                 self.spies.append(spy)
+        # public history shared (read-only) with every agent
+        self.history = GameHistory(
+            self.num_players, [a.name for a in self.agents])
+        view = self.history.view()
         # start game for each agent
         for agent_id in range(self.num_players):
+            self.agents[agent_id].observe_history(view)
             spy_list = self.spies.copy() if agent_id in self.spies else []
             self.agents[agent_id].new_game(
                 self.num_players, agent_id, spy_list)
         # initialise rounds
         self.missions_lost = 0
+        self.leader_id = 0
         self.rounds = []
 
     def play(self):
-        leader_id = 0
         for i in range(5):
-            self.rounds.append(Round(leader_id, self.agents, self.spies, i))
+            self.rounds.append(
+                Round(self.leader_id, self.agents, self.spies, i, self.history))
             if not self.rounds[i].play():
                 self.missions_lost += 1
+            self.leader_id = self.rounds[i].leader_id
             for a in self.agents:
                 a.round_outcome(i+1, self.missions_lost)
-            leader_id = (
-                leader_id+len(self.rounds[i].missions)) % len(self.agents)
         for a in self.agents:
             a.game_outcome(self.missions_lost >= 3, self.spies)
 
+    def snapshot(self):
+        '''
+        returns a GameState capturing the current public state of the game from its history,
+        which may be taken at any point, including from within an agent's callback.
+        '''
+        return self.history.snapshot()
+
     def __str__(self):
         s = 'Game between agents:' + str(self.agents)
         for r in self.rounds:
@@ -74,17 +96,19 @@ class Round():
     a representation of a round in the game.
     '''
 
-    def __init__(self, leader_id, agents, spies, rnd):
+    def __init__(self, leader_id, agents, spies, rnd, history=None):
         '''
         leader_id is the current leader (next to propose a mission)
         agents is the list of agents in the game,
         spies is the list of indexes of spies in the game
         rnd is what round the game is up to 
+        history is the GameHistory to record missions in, if any
         '''
         self.leader_id = leader_id
         self.agents = agents
         self.spies = spies
         self.rnd = rnd
+        self.history = history
         self.missions = []
 
     def __str__(self):
@@ -122,11 +146,11 @@ class Round():
             team = self.agents[self.leader_id].propose_mission(
                 mission_size, fails_required)
             mission = Mission(self.leader_id, team,
-                              self.agents, self.spies, self.rnd)
+                              self.agents, self.spies, self.rnd, self.history)
             self.missions.append(mission)
             self.leader_id = (self.leader_id+1) % len(self.agents)
             if mission.is_approved():
-                return mission.is_successful()
+                break
         return mission.is_successful()
 
     def is_successful(self):
@@ -141,19 +165,21 @@ class Mission():
     a representation of a proposed mission
     '''
 
-    def __init__(self, leader_id, team, agents, spies, rnd):
+    def __init__(self, leader_id, team, agents, spies, rnd, history=None):
         '''
         leader_id is the id of the agent who proposed the mission
         team is the list of agent indexes on the mission
         agents is the list of agents in the game,
         spies is the list of indexes of spies in the game
         rnd is the round number of the game
+        history is the GameHistory to record the mission in, if any
         '''
         self.leader_id = leader_id
         self.team = team
         self.agents = agents
         self.spies = spies
         self.rnd = rnd
+        self.history = history
         self.run()
 
     def run(self):
@@ -164,6 +190,8 @@ class Mission():
         '''
         self.votes_for = [i for i in range(
             len(self.agents)) if self.agents[i].vote(self.team, self.leader_id)]
+        if self.history is not None:
+            self.history.propose(self.leader_id, self.team, self.votes_for)
         for a in self.agents:
             a.vote_outcome(self.team, self.leader_id, self.votes_for)
         if 2*len(self.votes_for) > len(self.agents):
@@ -171,6 +199,8 @@ class Mission():
                 self.team, self.leader_id)]
             success = len(self.fails) < Agent.fails_required[len(
                 self.agents)][self.rnd]
+            if self.history is not None:
+                self.history.mission(len(self.fails))
             for a in self.agents:
                 a.mission_outcome(self.team, self.leader_id,
                                   len(self.fails), success)
@@ -220,3 +250,151 @@ class Mission():
         raises an exception if the mission is not approved or fails not recorded.
         '''
         return self.is_approved() and len(self.fails) < Agent.fails_required[len(self.agents)][self.rnd]
+
+
+# whether each agent class overrides each outcome method, by class and method name
+_overrides = {}
+
+
+def listeners(agents, method):
+    '''
+    returns the bound method of each agent in agents that overrides Agent's (empty) method.
+    Agents whose class does not define the method (such as wrappers that delegate attributes) are always called.
+    '''
+    found = []
+    for a in agents:
+        key = (type(a), method)
+        if key not in _overrides:
+            _overrides[key] = getattr(type(a), method, None) is not getattr(Agent, method)
+        if _overrides[key]:
+            found.append(getattr(a, method))
+    return found
+
+
+class FastGame:
+    '''
+    A lean, resettable game of The Resistance for tournaments,
+    which plays game after game on the same preallocated state.
+    Events are recorded only in the game's GameHistory (and which spies betrayed each mission),
+    without a Round and Mission object per proposal;
+    the rounds property builds them when asked, e.g. to print the game.
+    Agents are called in the same order as by Game, so given the same spies, games play out the same,
+    except that outcome methods an agent does not override (which do nothing) are not called,
+    and the rich view lists teams in seat order.
+    '''
+
+    def __init__(self):
+        self.history = GameHistory(5)
+        self.view = self.history.view()
+        # the bitmask of the spies who betrayed each proposal's mission
+        self.betrayers = array('H', bytes(2 * MAX_PROPOSALS))
+        self.agents = []
+        self.num_players = 0
+
+    def reset(self, agents, spies=None, shuffle=True):
+        '''
+        starts a new game between agents, as Game does,
+        except that spies are sampled directly.
+        '''
+        n = len(agents)
+        if n < 5 or n > 10:
+            raise Exception('Agent array out of range')
+        # clone and shuffle agent array
+        agents = agents.copy()
+        if shuffle:
+            random.shuffle(agents)
+        self.agents = agents
+        self.num_players = n
+        if spies is not None:
+            if len(set(spies)) != Agent.spy_count[n] or any(s < 0 or s >= n for s in spies):
+                raise Exception('Spy list invalid for game size')
+            self.spies = list(spies)
+        else:
+            self.spies = random.sample(range(n), Agent.spy_count[n])
+        self.spy_mask = bitmask(self.spies)
+        self.history.reset(n, [a.name for a in agents])
+        for agent_id in range(n):
+            agents[agent_id].observe_history(self.view)
+            agents[agent_id].new_game(n, agent_id, self.spies.copy() if self.spy_mask >> agent_id & 1 else [])
+        self.missions_lost = 0
+        self.leader_id = 0
+        # bit i is set if round i failed
+        self.failed_rounds = 0
+        # the agents' bound methods, leaving out outcome methods that are not overridden
+        self.votes = [a.vote for a in agents]
+        self.vote_outcomes = listeners(agents, 'vote_outcome')
+        self.mission_outcomes = listeners(agents, 'mission_outcome')
+        self.round_outcomes = listeners(agents, 'round_outcome')
+        self.game_outcomes = listeners(agents, 'game_outcome')
+
+    def play(self):
+        agents = self.agents
+        n = self.num_players
+        history = self.history
+        spy_mask = self.spy_mask
+        for rnd in range(5):
+            mission_size = Agent.mission_sizes[n][rnd]
+            fails_required = Agent.fails_required[n][rnd]
+            success = False
+            for _ in range(5):
+                leader = self.leader_id
+                team = agents[leader].propose_mission(mission_size, fails_required)
+                votes_for = [i for i, vote in enumerate(self.votes) if vote(team, leader)]
+                i = history.propose(leader, team, votes_for)
+                self.betrayers[i] = 0
+                for vote_outcome in self.vote_outcomes:
+                    vote_outcome(team, leader, votes_for)
+                self.leader_id = (leader + 1) % n
+                if 2 * len(votes_for) > n:
+                    betrayers = 0
+                    for p in team:
+                        if spy_mask >> p & 1 and agents[p].betray(team, leader):
+                            betrayers |= 1 << p
+                    self.betrayers[i] = betrayers
+                    fails = len(MEMBERS[betrayers])
+                    success = fails < fails_required
+                    history.mission(fails)
+                    for mission_outcome in self.mission_outcomes:
+                        mission_outcome(team, leader, fails, success)
+                    break
+            if not success:
+                self.missions_lost += 1
+                self.failed_rounds |= 1 << rnd
+            for round_outcome in self.round_outcomes:
+                round_outcome(rnd + 1, self.missions_lost)
+        for game_outcome in self.game_outcomes:
+            game_outcome(self.missions_lost >= 3, self.spies)
+
+    def snapshot(self):
+        '''
+        returns a GameState capturing the current public state of the game.
+        '''
+        return self.history.snapshot()
+
+    @property
+    def rounds(self):
+        '''
+        builds the Rounds (and their Missions) played so far from the history.
+        '''
+        history = self.history
+        rounds = []
+        for i in range(history.count):
+            rnd = history.round[i]
+            if rnd == len(rounds):
+                rounds.append(Round(history.leader[i], self.agents, self.spies, rnd, None))
+            mission = Mission.__new__(Mission)
+            mission.leader_id = history.leader[i]
+            mission.team = [*MEMBERS[history.team[i]]]
+            mission.agents = self.agents
+            mission.spies = self.spies
+            mission.rnd = rnd
+            mission.history = None
+            mission.votes_for = [*MEMBERS[history.votes[i]]]
+            if history.betrayals[i] >= 0:
+                mission.fails = [*MEMBERS[self.betrayers[i]]]
+            rounds[-1].missions.append(mission)
+            rounds[-1].leader_id = (history.leader[i] + 1) % self.num_players
+        return rounds
+
+    def __str__(self):
+        return Game.__str__(self)
@@ -0,0 +1,197 @@
+from typing import Iterable, List, NamedTuple, Sequence, Tuple
+from array import array
+from agent import Agent
+
+
+# Most proposals a game can have: five rounds of five proposals.
+MAX_PROPOSALS = 25
+
+# MEMBERS[mask] is the sorted tuple of players in the bitmask mask.
+MEMBERS: List[Tuple[int, ...]] = [tuple(p for p in range(10) if mask >> p & 1) for mask in range(1 << 10)]
+
+
+_ZEROS = array('B', bytes(10))
+
+
+def bitmask(players: Iterable[int]) -> int:
+    '''
+    Returns the bitmask with a bit set for each player index in players.
+    '''
+    mask = 0
+    for p in players:
+        mask |= 1 << p
+    return mask
+
+
+class GameState(NamedTuple):
+    '''
+    An immutable snapshot of the public state of a game in progress.
+    num_players is the number of players in the game,
+    round is the index (0-4) of the current round,
+    missions_lost is the number of missions (0-3) that have failed,
+    leader is the index of the player who is to propose (or is proposing) the next mission,
+    and rejections is the number of proposals already rejected in the current round.
+    '''
+    num_players: int
+    round: int
+    missions_lost: int
+    leader: int
+    rejections: int
+
+
+class GameHistory:
+    '''
+    The public history of a game, kept by the game engine in preallocated arrays.
+    Proposal i has a team bitmask team[i], a bitmask of the players who voted for it votes[i],
+    its leader leader[i], its round round[i],
+    and the number of betrayals on the mission betrayals[i] (-1 if the proposal was rejected).
+    Per player indexes are updated as each event is recorded, so agents never need to scan the history.
+    names are the names of the agents in each seat, as seating is public.
+    games counts the games the history has been reset for, so a game can be told from the next one on the same history.
+    '''
+
+    def __init__(self, num_players: int, names: Sequence[str] = ()) -> None:
+        self.team = array('H', bytes(2 * MAX_PROPOSALS))
+        self.votes = array('H', bytes(2 * MAX_PROPOSALS))
+        self.leader = array('b', bytes(MAX_PROPOSALS))
+        self.round = array('b', bytes(MAX_PROPOSALS))
+        self.betrayals = array('b', bytes(MAX_PROPOSALS))
+        # number of approved missions each player was on
+        self.missions_by_player = array('B', bytes(10))
+        # number of failed missions each player was on
+        self.failed_missions_by_player = array('B', bytes(10))
+        # number of proposals each player voted for
+        self.approvals_by_voter = array('B', bytes(10))
+        # number of proposals each player made
+        self.proposals_by_leader = array('B', bytes(10))
+        self.games = 0
+        self.reset(num_players, names)
+
+    def reset(self, num_players: int, names: Sequence[str] = ()) -> None:
+        '''
+        Clears the history for a new game of num_players, reusing the arrays.
+        '''
+        if num_players not in Agent.spy_count:
+            raise Exception('Number of players out of range')
+        self.num_players = num_players
+        self.names = tuple(names)
+        self.games += 1
+        self.count = 0
+        self.current_round = 0
+        self.missions_lost = 0
+        self.next_leader = 0
+        self.rejections = 0
+        self.missions_by_player[:] = _ZEROS
+        self.failed_missions_by_player[:] = _ZEROS
+        self.approvals_by_voter[:] = _ZEROS
+        self.proposals_by_leader[:] = _ZEROS
+
+    def propose(self, leader: int, team: Iterable[int], votes_for: Iterable[int]) -> int:
+        '''
+        Records a proposal for the current round and the players who voted for it.
+        Returns the index of the proposal.
+        If the proposal was approved, its mission must be recorded with mission() before the next proposal.
+        '''
+        i = self.count
+        team_mask = bitmask(team)
+        votes_mask = bitmask(votes_for)
+        self.team[i] = team_mask
+        self.votes[i] = votes_mask
+        self.leader[i] = leader
+        self.round[i] = self.current_round
+        self.betrayals[i] = -1
+        self.count = i + 1
+
+        self.proposals_by_leader[leader] += 1
+        voters = MEMBERS[votes_mask]
+        approvals = self.approvals_by_voter
+        for p in voters:
+            approvals[p] += 1
+        self.next_leader = (leader + 1) % self.num_players
+
+        if 2 * len(voters) > self.num_players:
+            missions = self.missions_by_player
+            for p in MEMBERS[team_mask]:
+                missions[p] += 1
+        else:
+            self.rejections += 1
+            if self.rejections == 5:
+                self.end_round(False)
+        return i
+
+    def mission(self, betrayals: int) -> None:
+        '''
+        Records the number of betrayals on the mission of the last (approved) proposal.
+        '''
+        i = self.count - 1
+        self.betrayals[i] = betrayals
+        success = betrayals < Agent.fails_required[self.num_players][self.current_round]
+        if not success:
+            for p in MEMBERS[self.team[i]]:
+                self.failed_missions_by_player[p] += 1
+        self.end_round(success)
+
+    def end_round(self, success: bool) -> None:
+        if not success:
+            self.missions_lost += 1
+        self.current_round += 1
+        self.rejections = 0
+
+    def snapshot(self) -> GameState:
+        '''
+        Returns the current public state of the game.
+        While a proposal is being voted on, leader is its proposer.
+        '''
+        return GameState(self.num_players, self.current_round, self.missions_lost, self.next_leader, self.rejections)
+
+    def view(self) -> 'HistoryView':
+        '''
+        Returns a read-only view of this history, which stays up to date as events are recorded.
+        '''
+        return HistoryView(self)
+
+
+class HistoryView:
+    '''
+    A read-only, zero-copy view of a GameHistory for agents.
+    The arrays are exposed as read-only memoryviews, of which only the first len(view) entries are meaningful.
+    '''
+
+    def __init__(self, history: GameHistory) -> None:
+        self._history = history
+        self.team = memoryview(history.team).toreadonly()
+        self.votes = memoryview(history.votes).toreadonly()
+        self.leader = memoryview(history.leader).toreadonly()
+        self.round = memoryview(history.round).toreadonly()
+        self.betrayals = memoryview(history.betrayals).toreadonly()
+        self.missions_by_player = memoryview(history.missions_by_player).toreadonly()
+        self.failed_missions_by_player = memoryview(history.failed_missions_by_player).toreadonly()
+        self.approvals_by_voter = memoryview(history.approvals_by_voter).toreadonly()
+        self.proposals_by_leader = memoryview(history.proposals_by_leader).toreadonly()
+
+    def __len__(self) -> int:
+        return self._history.count
+
+    @property
+    def num_players(self) -> int:
+        return self._history.num_players
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        return self._history.names
+
+    @property
+    def games(self) -> int:
+        return self._history.games
+
+    def is_approved(self, i: int) -> bool:
+        '''
+        Returns True if proposal i was approved by a majority vote.
+        '''
+        return 2 * len(MEMBERS[self.votes[i]]) > self._history.num_players
+
+    def snapshot(self) -> GameState:
+        '''
+        Returns the current public state of the game.
+        '''
+        return self._history.snapshot()
@@ -0,0 +1,156 @@
+'''
+Profiles the memory retained as agents play thousands of games.
+For each agent type, plays games between a table of agents of that type,
+taking tracemalloc snapshots at intervals, and reports the growth in retained memory
+by agent type, by engine object type and by allocation site,
+flagging agent types whose memory grows with the number of games played.
+
+e.g. from src-py:
+python3 resistance/memory_profile.py --agents random bayes monte --games 2000 --snapshots 10
+'''
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from registry import AGENTS, AgentSpec, Roster
+from tournament import Tournament, Scheduler, SerialExecutor
+from game import Game, FastGame
+from history import GameHistory
+from monte_node import Node
+import argparse
+import gc
+import tracemalloc
+
+
+# Engine objects whose live instances are counted at each snapshot.
+ENGINE_TYPES = {
+    'Game': Game,
+    'FastGame': FastGame,
+    'GameHistory': GameHistory,
+    'Node': Node,
+}
+
+
+class Sample(NamedTuple):
+    '''
+    The retained memory after games games, in bytes, and the live engine objects of each type.
+    '''
+    games: int
+    traced: int
+    objects: Dict[str, int]
+
+
+class MemoryProfile(NamedTuple):
+    key: str
+    samples: List[Sample]
+    # (allocation site, size growth in bytes, count growth) from the first snapshot to the last
+    sites: List[Tuple[str, int, int]]
+
+    def growth(self) -> int:
+        return self.samples[-1].traced - self.samples[0].traced
+
+    def bytes_per_game(self) -> float:
+        '''
+        Returns the least squares slope of retained memory against games played.
+        '''
+        n = len(self.samples)
+        if n < 2:
+            return 0.0
+        mean_x = sum(s.games for s in self.samples) / n
+        mean_y = sum(s.traced for s in self.samples) / n
+        covariance = sum((s.games - mean_x) * (s.traced - mean_y) for s in self.samples)
+        variance = sum((s.games - mean_x) ** 2 for s in self.samples)
+        return covariance / variance if variance else 0.0
+
+    def object_growth(self) -> Dict[str, int]:
+        return {name: self.samples[-1].objects[name] - self.samples[0].objects[name] for name in ENGINE_TYPES}
+
+
+def count_objects() -> Dict[str, int]:
+    counts = dict.fromkeys(ENGINE_TYPES, 0)
+    for obj in gc.get_objects():
+        for name, engine_type in ENGINE_TYPES.items():
+            if isinstance(obj, engine_type):
+                counts[name] += 1
+    return counts
+
+
+def sample(games: int) -> Tuple[Sample, tracemalloc.Snapshot]:
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ])
+    traced = sum(stat.size for stat in snapshot.statistics('filename'))
+    return Sample(games, traced, count_objects()), snapshot
+
+
+def profile(key: str, games: int, snapshots: int, table_size: int = 5, warmup: int = 20,
+            seed: int = 0, top: int = 10) -> MemoryProfile:
+    '''
+    Plays warmup games and then games games between table_size agents registered as key,
+    sampling the retained memory snapshots times, evenly spaced.
+    '''
+    roster = Roster([AgentSpec(key, f'{key}{i + 1}') for i in range(table_size)])
+    tournament = Tournament(roster, Scheduler(table_size, [table_size], seed), SerialExecutor())
+    # Warm up first, so caches filled by the first games (tables, imports) are not counted as growth.
+    tournament.run(warmup)
+
+    samples: List[Sample] = []
+    first_sample, first = sample(0)
+    samples.append(first_sample)
+    last = first
+    for i in range(1, snapshots + 1):
+        tournament.run(warmup + games * i // snapshots)
+        current, last = sample(games * i // snapshots)
+        samples.append(current)
+
+    sites = []
+    for stat in last.compare_to(first, 'lineno')[:top]:
+        frame = stat.traceback[0]
+        sites.append((f'{frame.filename}:{frame.lineno}', stat.size_diff, stat.count_diff))
+    return MemoryProfile(key, samples, sites)
+
+
+def report(profiles: Sequence[MemoryProfile], threshold: float) -> str:
+    s = ''
+    for p in profiles:
+        slope = p.bytes_per_game()
+        flag = '  LEAK?' if slope > threshold else ''
+        s += f'{p.key}: {p.growth() / 1024:+.1f} KiB over {p.samples[-1].games} games' \
+            + f' ({slope:+.1f} bytes per game){flag}\n'
+        s += '  live objects: ' + ', '.join(f'{name} {p.samples[-1].objects[name]} ({growth:+d})'
+                                            for name, growth in p.object_growth().items()) + '\n'
+        for site, size, count in p.sites:
+            s += f'  {size / 1024:+9.1f} KiB {count:+7d} blocks  {site}\n'
+    return s
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog='memory_profile',
+        description='Profiles the memory retained by agents over many games.')
+    parser.add_argument('-a', '--agents', nargs='+', default=[*AGENTS], metavar='KEY',
+                        help='agent types to profile (default: all)')
+    parser.add_argument('-g', '--games', type=int, default=1000, help='games per agent type (default: 1000)')
+    parser.add_argument('-n', '--snapshots', type=int, default=10, help='snapshots per agent type (default: 10)')
+    parser.add_argument('-p', '--players', type=int, default=5, help='table size (default: 5)')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed for the games (default: 0)')
+    parser.add_argument('--top', type=int, default=10, help='allocation sites to list per agent type (default: 10)')
+    parser.add_argument('--frames', type=int, default=1, help='stack frames to keep per allocation (default: 1)')
+    parser.add_argument('--threshold', type=float, default=64.0,
+                        help='bytes per game of growth above which an agent type is flagged (default: 64)')
+    args = parser.parse_args(argv)
+    for key in args.agents:
+        if key not in AGENTS:
+            parser.error(f'Unknown agent {key}, expected one of {", ".join(AGENTS)}')
+
+    tracemalloc.start(args.frames)
+    profiles = []
+    for key in args.agents:
+        profiles.append(profile(key, args.games, args.snapshots, args.players, seed=args.seed, top=args.top))
+        print(report(profiles[-1:], args.threshold), end='', flush=True)
+    tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+from typing import Any, List, Optional, Sequence, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tournament import GameResult, LATENCY_BUCKETS, Tournament
+from time import perf_counter
+import os
+import threading
+
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def bucket_quantile(histogram: Sequence[int], quantile: float) -> float:
+    '''
+    Returns the upper bound, in seconds, of the latency bucket holding the given quantile of histogram.
+    '''
+    total = sum(histogram)
+    if total == 0:
+        return 0.0
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if seen >= quantile * total:
+            return 2 ** bucket / 1e6
+    return 2 ** (len(histogram) - 1) / 1e6
+
+
+class TournamentMetrics:
+    '''
+    Live metrics for a tournament, fed each result (as the tournament's callback)
+    and rendered in the Prometheus text exposition format.
+
+    Results are only ever added by the tournament's thread, which just increments counters,
+    so readers such as the HTTP endpoint need no lock and never hold up the games;
+    a reader may see a game half added, which is corrected by the next read.
+    Decision latencies need a timed executor, and worker utilisation needs executors that report each game's time.
+    '''
+
+    def __init__(self, tournament: Tournament, names: Sequence[str], games: int, workers: int = 1) -> None:
+        '''
+        names are those of the tournament's pool of agents,
+        games is the number of games to be played, and workers the number of processes playing them.
+        '''
+        self.tournament = tournament
+        self.names = names
+        self.games = games
+        self.workers = workers
+        self.start = perf_counter()
+        # games recorded by this process, which a resumed tournament started part way through
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self.decision_seconds = [0.0] * len(names)
+        self.decisions = [0] * len(names)
+        self.histograms = [[0] * LATENCY_BUCKETS for _ in names]
+        # games per second, smoothed over roughly the last ten seconds
+        self.rate = 0.0
+        self.rate_time = self.start
+        self.rate_games = 0
+
+    def record(self, result: GameResult) -> None:
+        self.completed += 1
+        self.busy_seconds += result.elapsed
+        if result.timings is not None:
+            for seat, agent in enumerate(result.spec.seating):
+                seconds, decisions, histogram = result.timings[seat]
+                self.decision_seconds[agent] += seconds
+                self.decisions[agent] += decisions
+                totals = self.histograms[agent]
+                for bucket, count in enumerate(histogram):
+                    totals[bucket] += count
+        now = perf_counter()
+        if now - self.rate_time >= 1.0:
+            recent = (self.completed - self.rate_games) / (now - self.rate_time)
+            self.rate = recent if self.rate == 0.0 else 0.9 * self.rate + 0.1 * recent
+            self.rate_time, self.rate_games = now, self.completed
+
+    def games_per_second(self) -> float:
+        if self.rate > 0.0:
+            return self.rate
+        elapsed = perf_counter() - self.start
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+    def render(self) -> str:
+        '''
+        Returns the metrics in the Prometheus text exposition format.
+        '''
+        elapsed = perf_counter() - self.start
+        rate = self.games_per_second()
+        played = self.tournament.played
+        remaining = max(self.games - played, 0)
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help: str, samples: List[Tuple[str, Any]]) -> None:
+            lines.append(f'# HELP resistance_{name} {help}')
+            lines.append(f'# TYPE resistance_{name} {kind}')
+            for labels, value in samples:
+                lines.append(f'resistance_{name}{labels} {value}')
+
+        metric('games_completed', 'counter', 'Games played so far.', [('', played)])
+        metric('games_remaining', 'gauge', 'Games still to be played.', [('', remaining)])
+        metric('games_per_second', 'gauge', 'Recent games played per second.', [('', f'{rate:.3f}')])
+        metric('eta_seconds', 'gauge', 'Estimated seconds until the tournament finishes.',
+               [('', f'{remaining / rate:.1f}' if rate > 0 else 'NaN')])
+        metric('elapsed_seconds', 'gauge', 'Seconds since the tournament started.', [('', f'{elapsed:.1f}')])
+        utilisation = self.busy_seconds / (elapsed * self.workers) if elapsed > 0 else 0.0
+        metric('worker_utilisation', 'gauge', 'Fraction of worker time spent playing games.',
+               [('', f'{min(utilisation, 1.0):.3f}')])
+
+        latency = []
+        for agent, name in enumerate(self.names):
+            if self.decisions[agent] == 0:
+                continue
+            label = f'agent="{name}"'
+            for quantile in QUANTILES:
+                latency.append((f'{{{label},quantile="{quantile}"}}',
+                                f'{bucket_quantile(self.histograms[agent], quantile):.6g}'))
+            latency.append((f'_sum{{{label}}}', f'{self.decision_seconds[agent]:.6f}'))
+            latency.append((f'_count{{{label}}}', self.decisions[agent]))
+        if latency:
+            metric('decision_seconds', 'summary',
+                   'CPU seconds per decision (quantiles are bucket upper bounds, doubling from a microsecond).',
+                   latency)
+
+        games, win_rates = [], []
+        for name, standing in zip(self.names, self.tournament.standings):
+            spy = (standing.spy_games, standing.spy_wins)
+            resistance = (standing.games - standing.spy_games, standing.wins - standing.spy_wins)
+            for role, (role_games, won) in (('spy', spy), ('resistance', resistance)):
+                label = f'{{agent="{name}",role="{role}"}}'
+                games.append((label, role_games))
+                win_rates.append((label, f'{won / role_games:.4f}' if role_games else 'NaN'))
+        metric('agent_games', 'counter', 'Games played by each agent in each role.', games)
+        metric('win_rate', 'gauge', 'Fraction of games won by each agent in each role.', win_rates)
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str) -> None:
+        '''
+        Writes the metrics to path, replacing the file atomically.
+        '''
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.render())
+        os.replace(path + '.tmp', path)
+
+
+class MetricsServer:
+    '''
+    Serves metrics at http://host:port/metrics from a background thread.
+    '''
+
+    def __init__(self, metrics: TournamentMetrics, port: int, host: str = '127.0.0.1') -> None:
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsFile:
+    '''
+    Writes metrics to a file at most every interval seconds, as they are recorded, and when closed.
+    '''
+
+    def __init__(self, metrics: TournamentMetrics, path: str, interval: float = 10.0) -> None:
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.last_write: Optional[float] = None
+
+    def record(self, result: GameResult) -> None:
+        now = perf_counter()
+        if self.last_write is None or now - self.last_write >= self.interval:
+            self.metrics.write(self.path)
+            self.last_write = now
+
+    def close(self) -> None:
+        self.metrics.write(self.path)
@@ -1,11 +1,19 @@
-from typing import List, Dict, Union, Tuple
+from typing import Any, Iterator, List, Dict, Optional, Union, Tuple
 from agent import Agent
-from monte_node import Node, StateNode, ActionNode, Phase
-from monte_simulation import SimulationGame
-from game import Game
+from monte_node import Node, StateNode, ActionNode, Phase, Tree
+from monte_simulation import SimulationGame, ModelledAgent
+from monte_ismcts import InformationSetSearch
+from monte_allocation import ALLOCATORS
+from monte_ponder import Ponderer
+from monte_telemetry import DecisionProbe, DecisionRecord, JsonLinesSink, TelemetrySink
+from opponent_model import OpponentModel
+from betray_table import default_table
+from value_model import LeafEvaluator, load_evaluator
+from history import GameHistory, GameState, HistoryView, MEMBERS, bitmask
+from combinations_table import SPY_SETS, spies_on_team
 import random
 from math import sqrt, log
-from itertools import combinations
+from time import perf_counter
 
 
 class MonteAgent(Agent):
@@ -13,11 +21,71 @@ class MonteAgent(Agent):
     Agent that uses Monte Carlo Tree Search.
     '''
 
-    def __init__(self, name: str = 'Mr. Monte') -> None:
+    def __init__(self, name: str = 'Mr. Monte', model_path: Optional[str] = None,
+                 iterations: int = 10, max_nodes: Optional[int] = None, mode: str = 'flat',
+                 allocator: str = 'ucb', ponder: bool = False, time_limit: Optional[float] = None,
+                 telemetry: Union[TelemetrySink, str, None] = None,
+                 evaluator: Union[LeafEvaluator, str, None] = None) -> None:
         '''
         Initialises the agent.
+        model_path is an opponent model store used to play out rollouts, which is updated between games.
+        iterations is the number of search iterations per decision,
+        time_limit optionally stops each decision's search early after that many seconds,
+        and max_nodes is the most nodes the search tree may hold (unlimited by default).
+        mode is 'flat' to search the agent's own actions with a rollout for every set of spies per iteration,
+        or 'ismcts' for information set search with one sampled set of spies per iteration.
+        allocator is how flat mode spreads its iterations over the actions:
+        'ucb' for UCB1, or 'halving' or 'racing' to drop clearly worse actions early and stop
+        once the best action is statistically separated (with 95% confidence over all the rollouts run).
+        The two best actions' values under random rollouts differ by a median of 1-1.5 points,
+        which takes tens of thousands of rollouts per action to separate, so in 5 player games
+        they save 0% of rollouts at 10 iterations and at most 2% at 30 to 1000 iterations,
+        and otherwise only concentrate the iterations on the better actions. The default is UCB1.
+        ponder is True to keep searching the agent's next proposal in a background thread
+        while other players act (flat mode with the UCB allocator only).
+        Pondering makes games non-deterministic, as the thread shares the random module.
+        telemetry is a sink (or the path of a JSON Lines file) to send a record of the search to for each decision.
+        evaluator scores the leaves of ismcts mode's search in place of rollouts:
+        a LeafEvaluator, or the path of a value model's weights (see value_model.py).
         '''
+        if mode not in ('flat', 'ismcts'):
+            raise Exception(f'Unknown search mode {mode}')
+        if allocator != 'ucb' and allocator not in ALLOCATORS:
+            raise Exception(f'Unknown allocator {allocator}')
+        if ponder and (mode != 'flat' or allocator != 'ucb'):
+            raise Exception('Pondering needs flat mode with the ucb allocator')
+        if evaluator is not None and mode != 'ismcts':
+            raise Exception('Leaf evaluators need ismcts mode')
+        if iterations < 1:
+            raise Exception('MonteAgent needs at least one search iteration')
+        if max_nodes is not None and max_nodes < 2:
+            raise Exception('max_nodes must be at least 2, for the root and one action')
+        self.ponderer = Ponderer(self, max_nodes) if ponder else None
+        self.allocator = allocator
+        # rollouts not needed by the allocator, for the last decision and since the agent was created
+        self.last_rollouts_saved = 0
+        self.rollouts_saved = 0
         self.name = name
+        self.betray_table = default_table()
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.tree = Tree(max_nodes)
+        self.mode = mode
+        self.evaluator = load_evaluator(evaluator) if isinstance(evaluator, str) else evaluator
+        self.ismcts = InformationSetSearch(self.tree, evaluator=self.evaluator)
+        self.model = OpponentModel(model_path) if model_path else None
+        self.rollout_agents: Optional[List[Agent]] = None
+        self.telemetry = JsonLinesSink(telemetry) if isinstance(telemetry, str) else telemetry
+        # counters for the decision being made, if telemetry is on
+        self.probe: Optional[DecisionProbe] = None
+        self.probe_start = 0.0
+        # the agent's own record of the game, for engines that do not share their history
+        self.own_history: Optional[GameHistory] = None
+        self.observed = False
+
+    def observe_history(self, history: HistoryView) -> None:
+        self.history = history
+        self.observed = True
 
     def new_game(self, number_of_players: int, player_number: int, spy_list: List[int]) -> None:
         '''
@@ -32,6 +100,25 @@ class MonteAgent(Agent):
         self.spy_list = spy_list
         self.rounds_completed = 0
         self.missions_failed = 0
+        if self.observed:
+            self.own_history = None
+        else:
+            # The engine did not call observe_history, so the agent records the game from its callbacks.
+            self.own_history = GameHistory(number_of_players)
+            self.history = self.own_history.view()
+        self.observed = False
+        # Opponents are modelled by name, which only a shared history gives.
+        self.rollout_agents = None
+        if self.model is not None and self.history.names:
+            model = self.model
+            model.join(self.history, player_number)
+            self.rollout_agents = [ModelledAgent(name, model.vote_yes_rate(name, True),
+                                                 model.vote_yes_rate(name, False), model.betray_rate(name))
+                                   for name in self.history.names]
+
+        if self.ponderer is not None:
+            self.ponderer.stop()
+            self.ponderer.update()
 
     def is_spy(self) -> bool:
         '''
@@ -45,9 +132,27 @@ class MonteAgent(Agent):
         0 (inclusive) and number_of_players (exclusive) to be returned. 
         betrayals_required are the number of betrayals required for the mission to fail.
         '''
-        state = StateNode(Phase.PROPOSE, self.is_spy(), Agent.spy_count[len(self.players)],
-                          self.players, team_size=team_size)
-        action: ActionNode = self.monte_carlo(state)
+        self.begin_decision()
+        team = self.search_proposal(team_size)
+        self.end_decision(Phase.PROPOSE)
+        return team
+
+    def search_proposal(self, team_size: int) -> List[int]:
+        if self.mode == 'ismcts':
+            action = self.ismcts.search(self.snapshot(), self.player_number, Phase.PROPOSE,
+                                        self.worlds(), self.iterations, agents=self.rollout_agents,
+                                        deadline=self.deadline(), probe=self.probe, history=self.history)
+            return [*MEMBERS[action.action]]
+
+        if self.ponderer is not None:
+            pondered = self.ponderer.take(self.snapshot(), team_size)
+            if pondered is not None:
+                self.tree, state, done = pondered
+                if self.probe is not None:
+                    self.probe.pondered = done
+                return self.monte_carlo(state, done=done).proposal
+
+        action: ActionNode = self.monte_carlo(self.root(Phase.PROPOSE, team_size=team_size))
         return action.proposal
 
     def vote(self, mission: List[int], proposer: int) -> bool:
@@ -57,13 +162,55 @@ class MonteAgent(Agent):
         proposer is an int between 0 and number_of_players and is the index of the player who proposed the mission.
         The function should return True if the vote is for the mission, and False if the vote is against the mission.
         '''
-        state = StateNode(Phase.VOTE, self.is_spy(), Agent.spy_count[len(self.players)],
-                          self.players, mission=mission)
-        state.generate_actions()
-
-        action: ActionNode = self.monte_carlo(state)
+        self.begin_decision()
+        vote = self.search_vote(mission)
+        self.end_decision(Phase.VOTE)
+        return vote
+
+    def search_vote(self, mission: List[int]) -> bool:
+        if self.ponderer is not None:
+            self.ponderer.stop()
+
+        if self.mode == 'ismcts':
+            action = self.ismcts.search(self.snapshot(), self.player_number, Phase.VOTE,
+                                        self.worlds(), self.iterations, bitmask(mission), self.rollout_agents,
+                                        self.deadline(), self.probe, self.history)
+            return action.action == 1
+
+        action: ActionNode = self.monte_carlo(self.root(Phase.VOTE, mission=mission))
         return action.vote
 
+    def begin_decision(self) -> None:
+        if self.telemetry is not None:
+            self.probe = DecisionProbe()
+            self.probe_start = perf_counter()
+
+    def end_decision(self, phase: Phase) -> None:
+        '''
+        Sends the record of the decision just made to the telemetry sink, if there is one.
+        '''
+        probe = self.probe
+        if self.telemetry is None or probe is None:
+            return
+        seconds = perf_counter() - self.probe_start
+        state = self.snapshot()
+        children = tuple((self.action_label(phase, child), child.visits, child.wins) for child in probe.children)
+        self.telemetry.emit(DecisionRecord(
+            self.name, phase.name.lower(), self.mode, state.round, state.rejections, self.is_spy(),
+            probe.iterations, probe.pondered, probe.rollouts, probe.worlds,
+            self.tree.node_count, self.tree.peak_nodes, self.tree.evicted_nodes, self.tree.depth(),
+            probe.select_seconds, probe.simulate_seconds, probe.update_seconds, seconds, children))
+        self.probe = None
+
+    def action_label(self, phase: Phase, node: Node) -> Union[List[int], bool]:
+        '''
+        returns the team proposed or the vote cast by a root action of either search mode.
+        '''
+        if self.mode == 'ismcts':
+            action: int = node.action  # type: ignore[attr-defined]
+            return [*MEMBERS[action]] if phase == Phase.PROPOSE else action == 1
+        return node.proposal if phase == Phase.PROPOSE else bool(node.vote)  # type: ignore[attr-defined]
+
     def vote_outcome(self, mission: List[int], proposer: int, votes: dict[int, bool]) -> None:
         '''
         mission is a list of agents to be sent on a mission. 
@@ -72,7 +219,10 @@ class MonteAgent(Agent):
         votes is a dictionary mapping player indexes to Booleans (True if they voted for the mission, False otherwise).
         No return value is required or expected.
         '''
-        pass
+        if self.own_history is not None:
+            self.own_history.propose(proposer, mission, votes)
+        if self.ponderer is not None:
+            self.ponderer.update()
 
     def betray(self, mission: List[int], proposer: int) -> bool:
         '''
@@ -80,10 +230,13 @@ class MonteAgent(Agent):
         The agents on the mission are distinct and indexed between 0 and number_of_players, and include this agent.
         proposer is an int between 0 and number_of_players and is the index of the player who proposed the mission.
         The method should return True if this agent chooses to betray the mission, and False otherwise. 
-        By default, spies will betray 30% of the time. 
+        Spies betray with the probability in the precomputed betrayal table for the situation.
         '''
         if self.is_spy():
-            return random.random() < 0.3
+            return self.betray_table.betray(
+                self.number_of_players, self.rounds_completed, self.missions_failed,
+                len([p for p in mission if p in self.spy_list]),
+                Agent.fails_required[self.number_of_players][self.rounds_completed])
 
         return False
 
@@ -96,7 +249,10 @@ class MonteAgent(Agent):
         and mission_success is True if there were not enough betrayals to cause the mission to fail, False otherwise.
         It is not expected or required for this function to return anything.
         '''
-        pass
+        if self.own_history is not None:
+            self.own_history.mission(betrayals)
+        if self.ponderer is not None:
+            self.ponderer.update()
 
     def round_outcome(self, rounds_completed: int, missions_failed: int) -> None:
         '''
@@ -107,13 +263,66 @@ class MonteAgent(Agent):
         self.rounds_completed = rounds_completed
         self.missions_failed = missions_failed
 
+    def snapshot(self) -> GameState:
+        '''
+        returns the public state of the game from the game's history
+        (or the agent's own record of it, if the engine does not share its history).
+        While a mission is being voted on, leader is its proposer.
+        '''
+        return self.history.snapshot()
+
+    def worlds(self) -> List[int]:
+        '''
+        returns the bitmasks of every set of spies consistent with what the agent knows:
+        the spies themselves if the agent is a spy, otherwise every set without this agent
+        that has enough spies on each failed mission to account for its betrayals.
+        '''
+        if self.is_spy():
+            return [bitmask(self.spy_list)]
+
+        spy_sets = SPY_SETS[self.number_of_players]
+        consistent = [r for r in range(len(spy_sets)) if not spy_sets.unrank(r) >> self.player_number & 1]
+        for i in range(len(self.history)):
+            betrayals = self.history.betrayals[i]
+            if betrayals > 0:
+                counts = spies_on_team(self.number_of_players, self.history.team[i])
+                consistent = [r for r in consistent if counts[r] >= betrayals]
+        return [spy_sets.unrank(r) for r in consistent]
+
     def game_outcome(self, spies_win: bool, spies: List[int]) -> None:
         '''
         basic informative function, where the parameters indicate:
         spies_win, True iff the spies caused 3+ missions to fail
         spies, a list of the player indexes for the spies.
         '''
-        pass
+        if self.ponderer is not None:
+            self.ponderer.stop()
+        if self.model is not None and self.history.names:
+            if self.model.record_game(self.history, spies, self.player_number):
+                self.model.autosave()
+
+    @classmethod
+    def cacheable(cls, kwargs: Dict[str, Any]) -> bool:
+        # Pondering threads share the random module with the game, and value model weights may change.
+        return kwargs.get('model_path') is None and not kwargs.get('ponder', False) \
+            and kwargs.get('evaluator') is None
+
+    @property
+    def background_seconds(self) -> float:
+        '''
+        returns the CPU time spent pondering since the agent was created.
+        '''
+        return self.ponderer.seconds if self.ponderer is not None else 0.0
+
+    def learning_state(self) -> Optional[bytes]:
+        '''
+        returns the opponent model, if the agent has one.
+        '''
+        return self.model.to_bytes() if self.model is not None else None
+
+    def restore_learning_state(self, state: Optional[bytes]) -> None:
+        if self.model is not None and state is not None:
+            self.model.restore(state)
 
     def uct_value(self, node: Node) -> float:
         if node.visits == 0:
@@ -131,62 +340,158 @@ class MonteAgent(Agent):
 
         return exploitation + exploration
 
-    def monte_carlo(self, state: StateNode) -> ActionNode:
-        for i in range(10):
-            unvisited_children = filter(
-                lambda c: c.visits == 0, state.children)
-            unvisited_children = list(unvisited_children)
-            if len(unvisited_children) != 0:
-                action_to_take = random.choice(unvisited_children)
-            else:
-                max_uct = 0
-                action_to_take = None
+    def monte_carlo(self, state: StateNode, done: int = 0) -> ActionNode:
+        '''
+        Searches from state for the rest of the iteration budget, given done iterations already run,
+        and returns the best action.
+        '''
+        if self.allocator != 'ucb':
+            return self.allocate(state)
 
-                for child in state.children:
-                    uct = self.uct_value(child)
-                    if uct > max_uct:
-                        max_uct = uct
-                        action_to_take = child
+        for _ in self.steps(state, done):
+            pass
+        return self.choose(state)
 
-            win_ratio = self.simulate(state, action_to_take)
-            self.update_value(action_to_take, win_ratio)
+    def root(self, phase: Phase, team_size: int = 0, mission: List[int] = []) -> StateNode:
+        '''
+        Clears the search tree and returns a new root for a decision in phase.
+        '''
+        self.tree.clear()
+        return StateNode(phase, self.is_spy(), Agent.spy_count[len(self.players)],
+                         self.players, team_size=team_size, mission=mission, tree=self.tree)
+
+    def steps(self, state: StateNode, done: int = 0) -> Iterator[int]:
+        '''
+        Runs UCB1 search iterations from state for the rest of the iteration budget (or time limit),
+        yielding the number run after each, so a caller may interleave other work between iterations.
+        '''
+        snapshot = self.snapshot()
+        deadline = self.deadline()
+        for i in range(done, self.iterations):
+            if deadline is not None and perf_counter() > deadline:
+                break
+            self.iterate(state, snapshot, self.probe)
+            yield i + 1
+
+    def choose(self, state: StateNode) -> ActionNode:
+        '''
+        Returns the best action of state after a search.
+        '''
+        best = max(state.children, key=lambda child: child.wins)
+        if self.probe is not None:
+            self.probe.worlds = len(SPY_SETS[len(state.players)])
+            self.probe.children = [*state.children]
+        return best
 
-        return max(state.children, key=lambda child: child.wins)
+    def deadline(self) -> Optional[float]:
+        '''
+        returns the time.perf_counter() value by which a decision started now must finish, if there is a time limit.
+        '''
+        return perf_counter() + self.time_limit if self.time_limit is not None else None
+
+    def iterate(self, state: StateNode, snapshot: GameState, probe: Optional[DecisionProbe] = None) -> None:
+        '''
+        Runs one UCB1 search iteration from state, with rollouts starting from snapshot,
+        timing its steps into probe if one is given.
+        '''
+        if probe is None:
+            action_to_take = self.select(state)
+            self.update_value(action_to_take, self.simulate(state, action_to_take, snapshot))
+            return
+        start = perf_counter()
+        action_to_take = self.select(state)
+        selected = perf_counter()
+        win_ratio = self.simulate(state, action_to_take, snapshot)
+        simulated = perf_counter()
+        self.update_value(action_to_take, win_ratio)
+        probe.add(selected - start, simulated - selected, perf_counter() - simulated,
+                  len(SPY_SETS[len(state.players)]))
+
+    def select(self, state: StateNode) -> ActionNode:
+        '''
+        Returns a random unvisited action of state, or otherwise the action with the highest UCB1 value.
+        '''
+        unvisited_children = filter(
+            lambda c: c.visits == 0, state.children)
+        unvisited_children = list(unvisited_children)
+        if len(unvisited_children) != 0:
+            action_to_take = random.choice(unvisited_children)
+        else:
+            max_uct = float('-inf')
+            action_to_take = None
+
+            for child in state.children:
+                uct = self.uct_value(child)
+                if uct > max_uct:
+                    max_uct = uct
+                    action_to_take = child
+
+        return action_to_take
+
+    def allocate(self, state: StateNode) -> ActionNode:
+        '''
+        Spends up to the iteration budget on the root's actions with the configured allocator,
+        recording how many rollouts it saved.
+        '''
+        rollouts_per_iteration = len(SPY_SETS[len(state.players)])
+        probe = self.probe
+
+        def evaluate(action: Node) -> None:
+            if probe is None:
+                self.update_value(action, self.simulate(state, action))
+                return
+            start = perf_counter()
+            win_ratio = self.simulate(state, action)
+            simulated = perf_counter()
+            self.update_value(action, win_ratio)
+            probe.add(0.0, simulated - start, perf_counter() - simulated, rollouts_per_iteration)
+
+        # Each iteration averages independent rollouts, one per set of spies.
+        best, used = ALLOCATORS[self.allocator](state.children, self.iterations, evaluate,
+                                                samples=rollouts_per_iteration)
+        if probe is not None:
+            probe.worlds = rollouts_per_iteration
+            probe.children = [*state.children]
+        self.last_rollouts_saved = (self.iterations - used) * rollouts_per_iteration
+        self.rollouts_saved += self.last_rollouts_saved
+        return best  # type: ignore[return-value]
 
     def expand(state: StateNode) -> None:
         state.visits = 1
         state.value = 0
 
-    def simulate(self, state: StateNode, action: ActionNode) -> float:
+    def simulate(self, state: StateNode, action: ActionNode, snapshot: Optional[GameState] = None) -> float:
         """
-        Runs many rollouts for every possible configuration of spies.
+        Runs many rollouts for every possible configuration of spies,
+        from snapshot (by default the current state of the game) with action taken.
         """
         # 0 - Initialise variables for return value.
         total_rollouts = 0
         total_wins = 0
+        if snapshot is None:
+            snapshot = self.snapshot()
 
-        # 1 - Generate all possible combinations of spies.
-        spy_combos = combinations(state.players, state.num_spys)
+        # 1 - Look up all possible combinations of spies.
+        spy_combos = SPY_SETS[len(state.players)].members
 
-        # 2 - Run a random game for every combination of spies.
+        # 2 - Run a random game for every combination of spies, starting with the action.
+        if state.phase == Phase.PROPOSE:
+            team, votes = action.proposal, None
+        else:
+            team, votes = state.mission, {self.player_number: action.vote}
         for spys in spy_combos:
             total_rollouts += 1
 
-            # TODO - Action never gets passed and therefore has no influence.
-            if self.rollout(spys, self.rounds_completed, self.missions_failed, state.phase):
+            if self.rollout(spys, snapshot, team, votes):
                 total_wins += 1
 
         # 3 - Return the percentage of wins from all the rollouts.
         return total_wins / total_rollouts
 
-    def rollout(self, spys: List[int], rnd: int, failed_missions: int, phase: Phase) -> bool:
-        game = SimulationGame(len(self.players), self.player_number, spys,
-                              rnd, failed_missions, phase)
-
-        won_as_resistance = game.simulate() and not self.is_spy()
-        won_as_spies = not game.simulate() and self.is_spy()
-
-        return won_as_resistance or won_as_spies
+    def rollout(self, spys: List[int], snapshot: GameState, team: Optional[List[int]] = None,
+                votes: Optional[Dict[int, bool]] = None) -> bool:
+        game = SimulationGame(snapshot, spys, self.rollout_agents, team, votes)
+        return game.simulate() != self.is_spy()
 
     def update_value(self, node: Node, win_ratio) -> None:
         node.wins += win_ratio
@@ -0,0 +1,96 @@
+from typing import Callable, List, Sequence, Tuple
+from monte_node import Node
+from math import ceil, log, log2, sqrt
+import random
+
+
+def confidence_radius(visits: int, arms: int, delta: float, samples: int = 1) -> float:
+    """
+    Returns a confidence radius of a mean of visits rewards,
+    each the mean of samples independent outcomes in [0, 1] (such as one rollout per set of spies),
+    that holds for every one of arms arms at every visit count with probability at least 1 - delta.
+    Visit counts are split into epochs [2**k, 2**(k + 1)), and Hoeffding's maximal inequality bounds the mean
+    throughout an epoch at once, the k-th epoch given delta / ((k + 1) * (k + 2)) of the failure probability
+    (split between the arms and both sides).
+    The radius grows with log log of the visits instead of their log, as a union over every visit count would,
+    at the cost of up to sqrt(2) at the start of each epoch.
+    The bound is over all visits * samples outcomes, so it narrows with the rollouts run, not just the visits.
+    """
+    k = visits.bit_length() - 1
+    return sqrt((1 << k) * log(2 * arms * (k + 1) * (k + 2) / delta) / samples) / visits
+
+
+def separated(arms: Sequence[Node], union: int, delta: float, samples: int = 1) -> bool:
+    """
+    Returns True if the arm with the best mean is better than every other arm with confidence 1 - delta,
+    with the bound over union arms (those arms and any already dropped).
+    """
+    bounds = [(arm.wins / arm.visits, confidence_radius(arm.visits, union, delta, samples)) for arm in arms]
+    best = max(range(len(arms)), key=lambda i: bounds[i][0])
+    lower = bounds[best][0] - bounds[best][1]
+    return all(mean + radius < lower for i, (mean, radius) in enumerate(bounds) if i != best)
+
+
+def mean(node: Node) -> float:
+    return node.wins / node.visits if node.visits else 0.0
+
+
+def sequential_halving(arms: Sequence[Node], budget: int, evaluate: Callable[[Node], None],
+                       delta: float = 0.05, samples: int = 1) -> Tuple[Node, int]:
+    """
+    Spends up to budget evaluations on arms in rounds, evenly within each round,
+    keeping the better half of the arms after each round.
+    Stops early once the best remaining arm is statistically separated from the rest,
+    given that each evaluation averages samples independent outcomes.
+    Returns the best arm and the number of evaluations used.
+    """
+    survivors: List[Node] = list(arms)
+    if budget < len(survivors):
+        survivors = random.sample(survivors, budget)
+    rounds = max(1, ceil(log2(len(survivors))))
+    used = 0
+    while used < budget and len(survivors) > 1:
+        per_arm = max(1, (budget // rounds) // len(survivors))
+        for _ in range(per_arm):
+            for arm in survivors:
+                if used == budget:
+                    break
+                evaluate(arm)
+                used += 1
+            if used == budget or separated(survivors, len(arms), delta, samples):
+                return max(survivors, key=mean), used
+        survivors.sort(key=mean, reverse=True)
+        survivors = survivors[:max(1, ceil(len(survivors) / 2))]
+    return max(survivors, key=mean), used
+
+
+def racing(arms: Sequence[Node], budget: int, evaluate: Callable[[Node], None],
+           delta: float = 0.05, samples: int = 1) -> Tuple[Node, int]:
+    """
+    Evaluates every remaining arm once per round, eliminating arms whose upper confidence bound
+    falls below the best lower confidence bound, until one arm remains or budget evaluations are used.
+    Each evaluation averages samples independent outcomes.
+    Returns the best arm and the number of evaluations used.
+    """
+    survivors: List[Node] = list(arms)
+    if budget < len(survivors):
+        survivors = random.sample(survivors, budget)
+    used = 0
+    while used < budget and len(survivors) > 1:
+        for arm in survivors:
+            if used == budget:
+                break
+            evaluate(arm)
+            used += 1
+        if any(arm.visits == 0 for arm in survivors):
+            continue
+        radius = {arm: confidence_radius(arm.visits, len(arms), delta, samples) for arm in survivors}
+        best_lower = max(mean(arm) - radius[arm] for arm in survivors)
+        survivors = [arm for arm in survivors if mean(arm) + radius[arm] >= best_lower]
+    return max(survivors, key=mean), used
+
+
+ALLOCATORS = {
+    'halving': sequential_halving,
+    'racing': racing,
+}
@@ -0,0 +1,275 @@
+from typing import Dict, List, Optional, Sequence
+from agent import Agent
+from monte_node import Node, Phase, Tree
+from monte_simulation import SimulationGame
+from monte_telemetry import DecisionProbe
+from value_model import Leaf, LeafEvaluator
+from features import failed_rounds
+from history import GameState, HistoryView, MEMBERS
+from combinations_table import TEAMS
+from math import sqrt, log
+from time import perf_counter
+import random
+
+
+class InfoSetNode(Node):
+    """
+    A node in an information set tree: it stands for every determinisation
+    reached by the same sequence of actions.
+    available counts the iterations in which this node's action could have been chosen.
+    """
+
+    def __init__(self, action: int = -1) -> None:
+        Node.__init__(self)
+        self.action = action
+        self.available = 0
+        self.by_action: Dict[int, InfoSetNode] = {}
+
+    def clear_children(self) -> None:
+        self.children = []
+        self.by_action = {}
+
+
+class SearchState:
+    """
+    A determinised game state that can be stepped through by the search.
+    Proposals and the missions' betrayal counts are actions in the tree;
+    the searching agent's own votes are actions, while the other votes are sampled at random.
+    """
+
+    def __init__(self, state: GameState, spies: int, me: int, phase: Phase, team: int = 0, failed: int = 0) -> None:
+        self.n = state.num_players
+        self.round = state.round
+        self.missions_lost = state.missions_lost
+        self.leader = state.leader
+        self.rejections = state.rejections
+        self.spies = spies
+        self.me = me
+        self.phase = phase
+        self.team = team
+        # bitmask of the complete rounds that failed
+        self.failed = failed
+
+    def terminal(self) -> bool:
+        return self.missions_lost >= 3 or self.round - self.missions_lost >= 3
+
+    def actor_is_spy(self) -> bool:
+        """
+        Returns True if the player (or players) choosing the next action are spies in this determinisation.
+        """
+        if self.phase == Phase.PROPOSE:
+            return self.spies >> self.leader & 1 == 1
+        if self.phase == Phase.VOTE:
+            return self.spies >> self.me & 1 == 1
+        return True
+
+    def actions(self) -> Sequence[int]:
+        """
+        Returns the actions available in this determinisation:
+        team bitmasks to propose, 1 or 0 to vote for or against, or the number of spies on the team who betray.
+        """
+        if self.phase == Phase.PROPOSE:
+            return TEAMS[self.n][Agent.mission_sizes[self.n][self.round]].masks
+        if self.phase == Phase.VOTE:
+            return (1, 0)
+        return range(len(MEMBERS[self.team & self.spies]) + 1)
+
+    def apply(self, action: int) -> None:
+        if self.phase == Phase.PROPOSE:
+            self.team = action
+            self.phase = Phase.VOTE
+        elif self.phase == Phase.VOTE:
+            votes = action + sum(random.random() < 0.5 for _ in range(self.n - 1))
+            self.leader = (self.leader + 1) % self.n
+            if 2 * votes > self.n:
+                self.phase = Phase.MISSION
+            else:
+                self.rejections += 1
+                self.phase = Phase.PROPOSE
+                if self.rejections == 5:
+                    self.end_round(False)
+        else:
+            self.end_round(action < Agent.fails_required[self.n][self.round])
+            self.phase = Phase.PROPOSE
+
+    def end_round(self, success: bool) -> None:
+        if not success:
+            self.missions_lost += 1
+            self.failed |= 1 << self.round
+        self.round += 1
+        self.rejections = 0
+
+    def settle(self) -> None:
+        """
+        Resolves any vote or mission in progress at random, so the state is at a proposal or the game's end.
+        """
+        if self.phase == Phase.VOTE:
+            self.apply(int(random.random() < 0.5))
+        if self.phase == Phase.MISSION:
+            self.apply(random.choice(self.actions()))
+
+    def snapshot(self) -> GameState:
+        return GameState(self.n, self.round, self.missions_lost, self.leader, self.rejections)
+
+    def rollout(self, agents: Optional[List[Agent]] = None) -> bool:
+        """
+        Plays the game out at random, returning True if the resistance win.
+        """
+        self.settle()
+        if self.terminal():
+            return self.missions_lost < 3
+        return SimulationGame(self.snapshot(), MEMBERS[self.spies], agents).simulate()
+
+    def leaf(self) -> Optional[Leaf]:
+        """
+        Returns the state as a leaf for an evaluator, after settling it, or None if the game is over.
+        """
+        self.settle()
+        if self.terminal():
+            return None
+        return Leaf(self.snapshot(), self.failed, self.spies)
+
+
+class InformationSetSearch:
+    """
+    Single-observer information set Monte Carlo tree search.
+    Each iteration samples one determinisation (a set of spies consistent with what the agent knows)
+    and descends one shared tree, choosing only among the actions available in that determinisation,
+    for the agent's own moves and every other player's.
+    The cost of an iteration is one rollout, whatever the size of the table.
+    With an evaluator, iterations instead select batch_size leaves at a time
+    and score them in one call to the evaluator before backpropagating.
+    """
+
+    def __init__(self, tree: Tree, explore_weight: float = sqrt(2),
+                 evaluator: Optional[LeafEvaluator] = None, batch_size: int = 16) -> None:
+        self.tree = tree
+        self.explore_weight = explore_weight
+        self.evaluator = evaluator
+        self.batch_size = batch_size
+
+    def search(self, state: GameState, me: int, phase: Phase, worlds: Sequence[int], iterations: int,
+               team: int = 0, agents: Optional[List[Agent]] = None, deadline: Optional[float] = None,
+               probe: Optional[DecisionProbe] = None, history: Optional[HistoryView] = None) -> InfoSetNode:
+        """
+        Searches from the agent me's decision in phase (PROPOSE or VOTE on team) of state,
+        with the spies drawn from the bitmasks worlds, and returns the root's most visited child.
+        Leaves are played out by agents (at random by default), or scored by the evaluator,
+        which needs the public history of the game.
+        The search stops early once time.perf_counter() passes deadline, after at least one iteration.
+        If probe is given, the search's counters and timings are added to it.
+        """
+        self.tree.clear()
+        root = InfoSetNode()
+        self.tree.root = root
+        self.tree.allocate(1)
+
+        if self.evaluator is not None:
+            if history is None:
+                raise Exception('Searching with a leaf evaluator needs the game\'s history')
+            self.search_batches(root, state, me, phase, worlds, iterations, team, history, deadline, probe)
+        else:
+            for i in range(iterations):
+                if i > 0 and deadline is not None and perf_counter() > deadline:
+                    break
+                if probe is None:
+                    determinisation = SearchState(state, random.choice(worlds), me, phase, team)
+                    self.backpropagate(self.select(root, determinisation), determinisation.rollout(agents))
+                    continue
+                start = perf_counter()
+                determinisation = SearchState(state, random.choice(worlds), me, phase, team)
+                path = self.select(root, determinisation)
+                selected = perf_counter()
+                resistance_won = determinisation.rollout(agents)
+                simulated = perf_counter()
+                self.backpropagate(path, resistance_won)
+                probe.add(selected - start, simulated - selected, perf_counter() - simulated, 1)
+
+        best: InfoSetNode = max(root.children, key=lambda child: child.visits)  # type: ignore
+        if probe is not None:
+            probe.worlds = len(worlds)
+            probe.children = [*root.children]
+        return best
+
+    def search_batches(self, root: InfoSetNode, state: GameState, me: int, phase: Phase, worlds: Sequence[int],
+                       iterations: int, team: int, history: HistoryView, deadline: Optional[float],
+                       probe: Optional[DecisionProbe]) -> None:
+        """
+        Runs the iterations of a search with the evaluator, batch_size at a time.
+        The leaves of a batch are selected before any is scored,
+        so later leaves in a batch are steered only by the nodes the earlier ones added.
+        """
+        evaluator: LeafEvaluator = self.evaluator  # type: ignore[assignment]
+        # The leaves' features describe their rounds past the history, so the search tracks which failed.
+        failed = failed_rounds(history)
+        done = 0
+        while done < iterations:
+            if done > 0 and deadline is not None and perf_counter() > deadline:
+                break
+            count = min(self.batch_size, iterations - done)
+            start = perf_counter()
+            paths = []
+            leaves: List[Optional[Leaf]] = []
+            values: List[float] = []
+            for _ in range(count):
+                determinisation = SearchState(state, random.choice(worlds), me, phase, team, failed)
+                paths.append(self.select(root, determinisation))
+                leaves.append(determinisation.leaf())
+                values.append(float(determinisation.missions_lost < 3))
+            selected = perf_counter()
+            scored = iter(evaluator.evaluate(history, [leaf for leaf in leaves if leaf is not None]))
+            simulated = perf_counter()
+            for path, leaf, value in zip(paths, leaves, values):
+                self.backpropagate(path, value if leaf is None else next(scored))
+            if probe is not None:
+                probe.add(selected - start, simulated - selected, perf_counter() - simulated, 0, count)
+            done += count
+
+    def backpropagate(self, path: List[InfoSetNode], resistance_won: float) -> None:
+        for node in path:
+            node.visits += 1
+            node.wins += resistance_won
+
+    def select(self, root: InfoSetNode, state: SearchState) -> List[InfoSetNode]:
+        """
+        Descends the tree, applying each chosen action to state,
+        until a new node is added or no further node can be created. Returns the path taken.
+        The root is always expanded, as the real game asks for decisions even once it is decided.
+        """
+        node = root
+        path = [root]
+        while node is root or not state.terminal():
+            actions = state.actions()
+            untried = [a for a in actions if a not in node.by_action]
+            if untried and self.tree.reserve(node, 1) == 1:
+                child = InfoSetNode(random.choice(untried))
+                child.parent = node
+                node.children.append(child)
+                node.by_action[child.action] = child
+                child.available += 1
+                state.apply(child.action)
+                path.append(child)
+                return path
+
+            available = [node.by_action[a] for a in actions if a in node.by_action]
+            if not available:
+                return path
+            spy = state.actor_is_spy()
+            for child in available:
+                child.available += 1
+            node = max(available, key=lambda child: self.uct_value(child, spy))
+            state.apply(node.action)
+            path.append(node)
+        return path
+
+    def uct_value(self, node: InfoSetNode, spy: bool) -> float:
+        """
+        Returns the upper confidence bound of node for the side choosing it,
+        using the number of times it was available in place of its parent's visits.
+        """
+        if node.visits == 0:
+            return float('inf')
+        exploitation = node.wins / node.visits
+        if spy:
+            exploitation = 1 - exploitation
+        return exploitation + self.explore_weight * sqrt(log(node.available) / node.visits)
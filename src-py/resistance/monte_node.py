@@ -1,6 +1,8 @@
-from typing import Optional, List
+from typing import Dict, Optional, List, Set
 from enum import Enum
-from itertools import combinations
+from combinations_table import TEAMS
+import random
+import sys
 
 
 class Phase(Enum):
@@ -16,13 +18,145 @@ class Node():
         self.parent: Optional[Node] = None
         self.children: List[Node] = []
 
+    def clear_children(self) -> None:
+        self.children = []
+
+
+class Tree():
+    """
+    Owns the nodes of a search tree and keeps their number within an optional budget.
+    When the budget is reached, the least visited subtrees are collapsed back into their roots
+    (keeping the root's statistics) until the tree is back to three quarters of the budget,
+    so the expanded nodes are only sorted once per quarter of the budget rather than for every node created,
+    and if that is not enough no more nodes are created.
+    """
+
+    def __init__(self, max_nodes: Optional[int] = None) -> None:
+        self.max_nodes = max_nodes
+        self.root: Optional[Node] = None
+        self.node_count = 0
+        self.peak_nodes = 0
+        self.evicted_nodes = 0
+        # nodes that have children
+        self.expanded: Set[Node] = set()
+
+    def clear(self) -> None:
+        """
+        Frees every node in the tree.
+        """
+        self.root = None
+        self.node_count = 0
+        self.expanded = set()
+
+    def available(self) -> int:
+        if self.max_nodes is None:
+            return sys.maxsize
+        return max(0, self.max_nodes - self.node_count)
+
+    def allocate(self, count: int) -> None:
+        self.node_count += count
+        self.peak_nodes = max(self.peak_nodes, self.node_count)
+
+    def reserve(self, parent: Node, wanted: int) -> int:
+        """
+        Returns how many of wanted new children of parent may be created,
+        evicting the least visited subtrees elsewhere in the tree if the budget requires it.
+        """
+        if self.available() < wanted:
+            self.evict(wanted - self.available(), parent)
+        granted = min(wanted, self.available())
+        self.allocate(granted)
+        if granted > 0:
+            self.expanded.add(parent)
+        return granted
+
+    def evict(self, needed: int, protected: Node) -> None:
+        """
+        Collapses the least visited subtrees until needed nodes are freed
+        and the tree is back to three quarters of the budget,
+        leaving protected and its ancestors untouched.
+        """
+        if self.max_nodes is not None:
+            needed = max(needed, self.node_count - self.max_nodes * 3 // 4)
+        ancestors: Set[Node] = set()
+        node: Optional[Node] = protected
+        while node is not None:
+            ancestors.add(node)
+            node = node.parent
+
+        freed = 0
+        for candidate in sorted(self.expanded - ancestors, key=lambda n: n.visits):
+            if freed >= needed:
+                break
+            if candidate in self.expanded:
+                freed += self.collapse(candidate)
+        self.evicted_nodes += freed
+
+    def collapse(self, node: Node) -> int:
+        """
+        Removes all descendants of node, returning how many nodes were freed.
+        """
+        freed = 0
+        stack = [*node.children]
+        while stack:
+            child = stack.pop()
+            freed += 1
+            self.expanded.discard(child)
+            stack.extend(child.children)
+            child.parent = None
+        node.clear_children()
+        self.expanded.discard(node)
+        self.node_count -= freed
+        return freed
+
+    def depth(self) -> int:
+        """
+        Returns the depth of the deepest node below the root.
+        """
+        if self.root is None:
+            return 0
+        deepest = 0
+        stack = [(self.root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            deepest = max(deepest, depth)
+            stack.extend((child, depth + 1) for child in node.children)
+        return deepest
+
+    def memory(self) -> int:
+        """
+        Returns the approximate number of bytes used by the nodes in the tree.
+        """
+        if self.root is None:
+            return 0
+        total = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            total += sys.getsizeof(node) + sys.getsizeof(node.__dict__) + sys.getsizeof(node.children)
+            stack.extend(node.children)
+        return total
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns node count and memory telemetry for the tree.
+        """
+        return {
+            'nodes': self.node_count,
+            'peak_nodes': self.peak_nodes,
+            'evicted_nodes': self.evicted_nodes,
+            'depth': self.depth(),
+            'bytes': self.memory(),
+        }
+
 
 class StateNode(Node):
     """
     Represents a single state in a game of The Resistance.
     """
 
-    def __init__(self, phase: Phase, is_spy: bool, num_spys: int, players: List[int], team_size: int = 0, mission: List[int] = []) -> None:
+    def __init__(self, phase: Phase, is_spy: bool, num_spys: int, players: List[int], team_size: int = 0, mission: List[int] = [],
+                 tree: Optional[Tree] = None) -> None:
         Node.__init__(self)
 
         self.phase = phase
@@ -30,11 +164,28 @@ class StateNode(Node):
         self.num_spys = num_spys
         self.players = players
         self.team_size = team_size
+        # the proposal being voted on, in the VOTE phase
+        self.mission = mission
+        self.tree = tree
+        if tree is not None and tree.root is None:
+            tree.root = self
+            tree.allocate(1)
         self.generate_actions()
 
+    def reserve(self, wanted: int) -> int:
+        """
+        Returns how many of wanted children may be created within the tree's node budget.
+        """
+        if self.tree is None:
+            return wanted
+        return self.tree.reserve(self, wanted)
+
     def generate_actions(self) -> None:
         if self.phase == Phase.PROPOSE:
-            teams = combinations(self.players, self.team_size)
+            teams = TEAMS[len(self.players)][self.team_size].members
+            allowed = self.reserve(len(teams))
+            if allowed < len(teams):
+                teams = random.sample(teams, allowed)
 
             for team in teams:
                 proposal = ActionNode(self.phase)
@@ -47,10 +198,10 @@ class StateNode(Node):
             vote_yes.parent = self
 
             vote_no = ActionNode(self.phase)
-            vote_yes.vote = False
+            vote_no.vote = False
             vote_no.parent = self
 
-            self.children = [vote_yes, vote_no]
+            self.children = [vote_yes, vote_no][:self.reserve(2)]
         elif self.phase == Phase.MISSION:
             succeed = ActionNode(self.phase)
             succeed.parent = self
@@ -59,9 +210,9 @@ class StateNode(Node):
             sabotage.parent = self
 
             if self.is_spy:
-                self.children = [succeed, sabotage]
+                self.children = [succeed, sabotage][:self.reserve(2)]
             else:
-                self.children = [succeed]
+                self.children = [succeed][:self.reserve(1)]
 
 
 class ActionNode(Node):
@@ -0,0 +1,116 @@
+from typing import Optional, Tuple, TYPE_CHECKING
+from agent import Agent
+from monte_node import Phase, StateNode, Tree
+from history import GameState
+from time import thread_time
+import threading
+
+if TYPE_CHECKING:
+    from monte_agent import MonteAgent
+
+
+class Ponderer:
+    """
+    Searches a MonteAgent's next proposal in a background thread while the other players act.
+
+    After each public event the ponderer predicts the state in which the agent will next propose
+    (if the current round keeps being rejected until it is the agent's turn) and searches it.
+    When the agent is asked to propose in exactly that state, the search tree and the iterations
+    already run are handed over, so only the rest of the iteration budget is spent on the decision itself.
+
+    The thread runs Python code, so under the GIL it only saves time when the process would otherwise wait
+    (e.g. for remote players); against other seats in the same process it shares their CPU.
+    seconds counts the thread's own CPU time, for charging pondering to the agent.
+    """
+
+    def __init__(self, agent: 'MonteAgent', max_nodes: Optional[int] = None) -> None:
+        self.agent = agent
+        self.tree = Tree(max_nodes)
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+        self.key: Optional[Tuple[GameState, int]] = None
+        self.root: Optional[StateNode] = None
+        self.done = 0
+        self.seconds = 0.0
+
+    def prediction(self) -> Optional[GameState]:
+        """
+        Returns the state in which the agent will next propose this round, or None if that cannot be predicted.
+        """
+        history = self.agent.history
+        last = len(history) - 1
+        if last >= 0 and history.is_approved(last) and history.betrayals[last] < 0:
+            # The mission is still to be run, so the next round is not known yet.
+            return None
+        state = history.snapshot()
+        if state.round >= 5:
+            return None
+        distance = (self.agent.player_number - state.leader) % state.num_players
+        if state.rejections + distance >= 5:
+            return None
+        return state._replace(leader=self.agent.player_number, rejections=state.rejections + distance)
+
+    def update(self) -> None:
+        """
+        Called after each public event: keeps pondering if the predicted decision is unchanged,
+        otherwise restarts on the new prediction.
+        """
+        predicted = self.prediction()
+        if predicted is None:
+            self.stop()
+            return
+        key = (predicted, Agent.mission_sizes[predicted.num_players][predicted.round])
+        if key == self.key:
+            return
+
+        self.stop()
+        self.key = key
+        self.tree.clear()
+        self.root = StateNode(Phase.PROPOSE, self.agent.is_spy(), Agent.spy_count[predicted.num_players],
+                              self.agent.players, team_size=key[1], tree=self.tree)
+        self.done = 0
+        self.thread = threading.Thread(target=self.run, args=(self.root, predicted), daemon=True)
+        self.thread.start()
+
+    def run(self, root: StateNode, snapshot: GameState) -> None:
+        start = thread_time()
+        try:
+            while self.done < self.agent.iterations and not self.stopping.is_set():
+                self.agent.iterate(root, snapshot)
+                self.done += 1
+        finally:
+            self.seconds += thread_time() - start
+
+    def halt(self) -> None:
+        """
+        Stops the background thread, waiting for its current iteration to finish.
+        """
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.stopping.clear()
+            self.thread = None
+
+    def stop(self) -> None:
+        """
+        Stops pondering and discards the search.
+        """
+        self.halt()
+        self.key = None
+        self.root = None
+
+    def take(self, state: GameState, team_size: int) -> Optional[Tuple[Tree, StateNode, int]]:
+        """
+        Stops pondering and, if it was for the agent's proposal of team_size in state,
+        returns the search tree, its root and the number of iterations run.
+        The ponderer keeps the agent's previous tree to reuse for its next search.
+        """
+        self.halt()
+        if self.root is None or self.key != (state, team_size):
+            self.stop()
+            return None
+        tree, self.tree = self.tree, self.agent.tree
+        root, done = self.root, self.done
+        self.key = None
+        self.root = None
+        return tree, root, done
@@ -1,8 +1,32 @@
 from agent import Agent
 from random_agent import RandomAgent
 import random
-from typing import List
-from monte_node import Phase
+import threading
+from history import GameState
+from typing import Dict, List, Optional, Sequence
+
+
+# Rollout agents are reused between simulations, one list per game size in each thread.
+_local = threading.local()
+
+
+class ModelledAgent(RandomAgent):
+    '''
+    A rollout agent that votes and betrays at rates learnt for the opponent in its seat.
+    '''
+
+    def __init__(self, name: str, spy_vote_rate: float, resistance_vote_rate: float, betray_rate: float) -> None:
+        self.name = name
+        self.spy_vote_rate = spy_vote_rate
+        self.resistance_vote_rate = resistance_vote_rate
+        self.betray_rate = betray_rate
+
+    def vote(self, mission: List[int], proposer: int) -> bool:
+        rate = self.spy_vote_rate if self.is_spy() else self.resistance_vote_rate
+        return random.random() < rate
+
+    def betray(self, mission: List[int], proposer: int) -> bool:
+        return self.is_spy() and random.random() < self.betray_rate
 
 
 class SimulationGame:
@@ -13,19 +37,29 @@ class SimulationGame:
     to share information and get game actions
     '''
 
-    def __init__(self, num_players: int, agent_id: int, spy_list: List[int], round: int, failed_missions: int, phase: Phase):
+    def __init__(self, state: GameState, spies: Sequence[int], agents: Optional[List[Agent]] = None,
+                 team: Optional[List[int]] = None, votes: Optional[Dict[int, bool]] = None) -> None:
         '''
-        Simulates a game of The Resistance from a specified state.
+        Simulates a game of The Resistance forked from the snapshot state,
+        with the given spies. The state is only read, so one snapshot can be forked many times.
+        agents play out the game, and default to RandomAgents.
+        team optionally fixes the first proposal (made by the state's leader),
+        and votes fixes the votes of some players on it, so the game can be played on from a searched action.
         '''
-        self.num_players = num_players
-        self.agents: List[Agent] = []
+        self.state = state
+        self.num_players = state.num_players
+        self.team = team
+        self.votes = votes
 
-        # Create agent array
-        for i in range(num_players):
-            self.agents.append(RandomAgent(f'r{i}'))
+        if agents is None:
+            rollout_agents: Dict[int, List[Agent]] = _local.__dict__.setdefault('agents', {})
+            if state.num_players not in rollout_agents:
+                rollout_agents[state.num_players] = [RandomAgent(f'r{i}') for i in range(state.num_players)]
+            agents = rollout_agents[state.num_players]
+        self.agents = agents
 
         # Allocate spies
-        self.spies = list(spy_list)
+        self.spies = list(spies)
 
         # Start game for each agent
         for agent_id in range(self.num_players):
@@ -33,28 +67,27 @@ class SimulationGame:
             self.agents[agent_id].new_game(
                 self.num_players, agent_id, spy_list)
 
-        # Initialise rounds
-        self.agent_id = agent_id
-        self.missions_lost = failed_missions
-        self.rounds = []
-        self.round = round
-        self.phase = phase
+        self.missions_lost = state.missions_lost
 
     def simulate(self) -> bool:
         """
         Returns true if the resistance win, false if the spies win.
+        Play stops as soon as either side has won three missions.
         """
-        leader = self.agent_id
-
-        for i in range(5 - self.round):
-            new_round = SimulationRound(leader, self.agents, self.spies, i)
-            self.rounds.append(new_round)
-            # TODO: Why does i not work in place of -1? Seems to be running like 9 rounds
-            if not self.rounds[-1].play():
+        leader = self.state.leader
+        rejections = self.state.rejections
+
+        for rnd in range(self.state.round, 5):
+            if self.missions_lost >= 3 or rnd - self.missions_lost >= 3:
+                break
+            new_round = SimulationRound(leader, self.agents, self.spies, rnd, rejections, self.team, self.votes)
+            self.team = self.votes = None
+            if not new_round.play():
                 self.missions_lost += 1
             for a in self.agents:
-                a.round_outcome(i + 1, self.missions_lost)
-            leader = (leader + len(self.rounds[i].missions)) % len(self.agents)
+                a.round_outcome(rnd + 1, self.missions_lost)
+            leader = new_round.leader_id
+            rejections = 0
 
         return self.missions_lost < 3
 
@@ -64,17 +97,22 @@ class SimulationRound():
     a representation of a round in the game.
     '''
 
-    def __init__(self, leader_id, agents, spies, rnd):
+    def __init__(self, leader_id, agents, spies, rnd, rejections=0, team=None, votes=None):
         '''
         leader_id is the current leader (next to propose a mission)
         agents is the list of agents in the game,
         spies is the list of indexes of spies in the game
         rnd is what round the game is up to 
+        rejections is the number of proposals already rejected this round
+        team and votes optionally fix the first proposal and some of the votes on it
         '''
         self.leader_id = leader_id
         self.agents = agents
         self.spies = spies
         self.rnd = rnd
+        self.rejections = rejections
+        self.team = team
+        self.votes = votes
         self.missions = []
 
     def play(self):
@@ -85,16 +123,21 @@ class SimulationRound():
         '''
         mission_size = Agent.mission_sizes[len(self.agents)][self.rnd]
         fails_required = Agent.fails_required[len(self.agents)][self.rnd]
-        while len(self.missions) < 5:
-            team = self.agents[self.leader_id].propose_mission(
-                mission_size, fails_required)
+        while self.rejections + len(self.missions) < 5:
+            if self.team is not None:
+                team, self.team = self.team, None
+            else:
+                team = self.agents[self.leader_id].propose_mission(
+                    mission_size, fails_required)
             mission = SimulationMission(self.leader_id, team,
-                                        self.agents, self.spies, self.rnd)
+                                        self.agents, self.spies, self.rnd, self.votes)
+            self.votes = None
             self.missions.append(mission)
             self.leader_id = (self.leader_id + 1) % len(self.agents)
             if mission.is_approved():
                 return mission.is_successful()
-        return mission.is_successful()
+        # Five proposals in a row were rejected
+        return False
 
     def is_successful(self):
         '''
@@ -108,19 +151,21 @@ class SimulationMission():
     a representation of a proposed mission
     '''
 
-    def __init__(self, leader_id, team, agents, spies, rnd):
+    def __init__(self, leader_id, team, agents, spies, rnd, votes=None):
         '''
         leader_id is the id of the agent who proposed the mission
         team is the list of agent indexes on the mission
         agents is the list of agents in the game,
         spies is the list of indexes of spies in the game
         rnd is the round number of the game
+        votes optionally maps players to their (fixed) votes
         '''
         self.leader_id = leader_id
         self.team = team
         self.agents = agents
         self.spies = spies
         self.rnd = rnd
+        self.votes = votes
         self.run()
 
     def run(self):
@@ -129,8 +174,9 @@ class SimulationMission():
         and if the vote is in favour,
         asking spies if they wish to fail the mission
         '''
-        self.votes_for = [i for i in range(
-            len(self.agents)) if self.agents[i].vote(self.team, self.leader_id)]
+        votes = self.votes or {}
+        self.votes_for = [i for i in range(len(self.agents))
+                          if (votes[i] if i in votes else self.agents[i].vote(self.team, self.leader_id))]
         for a in self.agents:
             a.vote_outcome(self.team, self.leader_id, self.votes_for)
         if 2*len(self.votes_for) > len(self.agents):
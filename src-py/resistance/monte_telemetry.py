@@ -0,0 +1,108 @@
+from typing import Any, Dict, IO, List, NamedTuple, Optional, Protocol, Tuple
+from monte_node import Node
+import json
+
+
+class DecisionProbe:
+    """
+    Counters and timings gathered by a search while it makes one decision.
+    Searches only time their steps when given a probe, so telemetry costs nothing when it is off.
+    """
+
+    def __init__(self) -> None:
+        self.iterations = 0
+        self.pondered = 0
+        self.rollouts = 0
+        self.worlds = 0
+        self.select_seconds = 0.0
+        self.simulate_seconds = 0.0
+        self.update_seconds = 0.0
+        # the root's children
+        self.children: List[Node] = []
+
+    def add(self, select: float, simulate: float, update: float, rollouts: int, iterations: int = 1) -> None:
+        """
+        Adds the time iterations iterations (by default one) spent selecting, simulating and updating,
+        and the rollouts they ran.
+        """
+        self.iterations += iterations
+        self.rollouts += rollouts
+        self.select_seconds += select
+        self.simulate_seconds += simulate
+        self.update_seconds += update
+
+
+class DecisionRecord(NamedTuple):
+    """
+    What the search did for one decision.
+    worlds is the number of spy sets rolled out per iteration (flat mode)
+    or sampled from (ismcts mode), and children holds the (action, visits, wins) of each root action.
+    """
+    agent: str
+    phase: str
+    mode: str
+    round: int
+    rejections: int
+    spy: bool
+    iterations: int
+    pondered: int
+    rollouts: int
+    worlds: int
+    nodes: int
+    peak_nodes: int
+    evicted_nodes: int
+    depth: int
+    select_seconds: float
+    simulate_seconds: float
+    update_seconds: float
+    seconds: float
+    children: Tuple[Tuple[Any, int, float], ...]
+
+
+class TelemetrySink(Protocol):
+    """
+    Receives a record for each decision an agent makes.
+    """
+
+    def emit(self, record: DecisionRecord) -> None:
+        ...
+
+
+class MemorySink:
+    """
+    Keeps every record in a list.
+    """
+
+    def __init__(self) -> None:
+        self.records: List[DecisionRecord] = []
+
+    def emit(self, record: DecisionRecord) -> None:
+        self.records.append(record)
+
+
+class JsonLinesSink:
+    """
+    Appends each record to a file as a line of JSON.
+    The file is opened on the first record, so the sink may be sent to worker processes,
+    each of which appends whole lines to the same file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file: Optional[IO[str]] = None
+
+    def emit(self, record: DecisionRecord) -> None:
+        if self.file is None:
+            self.file = open(self.path, 'a', buffering=1)
+        self.file.write(json.dumps(record._asdict()) + '\n')
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {'path': self.path}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state['path'])  # type: ignore[misc]
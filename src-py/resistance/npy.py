@@ -0,0 +1,55 @@
+'''
+Reads and writes arrays in the NumPy .npy format (version 1.0) with the standard library,
+so data can be written for NumPy (numpy.load) without depending on it.
+'''
+
+from typing import Any, Tuple
+import ast
+import os
+
+MAGIC = b'\x93NUMPY\x01\x00'
+# The header (magic, length and dictionary) is padded to a multiple of this many bytes.
+ALIGNMENT = 64
+
+
+def header(descr: Any, shape: Tuple[int, ...]) -> bytes:
+    '''
+    Returns the .npy header for a C-ordered array of shape with the NumPy dtype description descr,
+    e.g. '<f4' or a list of (name, type[, shape]) fields.
+    '''
+    text = repr({'descr': descr, 'fortran_order': False, 'shape': shape})
+    padding = -(len(MAGIC) + 2 + len(text) + 1) % ALIGNMENT
+    text += ' ' * padding + '\n'
+    return MAGIC + len(text).to_bytes(2, 'little') + text.encode('latin1')
+
+
+def write(path: str, descr: Any, shape: Tuple[int, ...], data: bytes) -> None:
+    '''
+    Writes the raw (C-ordered) data of an array to path, replacing the file atomically.
+    '''
+    with open(path + '.tmp', 'wb') as f:
+        f.write(header(descr, shape))
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def read(path: str) -> Tuple[Any, Tuple[int, ...], bytes]:
+    '''
+    Returns the dtype description, shape and raw data of the array in the .npy file at path.
+    '''
+    with open(path, 'rb') as f:
+        return read_bytes(f.read(), path)
+
+
+def read_bytes(data: bytes, name: str = 'array') -> Tuple[Any, Tuple[int, ...], bytes]:
+    '''
+    Returns the dtype description, shape and raw data of the array in data, the contents of a .npy file
+    (named name in errors).
+    '''
+    if data[:6] != MAGIC[:6] or data[6] != 1:
+        raise Exception(f'{name} is not a version 1 .npy file')
+    length = int.from_bytes(data[8:10], 'little')
+    info = ast.literal_eval(data[10:10 + length].decode('latin1'))
+    if info['fortran_order']:
+        raise Exception(f'{name} is in Fortran order')
+    return info['descr'], tuple(info['shape']), data[10 + length:]
@@ -0,0 +1,350 @@
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from array import array
+from contextlib import contextmanager
+from history import HistoryView, MEMBERS, bitmask
+import mmap
+import multiprocessing.util
+import os
+import struct
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore[assignment]
+
+
+# Indexes of the statistics kept for each opponent.
+GAMES_SPY = 0
+GAMES_RESISTANCE = 1
+VOTES_SPY = 2
+YES_SPY = 3
+VOTES_RESISTANCE = 4
+YES_RESISTANCE = 5
+# approved missions a spy was on, and their share of the betrayals on those missions
+MISSIONS_SPY = 6
+BETRAYALS_SPY = 7
+PROPOSALS_SPY = 8
+# spies on the teams proposed, and team places offered, as a spy and as resistance
+PROPOSED_SPIES_SPY = 9
+PROPOSED_PLACES_SPY = 10
+PROPOSALS_RESISTANCE = 11
+PROPOSED_SPIES_RESISTANCE = 12
+PROPOSED_PLACES_RESISTANCE = 13
+NUM_STATS = 14
+
+MAGIC = b'ROM1'
+HEADER = struct.Struct('<4sII')
+NAME_SIZE = 32
+RECORD_SIZE = NAME_SIZE + 8 * NUM_STATS
+
+
+class JoinedSeats:
+    '''
+    The seats that joined a game (the history's game number games) with stores saved to the same file,
+    and how many of them have reported its end.
+    '''
+
+    def __init__(self, games: int) -> None:
+        self.games = games
+        self.seats: List[int] = []
+        self.reported = 0
+
+
+# the seats joined to each game in progress, keyed by the store's key and the game's history
+_tables: Dict[Tuple[Union[str, int], int], JoinedSeats] = {}
+
+
+class OpponentModel:
+    '''
+    Behaviour statistics for opponents, keyed by name and accumulated over many games.
+    Each finished game is attributed to roles using the spies revealed at the end of the game.
+
+    The store is saved as fixed-width records, a name (of at most NAME_SIZE bytes) followed by the statistics as doubles.
+    Saved stores are memory-mapped when loaded, so only the records of opponents that are actually met are read,
+    and a record is only copied into memory when it is updated.
+    Updates are saved every save_interval games and when the process exits, by adding them to the records in the file
+    under a lock, so agents and worker processes sharing a store merge their updates.
+    '''
+
+    def __init__(self, path: Optional[str] = None, save_interval: int = 100) -> None:
+        '''
+        path is the file the store is loaded from (if it exists) and saved to.
+        '''
+        self.path = path
+        self.save_interval = save_interval
+        # stores saved to the same file count a game once between them
+        self.key: Union[str, int] = os.path.realpath(path) if path is not None else id(self)
+        self.unsaved_games = 0
+        self.updated: Dict[str, array] = {}
+        # the statistics each updated record started from, so that saving adds only the difference
+        self.base: Dict[str, array] = {}
+        self.offsets: Dict[str, int] = {}
+        self.mapped: Optional[mmap.mmap] = None
+        # the file mapped, and the number of its records in offsets
+        self.inode = -1
+        self.indexed = 0
+        if path is not None:
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                self.load(path)
+            multiprocessing.util.Finalize(self, self.close, exitpriority=10)
+
+    def load(self, path: str) -> None:
+        with open(path, 'rb') as f:
+            self.map(f)
+        magic, num_stats, records = HEADER.unpack_from(self.mapped)  # type: ignore[arg-type]
+        if magic != MAGIC or num_stats != NUM_STATS:
+            raise Exception(f'{path} is not an opponent model store')
+        self.offsets = {}
+        self.indexed = 0
+        self.index(self.mapped[HEADER.size:HEADER.size + records * RECORD_SIZE])  # type: ignore[index]
+
+    def map(self, f: BinaryIO) -> None:
+        self.release()
+        self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.inode = os.fstat(f.fileno()).st_ino
+
+    def index(self, records: bytes) -> None:
+        '''
+        Adds the names of records, which follow the records already indexed, to offsets.
+        '''
+        for i in range(len(records) // RECORD_SIZE):
+            name = records[i * RECORD_SIZE:i * RECORD_SIZE + NAME_SIZE].rstrip(b'\0').decode()
+            self.offsets[name] = HEADER.size + (self.indexed + i) * RECORD_SIZE + NAME_SIZE
+        self.indexed += len(records) // RECORD_SIZE
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.updated or name in self.offsets
+
+    def names(self) -> Iterable[str]:
+        return {**self.offsets, **self.updated}.keys()
+
+    def stats(self, name: str) -> array:
+        '''
+        Returns the statistics for the opponent name, indexed by the constants in this module.
+        Saved statistics are copied out of the mapped file, so no buffer into it outlives a save.
+        '''
+        if name in self.updated:
+            return self.updated[name]
+        if name in self.offsets and self.mapped is not None:
+            offset = self.offsets[name]
+            return array('d', self.mapped[offset:offset + 8 * NUM_STATS])
+        return array('d', bytes(8 * NUM_STATS))
+
+    def mutable_stats(self, name: str) -> array:
+        if name not in self.updated:
+            encode_name(name)
+            self.base[name] = self.stats(name)
+            self.updated[name] = array('d', self.base[name])
+        return self.updated[name]
+
+    def join(self, history: HistoryView, seat: int) -> None:
+        '''
+        Tells the store that the agent in seat plays the game in history and will report its end to record_game.
+        '''
+        key = (self.key, id(history))
+        if key not in _tables or _tables[key].games != history.games:
+            # Seats of an earlier game on the same history that never reported its end are dropped.
+            _tables[key] = JoinedSeats(history.games)
+        _tables[key].seats.append(seat)
+
+    def record_game(self, history: HistoryView, spies: Iterable[int], seat: Optional[int] = None) -> bool:
+        '''
+        Adds a finished game, given its public history and the spies revealed at the end.
+        Each recorded event is a constant number of updates.
+        If seat is given and joined the game, the game is only recorded for the lowest seat that joined it
+        with a store saved to the same file, so it is counted once however many seats share the store.
+        Returns True if the game was recorded.
+        '''
+        key = (self.key, id(history))
+        joined = _tables.get(key)
+        if seat is not None and joined is not None and joined.games == history.games and seat in joined.seats:
+            joined.reported += 1
+            if joined.reported == len(joined.seats):
+                del _tables[key]
+            if seat != min(joined.seats):
+                return False
+        self.add_game(history, spies)
+        return True
+
+    def add_game(self, history: HistoryView, spies: Iterable[int]) -> None:
+        spy_mask = bitmask(spies)
+        seats = [self.mutable_stats(name) for name in history.names]
+        for p, stats in enumerate(seats):
+            stats[GAMES_SPY if spy_mask >> p & 1 else GAMES_RESISTANCE] += 1
+
+        for i in range(len(history)):
+            team = history.team[i]
+            votes = history.votes[i]
+            for p, stats in enumerate(seats):
+                if spy_mask >> p & 1:
+                    stats[VOTES_SPY] += 1
+                    stats[YES_SPY] += votes >> p & 1
+                else:
+                    stats[VOTES_RESISTANCE] += 1
+                    stats[YES_RESISTANCE] += votes >> p & 1
+
+            spies_on_team = len(MEMBERS[team & spy_mask])
+            leader = seats[history.leader[i]]
+            if spy_mask >> history.leader[i] & 1:
+                leader[PROPOSALS_SPY] += 1
+                leader[PROPOSED_SPIES_SPY] += spies_on_team
+                leader[PROPOSED_PLACES_SPY] += len(MEMBERS[team])
+            else:
+                leader[PROPOSALS_RESISTANCE] += 1
+                leader[PROPOSED_SPIES_RESISTANCE] += spies_on_team
+                leader[PROPOSED_PLACES_RESISTANCE] += len(MEMBERS[team])
+
+            betrayals = history.betrayals[i]
+            if betrayals >= 0 and spies_on_team > 0:
+                # Betrayals are anonymous, so each spy on the team is given an equal share.
+                for p in MEMBERS[team & spy_mask]:
+                    seats[p][MISSIONS_SPY] += 1
+                    seats[p][BETRAYALS_SPY] += betrayals / spies_on_team
+
+    def vote_yes_rate(self, name: str, spy: bool) -> float:
+        '''
+        Returns the estimated probability that name votes for a proposal as a spy (or as resistance).
+        '''
+        stats = self.stats(name)
+        if spy:
+            return (stats[YES_SPY] + 1) / (stats[VOTES_SPY] + 2)
+        return (stats[YES_RESISTANCE] + 1) / (stats[VOTES_RESISTANCE] + 2)
+
+    def betray_rate(self, name: str) -> float:
+        '''
+        Returns the estimated probability that name betrays a mission they are on as a spy.
+        '''
+        stats = self.stats(name)
+        return (stats[BETRAYALS_SPY] + 1) / (stats[MISSIONS_SPY] + 2)
+
+    def proposed_spy_rate(self, name: str, spy: bool) -> float:
+        '''
+        Returns the estimated fraction of team places name gives to spies when proposing as a spy (or as resistance).
+        '''
+        stats = self.stats(name)
+        if spy:
+            return (stats[PROPOSED_SPIES_SPY] + 1) / (stats[PROPOSED_PLACES_SPY] + 2)
+        return (stats[PROPOSED_SPIES_RESISTANCE] + 1) / (stats[PROPOSED_PLACES_RESISTANCE] + 2)
+
+    def autosave(self) -> None:
+        '''
+        Called after each recorded game: saves the store once save_interval games have been recorded since the last save.
+        '''
+        self.unsaved_games += 1
+        if self.path is not None and self.unsaved_games >= self.save_interval:
+            self.save()
+
+    def save(self, path: Optional[str] = None) -> None:
+        '''
+        Adds the updates since the last save to the store's file, writing only the updated records.
+        If path is given, the whole store is instead written to path, replacing the file atomically.
+        '''
+        if path is not None and path != self.path:
+            self.write(path, self.to_bytes())
+            return
+        if self.path is None:
+            raise Exception('No path to save the opponent model to')
+        self.unsaved_games = 0
+        if not self.updated:
+            return
+        with locked(self.path), open(self.path, 'r+b' if os.path.exists(self.path) else 'w+b') as f:
+            header = f.read(HEADER.size)
+            if not header:
+                header = HEADER.pack(MAGIC, NUM_STATS, 0)
+            magic, num_stats, records = HEADER.unpack(header)
+            if magic != MAGIC or num_stats != NUM_STATS:
+                raise Exception(f'{self.path} is not an opponent model store')
+            if os.fstat(f.fileno()).st_ino != self.inode or records < self.indexed:
+                # The file was replaced, so its records are indexed afresh.
+                self.offsets = {}
+                self.indexed = 0
+            # index the records other stores have added since this one last read the file
+            f.seek(HEADER.size + self.indexed * RECORD_SIZE)
+            self.index(f.read((records - self.indexed) * RECORD_SIZE))
+
+            for name, stats in self.updated.items():
+                saved = array('d', bytes(8 * NUM_STATS))
+                if name in self.offsets:
+                    f.seek(self.offsets[name])
+                    saved = array('d', f.read(8 * NUM_STATS))
+                else:
+                    f.seek(HEADER.size + records * RECORD_SIZE)
+                    f.write(encode_name(name))
+                    self.offsets[name] = f.tell()
+                    records += 1
+                    self.indexed += 1
+                base = self.base[name]
+                for i in range(NUM_STATS):
+                    saved[i] += stats[i] - base[i]
+                f.seek(self.offsets[name])
+                f.write(saved.tobytes())
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, NUM_STATS, records))
+            f.flush()
+            self.map(f)
+        self.updated = {}
+        self.base = {}
+
+    def to_bytes(self) -> bytes:
+        '''
+        Returns the store in its file format.
+        '''
+        names = [*self.names()]
+        data = bytearray(HEADER.pack(MAGIC, NUM_STATS, len(names)))
+        for name in names:
+            data += encode_name(name)
+            data += bytes(self.stats(name))
+        return bytes(data)
+
+    def restore(self, data: bytes) -> None:
+        '''
+        Replaces the store, and the file it is saved to, with data returned by to_bytes.
+        '''
+        if self.path is None:
+            raise Exception('No path to restore the opponent model to')
+        self.write(self.path, data)
+        self.updated = {}
+        self.base = {}
+        self.unsaved_games = 0
+        self.load(self.path)
+
+    def write(self, path: str, data: bytes) -> None:
+        with locked(path):
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
+
+    def release(self) -> None:
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+
+    def close(self) -> None:
+        '''
+        Saves any updates (if the store has a file) and releases the memory-mapped file.
+        '''
+        if self.path is not None:
+            self.save()
+        self.release()
+
+
+def encode_name(name: str) -> bytes:
+    '''
+    Returns the name field of a record for name, which must fit in NAME_SIZE bytes.
+    '''
+    encoded = name.encode()
+    if len(encoded) > NAME_SIZE or b'\0' in encoded:
+        raise Exception(f'Opponent name {name!r} does not fit the {NAME_SIZE} byte name field')
+    return encoded + bytes(NAME_SIZE - len(encoded))
+
+
+@contextmanager
+def locked(path: str) -> Iterator[None]:
+    '''
+    Holds an exclusive lock on the store at path (through a path.lock file) while the block runs,
+    if the platform supports file locks.
+    '''
+    with open(path + '.lock', 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
@@ -0,0 +1,190 @@
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple
+from agent import Agent
+from tournament import GameResult, GameSpec, play
+from functools import partial
+import cProfile
+import io
+import multiprocessing
+import multiprocessing.util
+import os
+import pstats
+import tempfile
+
+
+# Functions whose callees are listed in the report, as the hot paths of a tournament.
+HOT_PATHS = ('play', 'simulate', 'rollout', 'propose_mission', 'vote', 'betray')
+
+# Anonymous code objects whose time is folded into their callers in the report.
+ANONYMOUS = ('<listcomp>', '<genexpr>', '<dictcomp>', '<setcomp>', '<lambda>')
+
+Function = Tuple[str, int, str]
+
+
+def sampled(spec: GameSpec, fraction: float) -> bool:
+    '''
+    Returns whether the game spec is among the given fraction of games to profile,
+    decided by a hash of its seed so every worker (and every run) picks the same games.
+    '''
+    return fraction >= 1.0 or (spec.seed * 0x9E3779B97F4A7C15) % 2 ** 64 < fraction * 2 ** 64
+
+
+class ProfiledExecutor:
+    '''
+    Plays games like SerialExecutor (workers == 1) or ParallelExecutor,
+    profiling the sampled fraction of games with cProfile in whichever process plays them.
+    Each worker process dumps its statistics when the pool is shut down,
+    and they are merged into stats, which accumulates over every run.
+    Results are yielded in the same order as the specs.
+    '''
+
+    def __init__(self, workers: Optional[int] = 1, sample: float = 1.0, chunksize: int = 4,
+                 timed: bool = False) -> None:
+        self.workers = workers
+        self.sample = sample
+        self.chunksize = chunksize
+        self.timed = timed
+        self.stats = pstats.Stats()
+        self.games = 0
+        # worker processes whose statistics were merged, including this process if it played games
+        self.processes = 0
+
+    def run(self, agents: Sequence[Agent], specs: Iterable[GameSpec]) -> Iterator[GameResult]:
+        if self.workers == 1:
+            yield from self.run_serial(agents, specs)
+        else:
+            yield from self.run_parallel(agents, specs)
+
+    def run_serial(self, agents: Sequence[Agent], specs: Iterable[GameSpec]) -> Iterator[GameResult]:
+        profiler = cProfile.Profile()
+        games = 0
+        try:
+            for spec in specs:
+                if sampled(spec, self.sample):
+                    profiler.enable()
+                    result = play(agents, spec, self.timed)
+                    profiler.disable()
+                    games += 1
+                else:
+                    result = play(agents, spec, self.timed)
+                yield result
+        finally:
+            if games:
+                profiler.create_stats()
+                self.stats.add(profiler)
+                self.games += games
+                self.processes += 1
+
+    def run_parallel(self, agents: Sequence[Agent], specs: Iterable[GameSpec]) -> Iterator[GameResult]:
+        with tempfile.TemporaryDirectory(prefix='resistance-profile-') as directory:
+            pool = multiprocessing.Pool(self.workers, _init_worker, (agents, self.sample, directory))
+            try:
+                yield from pool.imap(partial(_play_worker, self.timed), specs, self.chunksize)
+                # Closing (rather than terminating) lets each worker exit normally and dump its statistics.
+                pool.close()
+            except BaseException:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+            for name in sorted(os.listdir(directory)):
+                games = int(name.split('-')[0])
+                self.stats.add(os.path.join(directory, name))
+                self.games += games
+                self.processes += 1
+            # the files are deleted with the directory, so are not worth listing in the report
+            self.stats.files = []  # type: ignore[attr-defined]
+
+    def report(self, sort: str = 'cumulative', limit: int = 40) -> str:
+        '''
+        Returns a text summary of the merged statistics: the functions with the most time of their own,
+        with comprehensions and lambdas folded into the functions that call them,
+        the top limit functions sorted by sort, and the callees of the hot paths.
+        '''
+        out = io.StringIO()
+        stats = self.stats
+        stats.stream = out  # type: ignore[attr-defined]
+        out.write(f'{self.games} games profiled in {self.processes} processes\n\n')
+        if not self.games:
+            return out.getvalue()
+
+        total = sum(self_time(stats).values())
+        out.write('Own time, with comprehensions and lambdas folded into their callers\n\n')
+        out.write('   seconds  percent  function\n')
+        folded = sorted(fold_anonymous(stats).items(), key=lambda item: item[1], reverse=True)
+        for func, seconds in folded[:limit]:
+            out.write(f'{seconds:10.3f} {100 * seconds / total:7.1f}%  {pstats.func_std_string(func)}\n')
+        out.write('\n')
+
+        stats.sort_stats(sort).print_stats(limit)
+        hot = '|'.join(HOT_PATHS)
+        stats.print_callees(rf'\((?:{hot})\)$', limit)
+        return out.getvalue()
+
+    def write(self, path: str, sort: str = 'cumulative', limit: int = 40) -> None:
+        '''
+        Dumps the merged statistics to path, for pstats or external viewers such as snakeviz,
+        and the text summary to path.txt.
+        '''
+        self.stats.dump_stats(path)
+        with open(path + '.txt', 'w') as f:
+            f.write(self.report(sort, limit))
+
+
+def self_time(stats: pstats.Stats) -> Dict[Function, float]:
+    return {func: tt for func, (_, _, tt, _, _) in stats.stats.items()}  # type: ignore[attr-defined]
+
+
+def fold_anonymous(stats: pstats.Stats) -> Dict[Function, float]:
+    '''
+    Returns the time spent in each function itself, adding the time of each comprehension or lambda
+    to its callers (recursively), split in proportion to the time of each call.
+    '''
+    raw = stats.stats  # type: ignore[attr-defined]
+    folded: Dict[Function, float] = {}
+
+    def add(func: Function, seconds: float, depth: int = 0) -> None:
+        if func[2] not in ANONYMOUS or depth > 20 or func not in raw:
+            folded[func] = folded.get(func, 0.0) + seconds
+            return
+        callers = raw[func][4]
+        cumulative = sum(c[3] for c in callers.values())
+        if not callers or cumulative <= 0:
+            folded[func] = folded.get(func, 0.0) + seconds
+            return
+        for caller, c in callers.items():
+            add(caller, seconds * c[3] / cumulative, depth + 1)
+
+    for func, (_, _, tt, _, _) in raw.items():
+        add(func, tt)
+    return folded
+
+
+_profiler: Optional[cProfile.Profile] = None
+_worker_agents: Sequence[Agent] = []
+_sample = 1.0
+_games = 0
+
+
+def _init_worker(agents: Sequence[Agent], sample: float, directory: str) -> None:
+    global _profiler, _worker_agents, _sample
+    _worker_agents = agents
+    _sample = sample
+    _profiler = cProfile.Profile()
+    multiprocessing.util.Finalize(None, _dump_worker, (directory,), exitpriority=10)
+
+
+def _play_worker(timed: bool, spec: GameSpec) -> GameResult:
+    global _games
+    if _profiler is None or not sampled(spec, _sample):
+        return play(_worker_agents, spec, timed)
+    _profiler.enable()
+    try:
+        return play(_worker_agents, spec, timed)
+    finally:
+        _profiler.disable()
+        _games += 1
+
+
+def _dump_worker(directory: str) -> None:
+    if _profiler is not None and _games:
+        _profiler.dump_stats(os.path.join(directory, f'{_games}-{os.getpid()}.prof'))
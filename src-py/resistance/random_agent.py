@@ -52,6 +52,33 @@ class RandomAgent(Agent):
         '''
         return random.random() < 0.5
 
+    def new_game_batch(self, lanes, numbers_of_players, player_numbers, spy_lists, histories, randoms=None):
+        '''
+        initialises the games the agent plays in a batch (see batch_game.py),
+        one per lane, as new_game does for a single game.
+        '''
+        self.batch_spy = {lane: seat in spies for lane, seat, spies in zip(lanes, player_numbers, spy_lists)}
+        # the random number generator of each lane, if the lanes are seeded
+        self.batch_random = dict(zip(lanes, randoms)) if randoms is not None else dict.fromkeys(lanes, random)
+
+    def propose_mission_batch(self, lanes, team_sizes, fails_required):
+        '''
+        proposes a mission in each lane, as propose_mission does.
+        '''
+        return [self.batch_random[lane].sample(range(size), size) for lane, size in zip(lanes, team_sizes)]
+
+    def vote_batch(self, lanes, missions, proposers):
+        '''
+        votes on the mission in each lane, as vote does.
+        '''
+        return [self.batch_random[lane].random() < 0.5 for lane in lanes]
+
+    def betray_batch(self, lanes, missions, proposers):
+        '''
+        decides whether to betray the mission in each lane, as betray does.
+        '''
+        return [self.batch_spy[lane] and self.batch_random[lane].random() < 0.3 for lane in lanes]
+
     def vote_outcome(self, mission, proposer, votes):
         '''
         mission is a list of agents to be sent on a mission. 
@@ -0,0 +1,109 @@
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Type, overload
+from collections.abc import Sequence
+from agent import Agent
+import importlib
+
+
+# Agents available by name, as 'module:Class' strings.
+# Modules are only imported the first time one of their agents is created.
+AGENTS: Dict[str, str] = {
+    'random': 'random_agent:RandomAgent',
+    'bayes': 'bayes_agent:BayesAgent',
+    'markov': 'markov_agent:MarkovAgent',
+    'monte': 'monte_agent:MonteAgent',
+}
+
+_classes: Dict[str, Type[Agent]] = {}
+
+
+def register(key: str, target: str) -> None:
+    '''
+    Makes the agent class given by target ('module:Class') available as key.
+    '''
+    if ':' not in target:
+        raise Exception(f'Agent target {target} is not of the form module:Class')
+    AGENTS[key] = target
+    _classes.pop(key, None)
+
+
+def load(key: str) -> Type[Agent]:
+    '''
+    Returns the agent class registered as key, importing its module if necessary.
+    '''
+    if key not in _classes:
+        if key not in AGENTS:
+            raise Exception(f'Unknown agent {key}, expected one of {", ".join(AGENTS)}')
+        module_name, class_name = AGENTS[key].split(':')
+        _classes[key] = getattr(importlib.import_module(module_name), class_name)
+    return _classes[key]
+
+
+class AgentSpec(NamedTuple):
+    '''
+    Everything needed to construct an agent: its registry key, name and extra constructor arguments.
+    '''
+    key: str
+    name: str
+    kwargs: Dict[str, Any] = {}
+
+    def create(self) -> Agent:
+        return load(self.key)(self.name, **self.kwargs)  # type: ignore[call-arg]
+
+
+class Roster(Sequence):
+    '''
+    A sequence of agents built from AgentSpecs.
+    Each agent is only created (and its module imported) when it is first accessed,
+    and only the specs are pickled, so rosters are cheap to send to worker processes.
+    '''
+
+    def __init__(self, specs: Iterable[AgentSpec]) -> None:
+        self.specs = [*specs]
+        self.agents: List[Optional[Agent]] = [None] * len(self.specs)
+
+    @overload
+    def __getitem__(self, index: int) -> Agent: ...
+    @overload
+    def __getitem__(self, index: slice) -> List[Agent]: ...
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        agent = self.agents[index]
+        if agent is None:
+            agent = self.agents[index] = self.specs[index].create()
+        return agent
+
+    def __len__(self) -> int:
+        return len(self.specs)
+
+    def created(self) -> List[Optional[Agent]]:
+        '''
+        Returns each agent if it has been created, or None, without creating any.
+        '''
+        return [*self.agents]
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {'specs': self.specs}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state['specs'])  # type: ignore[misc]
+
+
+def parse_roster(entries: Iterable[str]) -> Roster:
+    '''
+    Builds a roster from entries of the form KEY or KEY:COUNT, e.g. ['random:6', 'monte'].
+    Agents are named by their key and a number, e.g. random1, random2, ...
+    '''
+    specs: List[AgentSpec] = []
+    counts: Dict[str, int] = {}
+    for entry in entries:
+        key, _, count = entry.partition(':')
+        if key not in AGENTS:
+            raise Exception(f'Unknown agent {key}, expected one of {", ".join(AGENTS)}')
+        if count and not count.isdigit():
+            raise Exception(f'Agent count in {entry} is not a number')
+        for _ in range(int(count or 1)):
+            counts[key] = counts.get(key, 0) + 1
+            specs.append(AgentSpec(key, f'{key}{counts[key]}'))
+    return Roster(specs)
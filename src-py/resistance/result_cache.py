@@ -0,0 +1,211 @@
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+from agent import Agent
+from registry import AgentSpec, Roster, load
+from tournament import Executor, GameResult, GameSpec
+from collections import deque
+import ast
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import threading
+
+
+def module_sources(path: str, seen: Optional[Set[str]] = None) -> List[str]:
+    '''
+    Returns the module at path and every module it imports from the same directory, recursively,
+    with the data files each module lists in a DATA_FILES tuple.
+    '''
+    seen = seen if seen is not None else set()
+    if path in seen:
+        return []
+    seen.add(path)
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    directory = os.path.dirname(path)
+    found = [path]
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == 'DATA_FILES'
+                                                for t in node.targets):
+            found += [data for data in (os.path.join(directory, name) for name in ast.literal_eval(node.value))
+                      if os.path.exists(data)]
+    for node in ast.walk(tree):
+        names = []
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module is not None and node.level == 0:
+            names = [node.module]
+        for name in names:
+            imported = os.path.join(directory, name.split('.')[0] + '.py')
+            if os.path.exists(imported):
+                found += module_sources(imported, seen)
+    return found
+
+
+def hash_sources(paths: Iterable[str]) -> bytes:
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        with open(path, 'rb') as f:
+            digest.update(os.path.basename(path).encode() + b'\0' + f.read())
+    return digest.digest()
+
+
+def engine_fingerprint() -> bytes:
+    '''
+    Returns a hash of the game engine's source, which every cached result depends on.
+    '''
+    import game
+    return hash_sources(module_sources(inspect.getfile(game)))
+
+
+def fingerprint(spec: AgentSpec) -> Optional[bytes]:
+    '''
+    Returns a hash of the agent's source (its module and the modules it imports from this package),
+    its name and its constructor arguments,
+    or None if its games cannot be cached because it plays differently from one game to the next.
+    '''
+    agent_class = load(spec.key)
+    if not agent_class.cacheable(spec.kwargs):
+        return None
+    digest = hashlib.sha256(hash_sources(module_sources(inspect.getfile(agent_class))))
+    digest.update(repr((agent_class.__qualname__, spec.name, sorted(spec.kwargs.items()))).encode())
+    return digest.digest()
+
+
+class ResultCache:
+    '''
+    Game results kept in an SQLite database, keyed by the fingerprints of the agents in each seat,
+    the spies and the seed.
+    Results are stored and replayed without their timings or elapsed time,
+    as no time is spent on a replayed game, so replays are left out of timing summaries.
+    When the stored results grow past max_bytes, the least recently used are evicted.
+    The cache may be used from several threads (such as a process pool's task feeder), one at a time.
+    '''
+
+    def __init__(self, path: str, max_bytes: int = 256 << 20) -> None:
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS results '
+                        '(key BLOB PRIMARY KEY, value BLOB NOT NULL, used INTEGER NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+        self.size, last_used = self.db.execute(
+            'SELECT COALESCE(SUM(LENGTH(key) + LENGTH(value)), 0), COALESCE(MAX(used), 0) FROM results').fetchone()
+        self.clock: int = last_used
+        self.used: Dict[bytes, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, fingerprints: Sequence[bytes], spec: GameSpec) -> bytes:
+        digest = hashlib.sha256()
+        for seat in spec.seating:
+            digest.update(fingerprints[seat])
+        digest.update(repr((spec.spies, spec.seed)).encode())
+        return digest.digest()
+
+    def get(self, key: bytes, spec: GameSpec) -> Optional[GameResult]:
+        with self.lock:
+            row = self.db.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.clock += 1
+            self.used[key] = self.clock
+        # Results cached before timings were left out still hold them.
+        return GameResult(spec, *pickle.loads(row[0]))._replace(timings=None, elapsed=0.0)
+
+    def put(self, key: bytes, result: GameResult) -> None:
+        value = pickle.dumps(tuple(result._replace(timings=None, elapsed=0.0)[1:]), pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            # A replaced result (e.g. from a game scheduled twice) no longer counts towards the size.
+            old = self.db.execute('SELECT LENGTH(value) FROM results WHERE key = ?', (key,)).fetchone()
+            if old is not None:
+                self.size -= len(key) + old[0]
+            self.clock += 1
+            self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)', (key, value, self.clock))
+            self.size += len(key) + len(value)
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self) -> None:
+        '''
+        Removes the least recently used results until the cache is back to three quarters of max_bytes.
+        '''
+        with self.lock:
+            self.flush()
+            target = self.max_bytes * 3 // 4
+            rows = self.db.execute('SELECT key, LENGTH(key) + LENGTH(value) FROM results ORDER BY used')
+            evicted = []
+            for key, size in rows:
+                if self.size <= target:
+                    break
+                evicted.append((key,))
+                self.size -= size
+            self.db.executemany('DELETE FROM results WHERE key = ?', evicted)
+
+    def flush(self) -> None:
+        '''
+        Writes out the recency of the results used since the last flush, and commits.
+        '''
+        with self.lock:
+            self.db.executemany('UPDATE results SET used = ? WHERE key = ?',
+                                [(used, key) for key, used in self.used.items()])
+            self.used = {}
+            self.db.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.flush()
+            self.db.close()
+
+
+class CachingExecutor:
+    '''
+    Plays games with another executor, except those whose results are already in the cache.
+    A game is only cached if every agent at the table is cacheable,
+    so changing one agent only replays the games it sits in.
+    The agents must be a Roster, whose specs are fingerprinted.
+
+    Specs are looked up as the executor asks for them, in one run of the executor (so one process pool),
+    so games start at once and the cached results held in memory are those between the games the executor
+    has read ahead (such as a pool's queued tasks), which it holds the specs of anyway.
+    '''
+
+    def __init__(self, executor: Executor, cache: ResultCache) -> None:
+        self.executor = executor
+        self.cache = cache
+
+    def run(self, agents: Sequence[Agent], specs: Iterable[GameSpec]) -> Iterator[GameResult]:
+        if not isinstance(agents, Roster):
+            raise Exception('Cached tournaments need a Roster of agents')
+        engine = engine_fingerprint()
+        fingerprints = [fingerprint(spec) for spec in agents.specs]
+        fingerprints = [engine + f if f is not None else None for f in fingerprints]
+
+        # The specs read so far and not yet yielded, with their keys and any cached results.
+        # The executor may read specs (and so look them up) on another thread, e.g. a process pool's task feeder.
+        pending: Deque[Tuple[GameSpec, Optional[bytes], Optional[GameResult]]] = deque()
+
+        def uncached() -> Iterator[GameSpec]:
+            for spec in specs:
+                key = None
+                cached = None
+                if all(fingerprints[seat] is not None for seat in spec.seating):
+                    key = self.cache.key(fingerprints, spec)  # type: ignore[arg-type]
+                    cached = self.cache.get(key, spec)
+                pending.append((spec, key, cached))
+                if cached is None:
+                    yield spec
+
+        for result in self.executor.run(agents, uncached()):
+            while pending[0][2] is not None:
+                yield pending.popleft()[2]  # type: ignore[misc]
+            _, key, _ = pending.popleft()
+            if key is not None:
+                self.cache.put(key, result)
+            yield result
+        while pending:
+            yield pending.popleft()[2]  # type: ignore[misc]
+        self.cache.flush()
@@ -0,0 +1,300 @@
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+from array import array
+from collections import Counter
+from tournament import GameResult
+import mmap
+import os
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Columns of the store: the array typecode of each value and the number of values per game.
+# Each seat's entry in seats packs agent << 6 | table size << 2 | spy << 1 | won,
+# so every breakdown of wins by agent, role and table size is a count of distinct seat values.
+COLUMNS: Dict[str, Tuple[str, int]] = {
+    'table_size': ('B', 1),
+    'seed': ('I', 1),
+    'spies': ('H', 1),
+    'missions_lost': ('B', 1),
+    'failed_rounds': ('B', 1),
+    'seats': ('H', 10),
+    'seconds': ('f', 10),
+    'decisions': ('I', 10),
+}
+
+EMPTY_SEAT = 0xFFFF
+MAX_AGENTS = 1024
+AGENTS_FILE = 'agents.txt'
+
+
+def pack_seat(agent: int, table_size: int, spy: bool, won: bool) -> int:
+    return agent << 6 | table_size << 2 | spy << 1 | won
+
+
+def unpack_seat(seat: int) -> Tuple[int, int, bool, bool]:
+    '''
+    Returns the agent, table size, whether the agent was a spy, and whether it won.
+    '''
+    return seat >> 6, seat >> 2 & 15, seat & 2 == 2, seat & 1 == 1
+
+
+class Tally(NamedTuple):
+    games: int
+    wins: int
+
+    def win_rate(self) -> float:
+        return self.wins / self.games if self.games else 0.0
+
+
+class ResultStore:
+    '''
+    An append-only store of game results, with one fixed-width record per game.
+
+    Each column is kept in its own file of packed values in a directory,
+    and appended results are buffered in memory until flushed.
+    Columns are memory-mapped when read, so opening a store reads nothing but the agent names,
+    and queries only touch the columns they need.
+    Aggregations count packed values in C (with numpy if it is installed, otherwise collections.Counter),
+    so they run over tens of millions of games without a Python loop per game.
+    '''
+
+    def __init__(self, path: str, buffer_size: int = 4096) -> None:
+        '''
+        path is the directory holding the store, which is created if it does not exist.
+        buffer_size is the number of games buffered before they are written out.
+        '''
+        self.path = path
+        self.buffer_size = buffer_size
+        os.makedirs(path, exist_ok=True)
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        agents_path = os.path.join(path, AGENTS_FILE)
+        if os.path.exists(agents_path):
+            with open(agents_path) as f:
+                for name in f.read().splitlines():
+                    self.ids[name] = len(self.names)
+                    self.names.append(name)
+        self.buffers = {name: array(typecode) for name, (typecode, _) in COLUMNS.items()}
+        self.buffered = 0
+        self.mapped: Dict[str, mmap.mmap] = {}
+        self.pools: Dict[Tuple[str, ...], List[int]] = {}
+        self.rows = self.repair()
+
+    def repair(self) -> int:
+        '''
+        Returns the number of complete games in the column files,
+        truncating any game only partly written (e.g. by a crash mid-flush).
+        '''
+        sizes = {}
+        for name, (typecode, width) in COLUMNS.items():
+            column_path = self.column_path(name)
+            if not os.path.exists(column_path):
+                open(column_path, 'wb').close()
+            sizes[name] = os.path.getsize(column_path) // (array(typecode).itemsize * width)
+        rows = min(sizes.values())
+        for name, (typecode, width) in COLUMNS.items():
+            if sizes[name] > rows:
+                os.truncate(self.column_path(name), rows * array(typecode).itemsize * width)
+        return rows
+
+    def column_path(self, name: str) -> str:
+        return os.path.join(self.path, name + '.col')
+
+    def agent_ids(self, names: Sequence[str]) -> List[int]:
+        '''
+        Returns the store's ids for the agents named names, adding any new names.
+        '''
+        key = tuple(names)
+        if key not in self.pools:
+            new = [name for name in names if name not in self.ids]
+            if len(self.names) + len(new) > MAX_AGENTS:
+                raise Exception(f'A result store holds at most {MAX_AGENTS} agents')
+            if new:
+                with open(os.path.join(self.path, AGENTS_FILE), 'a') as f:
+                    for name in new:
+                        self.ids[name] = len(self.names)
+                        self.names.append(name)
+                        f.write(name + '\n')
+            self.pools[key] = [self.ids[name] for name in names]
+        return self.pools[key]
+
+    def add(self, result: GameResult, names: Sequence[str]) -> None:
+        '''
+        Appends the result of a game played by the pool of agents named names.
+        '''
+        ids = self.agent_ids(names)
+        spec = result.spec
+        n = len(spec.seating)
+        b = self.buffers
+        b['table_size'].append(n)
+        b['seed'].append(spec.seed)
+        b['spies'].append(sum(1 << s for s in spec.spies))
+        b['missions_lost'].append(result.missions_lost)
+        b['failed_rounds'].append(result.failed_rounds)
+        for seat in range(10):
+            if seat < n:
+                spy = seat in spec.spies
+                b['seats'].append(pack_seat(ids[spec.seating[seat]], n, spy, spy == result.spies_win))
+            else:
+                b['seats'].append(EMPTY_SEAT)
+            seconds, decisions = result.timings[seat][:2] if result.timings and seat < n else (0.0, 0)
+            b['seconds'].append(seconds)
+            b['decisions'].append(decisions)
+        self.buffered += 1
+        self.rows += 1
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def recorder(self, names: Sequence[str]) -> Any:
+        '''
+        Returns a Tournament callback adding each result for the pool named names.
+        '''
+        return lambda result: self.add(result, names)
+
+    def flush(self) -> None:
+        if self.buffered == 0:
+            return
+        for name, buffer in self.buffers.items():
+            with open(self.column_path(name), 'ab') as f:
+                buffer.tofile(f)
+            del buffer[:]
+        self.buffered = 0
+        self.unmap()
+
+    def truncate(self, rows: int) -> None:
+        '''
+        Discards every game after the first rows games,
+        e.g. those played since the checkpoint a tournament resumes from.
+        '''
+        if rows > self.rows:
+            raise Exception(f'Result store {self.path} has {self.rows} games, fewer than the {rows} expected')
+        self.flush()
+        for name, (typecode, width) in COLUMNS.items():
+            os.truncate(self.column_path(name), rows * array(typecode).itemsize * width)
+        self.rows = rows
+        self.unmap()
+
+    def unmap(self) -> None:
+        # Columns already handed out keep their maps open until they are released.
+        self.mapped = {}
+
+    def close(self) -> None:
+        self.flush()
+        self.unmap()
+
+    def __enter__(self) -> 'ResultStore':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def column(self, name: str) -> Union[memoryview, Any]:
+        '''
+        Returns the values of a column, memory-mapped from its file, flushing any buffered games first.
+        The values of a column of width w for game g are at [g * w:(g + 1) * w].
+        The result is a numpy array if numpy is installed, otherwise a memoryview.
+        '''
+        self.flush()
+        typecode, width = COLUMNS[name]
+        if name not in self.mapped:
+            if self.rows == 0:
+                return memoryview(array(typecode))
+            with open(self.column_path(name), 'rb') as f:
+                self.mapped[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        size = self.rows * width * array(typecode).itemsize
+        view = memoryview(self.mapped[name])[:size].cast(typecode)
+        if numpy is not None:
+            return numpy.frombuffer(view, dtype=numpy.dtype(typecode))
+        return view
+
+    def seat_counts(self) -> Counter[int]:
+        '''
+        Returns the number of times each packed seat value occurs.
+        '''
+        seats = self.column('seats')
+        if numpy is not None:
+            counts = numpy.bincount(seats, minlength=EMPTY_SEAT + 1)
+            return Counter({int(seat): int(counts[seat]) for seat in numpy.flatnonzero(counts)})
+        return Counter(seats)
+
+    def win_rates(self, by: Iterable[str] = ('agent',)) -> Dict[Tuple[Any, ...], Tally]:
+        '''
+        Returns each agent's games and wins, grouped by any of 'agent', 'spy' and 'table_size'.
+        Keys are tuples of the fields in by, with agents given by name.
+        '''
+        fields = [*by]
+        for field in fields:
+            if field not in ('agent', 'spy', 'table_size'):
+                raise Exception(f'Cannot group results by {field}')
+        games: Counter[Tuple[Any, ...]] = Counter()
+        wins: Counter[Tuple[Any, ...]] = Counter()
+        for seat, count in self.seat_counts().items():
+            if seat == EMPTY_SEAT:
+                continue
+            agent, table_size, spy, won = unpack_seat(seat)
+            values = {'agent': self.names[agent], 'spy': spy, 'table_size': table_size}
+            key = tuple(values[field] for field in fields)
+            games[key] += count
+            if won:
+                wins[key] += count
+        return {key: Tally(games[key], wins[key]) for key in sorted(games, key=repr)}
+
+    def spy_win_rate(self) -> Tally:
+        '''
+        Returns the number of games, and the number the spies won.
+        '''
+        missions_lost = self.column('missions_lost')
+        if numpy is not None:
+            return Tally(self.rows, int(numpy.count_nonzero(missions_lost >= 3)))
+        counts = Counter(missions_lost)
+        return Tally(self.rows, sum(counts[lost] for lost in range(3, 6)))
+
+    def round_failure_rates(self) -> List[float]:
+        '''
+        Returns the fraction of games in which the mission of each round failed.
+        '''
+        counts = Counter(self.column('failed_rounds'))
+        return [sum(c for rounds, c in counts.items() if rounds >> r & 1) / (self.rows or 1) for r in range(5)]
+
+    def decision_seconds(self) -> Dict[str, float]:
+        '''
+        Returns each agent's mean CPU seconds per decision, over the games that were timed.
+        '''
+        seats, seconds, decisions = self.column('seats'), self.column('seconds'), self.column('decisions')
+        if numpy is not None:
+            agents = numpy.where(seats == EMPTY_SEAT, MAX_AGENTS, seats >> 6)
+            total_seconds = numpy.bincount(agents, weights=seconds, minlength=MAX_AGENTS + 1)
+            total_decisions = numpy.bincount(agents, weights=decisions, minlength=MAX_AGENTS + 1)
+        else:
+            total_seconds = [0.0] * (MAX_AGENTS + 1)
+            total_decisions = [0] * (MAX_AGENTS + 1)
+            for seat, s, d in zip(seats, seconds, decisions):
+                if d:
+                    total_seconds[seat >> 6] += s
+                    total_decisions[seat >> 6] += d
+        return {name: float(total_seconds[i] / total_decisions[i])
+                for i, name in enumerate(self.names) if total_decisions[i]}
+
+    def __str__(self) -> str:
+        s = f'{self.rows} games, spies won {self.spy_win_rate().win_rate() * 100:.1f}%\n'
+        for (name, spy), tally in self.win_rates(('agent', 'spy')).items():
+            s += f'{name} as {"spy" if spy else "resistance"}: {tally.win_rate() * 100:.1f}% of {tally.games} games\n'
+        for (table_size, spy), tally in self.win_rates(('table_size', 'spy')).items():
+            if spy:
+                s += f'{table_size} players: spies won {tally.win_rate() * 100:.1f}%\n'
+        return s
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('usage: result_store.py STORE')
+        sys.exit(1)
+    with ResultStore(sys.argv[1]) as store:
+        print(store, end='')
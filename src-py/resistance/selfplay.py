@@ -0,0 +1,241 @@
+'''
+Generates training data by self-play: plays games between a mix of agents across worker processes,
+recording the features of every decision (see features.py) labelled with the outcome of its game,
+and streams the records to fixed-size .npy shards that numpy.load reads as record arrays.
+Rerunning into the same directory continues the shard and game numbering.
+
+e.g. from src-py:
+python3 resistance/selfplay.py data --agents random:4 bayes:4 markov:2 --games 100000 --workers 0
+'''
+
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+from agent import Agent
+from features import FEATURES, encode
+from game import FastGame
+from history import HistoryView, bitmask
+from registry import AGENTS, parse_roster
+from tournament import GameSpec, Scheduler
+import argparse
+import multiprocessing
+import npy
+import os
+import random
+import re
+import struct
+
+
+PROPOSE = 0
+VOTE = 1
+BETRAY = 2
+
+# Each record is the feature vector followed by these fields.
+LABELS = struct.Struct('<BBBBHI')
+RECORD_SIZE = FEATURES + LABELS.size
+DESCR = [
+    ('features', '|u1', (FEATURES,)),
+    # True if the spies won the game
+    ('spies_win', '|u1'),
+    # True if the deciding seat is a spy
+    ('spy', '|u1'),
+    ('seat', '|u1'),
+    # PROPOSE, VOTE or BETRAY
+    ('decision', '|u1'),
+    # the bitmask of the team proposed, or 1 for a yes vote or a betrayal
+    ('action', '<u2'),
+    # number of the game in the data set
+    ('game', '<u4'),
+]
+SHARD = re.compile(r'shard-(\d+)\.npy$')
+
+
+class DecisionRecorder:
+    '''
+    Wraps an agent to record the features of each of its decisions, and what it decided, into records.
+    '''
+
+    def __init__(self, agent: Agent, records: List[Tuple[bytearray, int, int, int, int]]) -> None:
+        self.agent = agent
+        self.records = records
+
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr(self.agent, attribute)
+
+    def __str__(self) -> str:
+        return str(self.agent)
+
+    def __repr__(self) -> str:
+        return repr(self.agent)
+
+    def observe_history(self, history: HistoryView) -> None:
+        self.history = history
+        self.agent.observe_history(history)
+
+    def new_game(self, number_of_players: int, player_number: int, spy_list: List[int]) -> None:
+        self.seat = player_number
+        self.spies = bitmask(spy_list)
+        self.agent.new_game(number_of_players, player_number, spy_list)
+
+    def record(self, decision: int, action: int, features: bytearray) -> None:
+        self.records.append((features, self.spies >> self.seat & 1, self.seat, decision, action))
+
+    def propose_mission(self, team_size: int, fails_required: int = 1) -> List[int]:
+        features = encode(self.history, self.seat, self.spies)
+        team = self.agent.propose_mission(team_size, fails_required)
+        self.record(PROPOSE, bitmask(team), features)
+        return team
+
+    def vote(self, mission: List[int], proposer: int) -> bool:
+        features = encode(self.history, self.seat, self.spies, team=mission, proposer=proposer)
+        vote = self.agent.vote(mission, proposer)
+        self.record(VOTE, bool(vote), features)
+        return vote
+
+    def betray(self, mission: List[int], proposer: int) -> bool:
+        features = encode(self.history, self.seat, self.spies, team=mission, proposer=proposer)
+        betrayed = self.agent.betray(mission, proposer)
+        self.record(BETRAY, bool(betrayed), features)
+        return betrayed
+
+
+def play(agents: Sequence[Agent], spec: GameSpec, game_number: int, game: Optional[FastGame] = None) -> bytes:
+    '''
+    Plays the game described by spec with agents from the pool agents (on game, if given),
+    returning the records of every decision in it.
+    '''
+    random.seed(spec.seed)
+    records: List[Tuple[bytearray, int, int, int, int]] = []
+    if game is None:
+        game = FastGame()
+    game.reset([DecisionRecorder(agents[i], records) for i in spec.seating], spies=spec.spies, shuffle=False)
+    game.play()
+    spies_win = game.missions_lost >= 3
+    data = bytearray()
+    for features, spy, seat, decision, action in records:
+        data += features
+        data += LABELS.pack(spies_win, spy, seat, decision, action, game_number)
+    return bytes(data)
+
+
+class ShardWriter:
+    '''
+    Writes records to shard-NNNNNN.npy files of shard_size records each in directory,
+    holding at most one shard's records in memory.
+    Numbering continues from the shards already in the directory,
+    and a smaller last shard left by an earlier run is filled up before a new shard is started.
+    '''
+
+    def __init__(self, directory: str, shard_size: int = 1 << 20) -> None:
+        self.directory = directory
+        self.shard_size = shard_size
+        os.makedirs(directory, exist_ok=True)
+        shards = sorted(int(m.group(1)) for m in map(SHARD.match, os.listdir(directory)) if m)
+        self.shard = shards[-1] + 1 if shards else 0
+        # the number of the next game, after the last game recorded
+        self.next_game = 0
+        self.buffer = bytearray()
+        # the records added (not counting those of an earlier run)
+        self.records = 0
+        if shards:
+            descr, shape, data = npy.read(self.path(shards[-1]))
+            if descr != DESCR:
+                raise Exception(f'{self.path(shards[-1])} has a different record layout; write to a new directory')
+            if shape[0] > 0:
+                self.next_game = LABELS.unpack_from(data, len(data) - LABELS.size)[-1] + 1
+            if shape[0] < shard_size:
+                # rewritten, with the records added to it, when it fills up or the writer is closed
+                self.shard = shards[-1]
+                self.buffer += data
+
+    def path(self, shard: int) -> str:
+        return os.path.join(self.directory, f'shard-{shard:06d}.npy')
+
+    def add(self, records: bytes) -> None:
+        self.buffer += records
+        self.records += len(records) // RECORD_SIZE
+        size = self.shard_size * RECORD_SIZE
+        while len(self.buffer) >= size:
+            self.write(self.buffer[:size])
+            del self.buffer[:size]
+
+    def write(self, data: bytes) -> None:
+        npy.write(self.path(self.shard), DESCR, (len(data) // RECORD_SIZE,), data)
+        self.shard += 1
+
+    def close(self) -> None:
+        '''
+        Writes the remaining records as a final, smaller shard.
+        '''
+        if self.buffer:
+            self.write(self.buffer)
+            self.buffer = bytearray()
+
+
+_worker_agents: Sequence[Agent] = []
+_worker_game = FastGame()
+
+
+def _init_worker(agents: Sequence[Agent]) -> None:
+    global _worker_agents
+    _worker_agents = agents
+
+
+def _play_worker(job: Tuple[GameSpec, int]) -> bytes:
+    return play(_worker_agents, *job, _worker_game)
+
+
+def generate(agents: Sequence[Agent], scheduler: Scheduler, games: int, writer: ShardWriter,
+             workers: Optional[int] = 1, chunksize: int = 16) -> None:
+    '''
+    Plays games scheduled by scheduler between agents from the pool agents across workers processes,
+    adding their records to writer.
+    '''
+    jobs: Iterator[Tuple[GameSpec, int]] = zip(scheduler.specs(games), range(writer.next_game, writer.next_game + games))
+    if workers == 1:
+        game = FastGame()
+        for job in jobs:
+            writer.add(play(agents, *job, game))
+    else:
+        with multiprocessing.Pool(workers, _init_worker, (agents,)) as pool:
+            for records in pool.imap(_play_worker, jobs, chunksize):
+                writer.add(records)
+    writer.next_game += games
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog='selfplay',
+        description='Generates training data from games between agents.')
+    parser.add_argument('directory', help='directory to write shards to')
+    parser.add_argument('-a', '--agents', nargs='+', default=['random:5', 'bayes:5'], metavar='KEY[:COUNT]',
+                        help='agents in the pool, from: ' + ', '.join(AGENTS) + ' (default: random:5 bayes:5)')
+    parser.add_argument('-p', '--players', nargs='+', type=int, metavar='N',
+                        help='table sizes to play, 5-10 (default: 5 up to the pool size, at most 10)')
+    parser.add_argument('-g', '--games', type=int, default=10000, help='number of games to play (default: 10000)')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='worker processes, 0 for one per CPU (default: 1)')
+    parser.add_argument('--shard-size', type=int, default=1 << 20, metavar='RECORDS',
+                        help='records per shard (default: 1048576)')
+    parser.add_argument('-s', '--seed', type=int, help='seed for the schedule and games (default: random)')
+    args = parser.parse_args(argv)
+
+    try:
+        agents = parse_roster(args.agents)
+        players = args.players or [*range(5, min(len(agents), 10) + 1)]
+        writer = ShardWriter(args.directory, args.shard_size)
+        # A resumed run continues with different games.
+        seed = None if args.seed is None else args.seed + writer.next_game
+        scheduler = Scheduler(len(agents), players, seed)
+    except Exception as e:
+        parser.error(str(e))
+
+    first_shard = writer.shard
+    try:
+        generate(agents, scheduler, args.games, writer, args.workers or None)
+    finally:
+        writer.close()
+    print(f'{writer.records} records from games {writer.next_game - args.games} to {writer.next_game - 1}'
+          f' in shards {first_shard} to {writer.shard - 1} of {args.directory}')
+
+
+if __name__ == '__main__':
+    main()
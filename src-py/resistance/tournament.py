@@ -0,0 +1,449 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Protocol, Sequence, Tuple
+from typing import TYPE_CHECKING
+from agent import Agent
+from game import FastGame
+from registry import Roster
+from functools import partial
+from math import frexp
+from time import perf_counter, thread_time
+import multiprocessing
+import os
+import pickle
+import random
+
+if TYPE_CHECKING:
+    from result_store import ResultStore
+
+
+class GameSpec(NamedTuple):
+    '''
+    A fully specified game for a tournament.
+    seating is the pool index of the agent in each seat (so the table size is len(seating)),
+    spies is the list of seat indexes that are spies,
+    and seed is used to seed the random module before the game is played.
+    '''
+    seating: Tuple[int, ...]
+    spies: Tuple[int, ...]
+    seed: int
+
+
+class GameResult(NamedTuple):
+    '''
+    The outcome of playing a GameSpec.
+    If the game was timed, timings holds the CPU seconds spent in decisions
+    (propose_mission, vote and betray), the number of decisions made,
+    and a histogram of the decisions' CPU times (see DecisionTimer), for each seat.
+    failed_rounds has bit r set if the mission of round r failed,
+    and elapsed is the wall-clock seconds taken to play the game, if known.
+    '''
+    spec: GameSpec
+    spies_win: bool
+    missions_lost: int
+    timings: Optional[Tuple[Tuple[float, int, Tuple[int, ...]], ...]] = None
+    failed_rounds: int = 0
+    elapsed: float = 0.0
+
+
+class Scheduler:
+    '''
+    Generates balanced game specifications from a pool of agents.
+
+    Agents are drawn onto tables of 5-10 players, favouring those who have played the fewest games,
+    and seated to even out how often each agent sits in each seat.
+    Deals are generated in pairs: the second deal of a pair keeps the seating and seed of the first
+    but only makes spies of agents who were resistance in the first,
+    so every agent plays both sides of (near) identical games.
+    '''
+
+    def __init__(self, pool_size: int, table_sizes: Iterable[int] = range(5, 11),
+                 seed: Optional[int] = None, paired: bool = True) -> None:
+        '''
+        pool_size is the number of agents in the pool,
+        table_sizes are the game sizes to cycle through (each must be at most pool_size),
+        seed seeds the schedule and the games in it,
+        and paired is False to disable role-swapped pairs.
+        '''
+        self.table_sizes = [n for n in table_sizes]
+        if len(self.table_sizes) == 0:
+            raise Exception('No table sizes given')
+        for n in self.table_sizes:
+            if n not in Agent.spy_count or n > pool_size:
+                raise Exception(f'Table size {n} out of range for a pool of {pool_size}')
+        self.pool_size = pool_size
+        self.paired = paired
+        self.rng = random.Random(seed)
+        self.games = [0] * pool_size
+        self.spy_games = [0] * pool_size
+        self.seat_games = [[0] * 10 for _ in range(pool_size)]
+        self.deals = 0
+        # the role-swapped half of the last pair, if it is still to be played
+        self.pending: Optional[GameSpec] = None
+
+    def specs(self, games: int) -> Iterator[GameSpec]:
+        '''
+        Yields the next games game specifications.
+        '''
+        for _ in range(games):
+            if self.pending is not None:
+                spec, self.pending = self.pending, None
+                self.record(spec)
+            else:
+                spec = self.deal()
+                self.record(spec)
+                # The mirror's spies are chosen with the first game's roles counted.
+                if self.paired:
+                    self.pending = self.mirror(spec)
+            yield spec
+
+    def deal(self) -> GameSpec:
+        '''
+        Draws a new table: chooses the agents, their seats and the spies.
+        '''
+        n = self.table_sizes[self.deals % len(self.table_sizes)]
+        self.deals += 1
+
+        # Least played agents first, ties broken randomly.
+        order = [*range(self.pool_size)]
+        self.rng.shuffle(order)
+        players = sorted(order, key=lambda a: self.games[a])[:n]
+
+        # Fill seats in a random order, each with the remaining agent who has sat there least.
+        seating = [0] * n
+        seats = [*range(n)]
+        self.rng.shuffle(seats)
+        for seat in seats:
+            agent = min(players, key=lambda a: self.seat_games[a][seat])
+            players.remove(agent)
+            seating[seat] = agent
+
+        spies = self.least_spied(seating, range(n), Agent.spy_count[n])
+        return GameSpec(tuple(seating), spies, self.rng.getrandbits(32))
+
+    def mirror(self, spec: GameSpec) -> GameSpec:
+        '''
+        Returns the role-swapped counterpart of spec, with spies drawn from its resistance.
+        '''
+        resistance = [seat for seat in range(len(spec.seating)) if seat not in spec.spies]
+        spies = self.least_spied(spec.seating, resistance, len(spec.spies))
+        return GameSpec(spec.seating, spies, spec.seed)
+
+    def least_spied(self, seating: Sequence[int], seats: Iterable[int], count: int) -> Tuple[int, ...]:
+        '''
+        Returns count of the seats whose agents have been spies in the smallest fraction of their games.
+        '''
+        candidates = [*seats]
+        self.rng.shuffle(candidates)
+        candidates.sort(key=lambda s: self.spy_games[seating[s]] / (self.games[seating[s]] or 1))
+        return tuple(sorted(candidates[:count]))
+
+    def record(self, spec: GameSpec) -> None:
+        '''
+        Updates the coverage counts with a scheduled game.
+        '''
+        for seat, agent in enumerate(spec.seating):
+            self.games[agent] += 1
+            self.seat_games[agent][seat] += 1
+            if seat in spec.spies:
+                self.spy_games[agent] += 1
+
+
+# Decision times are counted in buckets doubling in width from a microsecond:
+# bucket b holds times below 2 ** b microseconds (and the last bucket every longer time).
+LATENCY_BUCKETS = 25
+
+
+def latency_bucket(seconds: float) -> int:
+    return min(max(frexp(seconds * 1e6)[1], 0), LATENCY_BUCKETS - 1)
+
+
+class DecisionTimer:
+    '''
+    Stands in for an agent in a game, passing every call through
+    and adding up the CPU time spent in its decisions, with a histogram of their times.
+    Decisions are timed with the CPU time of the calling thread only,
+    so agents' background threads (such as MonteAgent's pondering) are not charged to whoever is deciding;
+    an agent's own background CPU time (its background_seconds, if it has them) is added to its total instead.
+    '''
+
+    def __init__(self, agent: Agent) -> None:
+        self.agent = agent
+        self.seconds = 0.0
+        self.decisions = 0
+        self.histogram = [0] * LATENCY_BUCKETS
+        self.background_start: float = getattr(agent, 'background_seconds', 0.0)
+
+    def total_seconds(self) -> float:
+        '''
+        Returns the CPU time of the agent's decisions and of its background work since the timer was created.
+        '''
+        return self.seconds + getattr(self.agent, 'background_seconds', 0.0) - self.background_start
+
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr(self.agent, attribute)
+
+    def __str__(self) -> str:
+        return str(self.agent)
+
+    def __repr__(self) -> str:
+        return repr(self.agent)
+
+    def timed(self, method: Callable[..., Any], *args: Any) -> Any:
+        start = thread_time()
+        result = method(*args)
+        seconds = thread_time() - start
+        self.seconds += seconds
+        self.decisions += 1
+        self.histogram[latency_bucket(seconds)] += 1
+        return result
+
+    def propose_mission(self, team_size: int, fails_required: int = 1) -> List[int]:
+        return self.timed(self.agent.propose_mission, team_size, fails_required)  # type: ignore[no-any-return]
+
+    def vote(self, mission: List[int], proposer: int) -> bool:
+        return self.timed(self.agent.vote, mission, proposer)  # type: ignore[no-any-return]
+
+    def betray(self, mission: List[int], proposer: int) -> bool:
+        return self.timed(self.agent.betray, mission, proposer)  # type: ignore[no-any-return]
+
+
+def play(agents: Sequence[Agent], spec: GameSpec, timed: bool = False, game: Optional[FastGame] = None) -> GameResult:
+    '''
+    Plays the game described by spec with agents from the pool agents,
+    timing each seat's decisions if timed is True.
+    game is a FastGame to reuse, if the caller plays many games.
+    '''
+    start = perf_counter()
+    random.seed(spec.seed)
+    seated: List[Any] = [agents[i] for i in spec.seating]
+    if timed:
+        seated = [DecisionTimer(agent) for agent in seated]
+    if game is None:
+        game = FastGame()
+    game.reset(seated, spies=spec.spies, shuffle=False)
+    game.play()
+    timings = tuple((timer.total_seconds(), timer.decisions, tuple(timer.histogram))
+                    for timer in seated) if timed else None
+    return GameResult(spec, game.missions_lost >= 3, game.missions_lost, timings, game.failed_rounds,
+                      perf_counter() - start)
+
+
+class Executor(Protocol):
+    '''
+    Plays a stream of game specifications, yielding their results in order.
+    '''
+
+    def run(self, agents: Sequence[Agent], specs: Iterable[GameSpec]) -> Iterator[GameResult]:
+        ...
+
+
+class SerialExecutor:
+    '''
+    Plays games one after another in this process.
+    timed is True to time each seat's decisions.
+    '''
+
+    def __init__(self, timed: bool = False) -> None:
+        self.timed = timed
+
+    def run(self, agents: Sequence[Agent], specs: Iterable[GameSpec]) -> Iterator[GameResult]:
+        game = FastGame()
+        for spec in specs:
+            yield play(agents, spec, self.timed, game)
+
+
+_worker_agents: Sequence[Agent] = []
+_worker_game = FastGame()
+
+
+def _init_worker(agents: Sequence[Agent]) -> None:
+    global _worker_agents
+    _worker_agents = agents
+
+
+def _play_worker(timed: bool, spec: GameSpec) -> GameResult:
+    return play(_worker_agents, spec, timed, _worker_game)
+
+
+class ParallelExecutor:
+    '''
+    Plays games across a pool of worker processes, each with its own copy of the agents.
+    Results are yielded in the same order as the specs.
+    timed is True to time each seat's decisions.
+    '''
+
+    def __init__(self, workers: Optional[int] = None, chunksize: int = 4, timed: bool = False) -> None:
+        self.workers = workers
+        self.chunksize = chunksize
+        self.timed = timed
+
+    def run(self, agents: Sequence[Agent], specs: Iterable[GameSpec]) -> Iterator[GameResult]:
+        with multiprocessing.Pool(self.workers, _init_worker, (agents,)) as pool:
+            yield from pool.imap(partial(_play_worker, self.timed), specs, self.chunksize)
+            # Closing (rather than terminating) the pool lets workers run their exit finalizers,
+            # which save what their agents learnt.
+            pool.close()
+            pool.join()
+
+
+class Standing:
+    '''
+    Win counts for one agent in the pool.
+    '''
+
+    def __init__(self) -> None:
+        self.games = 0
+        self.wins = 0
+        self.spy_games = 0
+        self.spy_wins = 0
+
+    def win_rate(self) -> float:
+        return self.wins / self.games if self.games else 0.0
+
+
+class Checkpoint:
+    '''
+    Saves a tournament's progress to a file so that a killed run can be resumed.
+    Saves are at least interval seconds apart (as well as at the end of the run),
+    which bounds the time spent checkpointing however quickly games are played.
+    Each save replaces the file atomically, so a run killed mid-save keeps the previous checkpoint.
+    If the tournament's results are recorded in a result store, each save flushes the store
+    and records its length, and loading truncates the store back to it,
+    so games played after the checkpoint are neither lost nor recorded twice when they are replayed.
+    '''
+
+    def __init__(self, path: str, interval: float = 30.0, results: Optional['ResultStore'] = None) -> None:
+        self.path = path
+        self.interval = interval
+        self.results = results
+        self.last_save = perf_counter()
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'rb') as f:
+            state: Dict[str, Any] = pickle.load(f)
+        if self.results is not None and 'result_rows' in state:
+            self.results.truncate(state['result_rows'])
+        return state
+
+    def due(self) -> bool:
+        return perf_counter() - self.last_save >= self.interval
+
+    def save(self, state: Dict[str, Any]) -> None:
+        if self.results is not None:
+            self.results.flush()
+            state = {**state, 'result_rows': len(self.results)}
+        with open(self.path + '.tmp', 'wb') as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(self.path + '.tmp', self.path)
+        self.last_save = perf_counter()
+
+
+class Tournament:
+    '''
+    Plays scheduled games between a pool of agents and ranks them by the percentage of games won,
+    regardless of whether they were a spy or a resistance member.
+    '''
+
+    def __init__(self, agents: Sequence[Agent], scheduler: Scheduler, executor: Optional[Executor] = None) -> None:
+        self.agents = agents
+        self.scheduler = scheduler
+        self.executor: Executor = executor or SerialExecutor()
+        self.standings = [Standing() for _ in range(len(agents))]
+        self.played = 0
+        # The schedule is resumed by replaying it from the start,
+        # as parallel executors draw specs ahead of the results they have returned.
+        self.schedule_start = pickle.dumps(scheduler)
+
+    def run(self, games: int, callback: Optional[Callable[[GameResult], None]] = None,
+            checkpoint: Optional[Checkpoint] = None) -> List[Standing]:
+        '''
+        Plays until games games have been played, calling callback with each result, and returns the standings.
+        With a checkpoint, the tournament first resumes from it if it has been saved,
+        and saves its progress to it as it goes.
+        '''
+        if checkpoint is not None:
+            state = checkpoint.load()
+            if state is not None:
+                self.restore(state)
+        for result in self.executor.run(self.agents, self.scheduler.specs(games - self.played)):
+            self.add(result)
+            self.played += 1
+            if callback:
+                callback(result)
+            if checkpoint is not None and checkpoint.due():
+                checkpoint.save(self.state())
+        if checkpoint is not None:
+            checkpoint.save(self.state())
+        return self.standings
+
+    def state(self) -> Dict[str, Any]:
+        '''
+        Returns the tournament's progress: the games played, the standings, where the schedule started,
+        and the learning state of the agents in this process.
+        Agents playing in worker processes keep their learning state there, so it is not included.
+        '''
+        agents = self.agents.created() if isinstance(self.agents, Roster) else [*self.agents]
+        return {
+            'names': self.names(),
+            'played': self.played,
+            'standings': self.standings,
+            'schedule_start': self.schedule_start,
+            'learning': [agent.learning_state() if agent is not None else None for agent in agents],
+        }
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        '''
+        Resumes the tournament from a state returned by state.
+        '''
+        if len(state['standings']) != len(self.agents) or state.get('names', self.names()) != self.names():
+            raise Exception('Checkpoint is for a different pool of agents')
+        self.played = state['played']
+        self.standings = state['standings']
+        self.schedule_start = state['schedule_start']
+        self.scheduler = pickle.loads(self.schedule_start)
+        for _ in self.scheduler.specs(self.played):
+            pass
+        # Only the agents with learning state are created, so the others are still only created if they play.
+        for i, learnt in enumerate(state['learning']):
+            if learnt is not None:
+                self.agents[i].restore_learning_state(learnt)
+
+    def names(self) -> List[str]:
+        '''
+        Returns the names of the agents in the pool, without creating any.
+        '''
+        if isinstance(self.agents, Roster):
+            return [spec.name for spec in self.agents.specs]
+        return [agent.name for agent in self.agents]
+
+    def add(self, result: GameResult) -> None:
+        '''
+        Adds the result of a game to the standings.
+        '''
+        for seat, agent in enumerate(result.spec.seating):
+            standing = self.standings[agent]
+            spy = seat in result.spec.spies
+            won = spy == result.spies_win
+            standing.games += 1
+            standing.wins += won
+            if spy:
+                standing.spy_games += 1
+                standing.spy_wins += won
+
+    def ranking(self) -> List[Tuple[Agent, Standing]]:
+        '''
+        Returns (agent, standing) pairs, best win rate first.
+        '''
+        pairs = [*zip(self.agents, self.standings)]
+        return sorted(pairs, key=lambda pair: pair[1].win_rate(), reverse=True)
+
+    def __str__(self) -> str:
+        s = ''
+        for agent, standing in self.ranking():
+            spy_rate = standing.spy_wins / standing.spy_games if standing.spy_games else 0.0
+            resistance_games = standing.games - standing.spy_games
+            resistance_rate = (standing.wins - standing.spy_wins) / resistance_games if resistance_games else 0.0
+            s += f'{agent}: {standing.win_rate() * 100:.1f}% of {standing.games} games' \
+                + f' (spy {spy_rate * 100:.1f}%, resistance {resistance_rate * 100:.1f}%)\n'
+        return s
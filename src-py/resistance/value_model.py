@@ -0,0 +1,285 @@
+'''
+Leaf evaluators for MonteAgent's search, which score a batch of search leaves (each a state and a world,
+or set of spies), and a small value model that scores them from their features (see features.py)
+instead of playing out a rollout for each.
+
+The model is a linear model or a multilayer perceptron with ReLU hidden layers and a sigmoid output,
+giving the probability that the resistance wins. Its weights are an .npz file of float32 arrays
+w0, b0, w1, b1, ..., where wi has a row for each input of layer i and a column for each output.
+A world is scored as seen by one of its spies, as spies know the spies,
+so the model should be trained on the records of spy seats.
+Inference uses numpy if it is installed, otherwise plain Python.
+
+value_model.py can also fit a linear model to self-play shards (see selfplay.py), e.g. from src-py:
+python3 resistance/value_model.py fit data value.npz --epochs 3
+'''
+
+from typing import Dict, List, NamedTuple, Optional, Protocol, Sequence, Tuple
+from array import array
+from agent import Agent
+from features import FEATURES, encode_public, set_private
+from history import GameState, HistoryView, MEMBERS
+from monte_simulation import SimulationGame
+from math import exp
+import argparse
+import npy
+import os
+import random
+import sys
+import zipfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Leaf(NamedTuple):
+    '''
+    A search leaf: the state of the game at a proposal, the bitmask of its complete rounds that failed,
+    and the bitmask of the spies in its world.
+    '''
+    state: GameState
+    failed: int
+    spies: int
+
+
+class LeafEvaluator(Protocol):
+    '''
+    Scores search leaves: given the public history of the game up to the search's root and a batch of leaves
+    reached from it, returns the probability that the resistance wins from each.
+    '''
+
+    def evaluate(self, history: HistoryView, leaves: Sequence[Leaf]) -> List[float]:
+        ...
+
+
+class RolloutEvaluator:
+    '''
+    Evaluates each leaf by playing out the rest of the game at random (or with agents, if given).
+    '''
+
+    def __init__(self, agents: Optional[List[Agent]] = None) -> None:
+        self.agents = agents
+
+    def evaluate(self, history: HistoryView, leaves: Sequence[Leaf]) -> List[float]:
+        return [float(SimulationGame(leaf.state, MEMBERS[leaf.spies], self.agents).simulate()) for leaf in leaves]
+
+
+def sigmoid(x: float) -> float:
+    return 1 / (1 + exp(-x)) if x >= 0 else exp(x) / (1 + exp(x))
+
+
+class ValueModel:
+    '''
+    A value model with the given layers of (weights, biases),
+    each weights matrix stored row by row in an array of floats.
+    '''
+
+    def __init__(self, layers: Sequence[Tuple[array, array]]) -> None:
+        if not layers:
+            raise Exception('A value model needs at least one layer')
+        inputs = FEATURES
+        for i, (weights, biases) in enumerate(layers):
+            if len(weights) != inputs * len(biases):
+                raise Exception(f'Layer {i} of the value model has {len(weights)} weights, '
+                                f'expected {inputs} x {len(biases)}')
+            inputs = len(biases)
+        if inputs != 1:
+            raise Exception('The value model must have one output')
+        self.layers = [(array('f', weights), array('f', biases)) for weights, biases in layers]
+        # the matrices as numpy arrays, if numpy is installed
+        self.matrices = [(numpy.frombuffer(weights, dtype=numpy.float32).reshape(-1, len(biases)),
+                          numpy.frombuffer(biases, dtype=numpy.float32))
+                         for weights, biases in self.layers] if numpy is not None else None
+
+    @classmethod
+    def load(cls, path: str) -> 'ValueModel':
+        layers = []
+        with zipfile.ZipFile(path) as z:
+            names = set(z.namelist())
+            while f'w{len(layers)}.npy' in names:
+                arrays = []
+                for name in (f'w{len(layers)}.npy', f'b{len(layers)}.npy'):
+                    descr, _, data = npy.read_bytes(z.read(name), f'{path}:{name}')
+                    if descr != '<f4':
+                        raise Exception(f'{path}:{name} is not float32')
+                    arrays.append(array('f', data))
+                if sys.byteorder == 'big':
+                    for a in arrays:
+                        a.byteswap()
+                layers.append((arrays[0], arrays[1]))
+        return cls(layers)
+
+    def save(self, path: str) -> None:
+        with zipfile.ZipFile(path + '.tmp', 'w') as z:
+            for i, (weights, biases) in enumerate(self.layers):
+                for name, values, shape in ((f'w{i}', weights, (len(weights) // len(biases), len(biases))),
+                                            (f'b{i}', biases, (len(biases),))):
+                    data = array('f', values)
+                    if sys.byteorder == 'big':
+                        data.byteswap()
+                    z.writestr(f'{name}.npy', npy.header('<f4', shape) + data.tobytes())
+        os.replace(path + '.tmp', path)
+
+    def predict(self, batch: Sequence[bytes]) -> List[float]:
+        '''
+        Returns the probability that the resistance wins for each feature vector in batch.
+        '''
+        if self.matrices is not None:
+            x = numpy.frombuffer(b''.join(batch), dtype=numpy.uint8).reshape(len(batch), FEATURES)
+            x = x.astype(numpy.float32)
+            for i, (weights, biases) in enumerate(self.matrices):
+                x = x @ weights + biases
+                if i < len(self.matrices) - 1:
+                    numpy.maximum(x, 0, out=x)
+            return (1 / (1 + numpy.exp(-x[:, 0]))).tolist()  # type: ignore[no-any-return]
+        return [self.predict_one(features) for features in batch]
+
+    def predict_one(self, features: bytes) -> float:
+        return self.finish(self.first_layer(features))
+
+    def first_layer(self, features: bytes) -> List[float]:
+        '''
+        Returns the pre-activations of the first layer for features.
+        '''
+        weights, biases = self.layers[0]
+        width = len(biases)
+        x = [*biases]
+        # Features are mostly zero, so only the rows of those set are added.
+        for i, value in enumerate(features):
+            if value:
+                row = i * width
+                for j in range(width):
+                    x[j] += value * weights[row + j]
+        return x
+
+    def finish(self, x: List[float]) -> float:
+        '''
+        Returns the output of the model from the pre-activations x of its first layer.
+        '''
+        for weights, biases in self.layers[1:]:
+            x = [max(v, 0.0) for v in x]
+            width = len(biases)
+            y = [*biases]
+            for i, value in enumerate(x):
+                if value:
+                    row = i * width
+                    for j in range(width):
+                        y[j] += value * weights[row + j]
+            x = y
+        return sigmoid(x[0])
+
+
+class ModelEvaluator:
+    '''
+    Evaluates a batch of leaves with a value model, in one call to the model.
+    As the score depends only on the history and the leaf,
+    the scores of every leaf seen since the history last changed are kept
+    for the search iterations that reach it again.
+    '''
+
+    def __init__(self, model: ValueModel) -> None:
+        self.model = model
+        self.position: Optional[Tuple[int, int]] = None
+        self.values: Dict[Leaf, float] = {}
+
+    def evaluate(self, history: HistoryView, leaves: Sequence[Leaf]) -> List[float]:
+        position = (id(history), len(history))
+        if position != self.position:
+            self.position = position
+            self.values = {}
+        missing = [*dict.fromkeys(leaf for leaf in leaves if leaf not in self.values)]
+        if missing:
+            batch = []
+            publics: Dict[Tuple[GameState, int], bytearray] = {}
+            for leaf in missing:
+                key = (leaf.state, leaf.failed)
+                if key not in publics:
+                    publics[key] = encode_public(history, leaf.state, leaf.failed)
+                features = publics[key]
+                set_private(features, MEMBERS[leaf.spies][0], leaf.spies)
+                batch.append(bytes(features))
+            for leaf, value in zip(missing, self.model.predict(batch)):
+                self.values[leaf] = value
+        return [self.values[leaf] for leaf in leaves]
+
+
+def load_evaluator(path: str) -> ModelEvaluator:
+    return ModelEvaluator(ValueModel.load(path))
+
+
+def spy_records(directory: str, limit: Optional[int] = None) -> Tuple[List[bytes], List[int]]:
+    '''
+    Returns the feature vectors of the records of spy seats in the self-play shards in directory,
+    and whether the resistance won each game, up to limit records.
+    '''
+    from selfplay import DESCR, LABELS, RECORD_SIZE, SHARD
+    features, labels = [], []
+    for name in sorted(os.listdir(directory)):
+        if not SHARD.match(name):
+            continue
+        descr, _, data = npy.read(os.path.join(directory, name))
+        if descr != DESCR:
+            raise Exception(f'{name} in {directory} has a different record layout')
+        for offset in range(0, len(data), RECORD_SIZE):
+            spies_win, spy = LABELS.unpack_from(data, offset + FEATURES)[:2]
+            if spy:
+                features.append(data[offset:offset + FEATURES])
+                labels.append(1 - spies_win)
+                if limit is not None and len(features) >= limit:
+                    return features, labels
+    return features, labels
+
+
+def fit_linear(features: Sequence[bytes], labels: Sequence[int], epochs: int = 3, rate: float = 0.01,
+               l2: float = 1e-6, seed: int = 0) -> ValueModel:
+    '''
+    Fits a linear (logistic regression) value model by stochastic gradient descent.
+    '''
+    weights = [0.0] * FEATURES
+    bias = 0.0
+    order = [*range(len(features))]
+    rng = random.Random(seed)
+    for _ in range(epochs):
+        rng.shuffle(order)
+        for k in order:
+            x = features[k]
+            active = [(i, v) for i, v in enumerate(x) if v]
+            error = sigmoid(bias + sum(weights[i] * v for i, v in active)) - labels[k]
+            bias -= rate * error
+            for i, v in active:
+                weights[i] -= rate * (error * v + l2 * weights[i])
+    return ValueModel([(array('f', weights), array('f', [bias]))])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog='value_model',
+        description='Fits a linear value model to self-play shards.')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    fit = subcommands.add_parser('fit', help='fit a linear model to the spy records of self-play shards')
+    fit.add_argument('directory', help='directory of shards written by selfplay.py')
+    fit.add_argument('output', help='.npz file to write the weights to')
+    fit.add_argument('-e', '--epochs', type=int, default=3, help='passes over the records (default: 3)')
+    fit.add_argument('-r', '--rate', type=float, default=0.01, help='learning rate (default: 0.01)')
+    fit.add_argument('-n', '--limit', type=int, help='most records to fit to (default: all)')
+    fit.add_argument('--holdout', type=float, default=0.1,
+                     help='fraction of records to hold out to report accuracy (default: 0.1)')
+    args = parser.parse_args(argv)
+
+    features, labels = spy_records(args.directory, args.limit)
+    if not features:
+        parser.error(f'No spy records in {args.directory}')
+    split = len(features) - int(len(features) * args.holdout)
+    model = fit_linear(features[:split], labels[:split], args.epochs, args.rate)
+    model.save(args.output)
+    if split < len(features):
+        predictions = model.predict(features[split:])
+        correct = sum((p > 0.5) == bool(y) for p, y in zip(predictions, labels[split:]))
+        print(f'{correct / (len(features) - split):.1%} of {len(features) - split} held out outcomes predicted')
+    print(f'Fitted to {split} records, weights in {args.output}')
+
+
+if __name__ == '__main__':
+    main()
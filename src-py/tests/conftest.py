@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The package's modules import each other as top-level modules (e.g. `from agent import Agent`),
+# as when it is run with `python3 resistance` from src-py.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'resistance'))
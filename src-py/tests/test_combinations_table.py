@@ -0,0 +1,43 @@
+from itertools import combinations
+from combinations_table import CombinationTable, SPY_SETS, TEAMS, spies_on_team
+from history import MEMBERS, bitmask
+import pytest
+
+
+@pytest.mark.parametrize('n', range(5, 11))
+def test_rank_unrank_round_trip(n: int) -> None:
+    for k in range(n + 1):
+        table = CombinationTable(n, k)
+        assert len(table) == len([*combinations(range(n), k)])
+        for r in range(len(table)):
+            assert table.rank(table.unrank(r)) == r
+            assert MEMBERS[table.unrank(r)] == table.members[r]
+
+
+def test_subsets_are_in_lexicographic_order() -> None:
+    table = CombinationTable(6, 3)
+    assert table.members == sorted(table.members)
+    assert table.unrank(0) == bitmask([0, 1, 2])
+    assert table.unrank(len(table) - 1) == bitmask([3, 4, 5])
+
+
+def test_rank_of_wrong_size_subset() -> None:
+    table = CombinationTable(7, 3)
+    assert table.rank(bitmask([0, 1])) == -1
+    assert table.rank(bitmask([0, 1, 2, 3])) == -1
+
+
+def test_membership() -> None:
+    table = CombinationTable(5, 2)
+    for p in range(5):
+        assert [*table.membership[p]] == [int(p in members) for members in table.members]
+
+
+@pytest.mark.parametrize('n', range(5, 11))
+def test_spies_on_team(n: int) -> None:
+    for size, teams in TEAMS[n].items():
+        team = teams.unrank(len(teams) // 2)
+        counts = spies_on_team(n, team)
+        assert len(counts) == len(SPY_SETS[n])
+        for r, spies in enumerate(SPY_SETS[n].masks):
+            assert counts[r] == bin(team & spies).count('1')
@@ -0,0 +1,29 @@
+from array import array
+import npy
+import pytest
+
+
+def test_round_trip(tmp_path) -> None:
+    path = str(tmp_path / 'a.npy')
+    data = array('f', [0.5, -1.0, 2.0, 3.5, 4.0, 5.0]).tobytes()
+    npy.write(path, '<f4', (2, 3), data)
+    assert npy.read(path) == ('<f4', (2, 3), data)
+    assert not (tmp_path / 'a.npy.tmp').exists()
+
+
+def test_header_is_aligned() -> None:
+    for shape in ((0,), (7,), (12345, 67)):
+        assert len(npy.header('<f4', shape)) % npy.ALIGNMENT == 0
+
+
+def test_record_descr_round_trip(tmp_path) -> None:
+    path = str(tmp_path / 'records.npy')
+    descr = [('features', '|u1', (3,)), ('label', '<u2')]
+    data = bytes([1, 2, 3, 4, 0, 5, 6, 7, 8, 0])
+    npy.write(path, descr, (2,), data)
+    assert npy.read(path) == (descr, (2,), data)
+
+
+def test_rejects_other_files() -> None:
+    with pytest.raises(Exception, match='not a version 1 .npy file'):
+        npy.read_bytes(b'PK\x03\x04 not an array', 'a.zip')
@@ -0,0 +1,100 @@
+from bayes_agent import BayesAgent
+from game import FastGame
+from history import GameHistory
+from opponent_model import GAMES_RESISTANCE, GAMES_SPY, OpponentModel, VOTES_SPY, YES_SPY
+from random_agent import RandomAgent
+import random
+
+
+def play(history: GameHistory, names: list, spies: list) -> None:
+    history.reset(len(names), names)
+    history.propose(0, [0, 1], [0, 1, 2])
+    history.mission(1 if 0 in spies or 1 in spies else 0)
+
+
+def games(model: OpponentModel, name: str) -> float:
+    stats = model.stats(name)
+    return stats[GAMES_SPY] + stats[GAMES_RESISTANCE]
+
+
+def test_record_game(tmp_path) -> None:
+    model = OpponentModel()
+    history = GameHistory(5)
+    play(history, ['a', 'b', 'c', 'd', 'e'], [0, 3])
+    assert model.record_game(history.view(), [0, 3])
+    assert model.stats('a')[GAMES_SPY] == 1
+    assert model.stats('b')[GAMES_RESISTANCE] == 1
+    # a voted for the proposal as a spy, d against it
+    assert model.stats('a')[VOTES_SPY] == 1 and model.stats('a')[YES_SPY] == 1
+    assert model.stats('d')[VOTES_SPY] == 1 and model.stats('d')[YES_SPY] == 0
+
+
+def test_save_and_load(tmp_path) -> None:
+    path = str(tmp_path / 'model.rom')
+    model = OpponentModel(path)
+    history = GameHistory(5)
+    for _ in range(3):
+        play(history, ['a', 'b', 'c', 'd', 'e'], [0, 3])
+        model.record_game(history.view(), [0, 3])
+    model.save()
+    loaded = OpponentModel(path)
+    assert sorted(loaded.names()) == ['a', 'b', 'c', 'd', 'e']
+    assert loaded.stats('a') == model.stats('a')
+    assert games(loaded, 'e') == 3
+
+
+def test_saves_merge(tmp_path) -> None:
+    path = str(tmp_path / 'model.rom')
+    first, second = OpponentModel(path), OpponentModel(path)
+    history = GameHistory(5)
+    play(history, ['a', 'b', 'c', 'd', 'e'], [0, 3])
+    first.record_game(history.view(), [0, 3])
+    play(history, ['a', 'b', 'c', 'd', 'f'], [1, 2])
+    second.record_game(history.view(), [1, 2])
+    second.record_game(history.view(), [1, 2])
+    first.save()
+    second.save()
+    # saving again adds nothing
+    first.save()
+
+    merged = OpponentModel(path)
+    assert games(merged, 'a') == 3
+    assert games(merged, 'e') == 1
+    assert games(merged, 'f') == 2
+    assert merged.stats('b')[GAMES_SPY] == 2 and merged.stats('b')[GAMES_RESISTANCE] == 1
+
+
+def test_save_to_another_file(tmp_path) -> None:
+    model = OpponentModel(str(tmp_path / 'model.rom'))
+    history = GameHistory(5)
+    play(history, ['a', 'b', 'c', 'd', 'e'], [0, 3])
+    model.record_game(history.view(), [0, 3])
+    model.save(str(tmp_path / 'copy.rom'))
+    assert games(OpponentModel(str(tmp_path / 'copy.rom')), 'a') == 1
+
+
+def test_restore(tmp_path) -> None:
+    model = OpponentModel(str(tmp_path / 'model.rom'))
+    history = GameHistory(5)
+    play(history, ['a', 'b', 'c', 'd', 'e'], [0, 3])
+    model.record_game(history.view(), [0, 3])
+    snapshot = model.to_bytes()
+    model.record_game(history.view(), [0, 3])
+    model.restore(snapshot)
+    assert games(model, 'a') == 1
+    assert games(OpponentModel(str(tmp_path / 'model.rom')), 'a') == 1
+
+
+def test_shared_store_records_each_game_once(tmp_path) -> None:
+    path = str(tmp_path / 'shared.rom')
+    agents = [BayesAgent(f'bayes{i}', model_path=path) for i in range(3)] + [RandomAgent('r1'), RandomAgent('r2')]
+    random.seed(1)
+    game = FastGame()
+    for _ in range(10):
+        game.reset(agents)
+        game.play()
+    for agent in agents[:3]:
+        agent.model.save()  # type: ignore[attr-defined]
+    model = OpponentModel(path)
+    assert {name: games(model, name) for name in model.names()} == dict.fromkeys(
+        ['bayes0', 'bayes1', 'bayes2', 'r1', 'r2'], 10)
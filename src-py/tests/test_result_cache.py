@@ -0,0 +1,76 @@
+from registry import parse_roster
+from result_cache import CachingExecutor, ResultCache
+from tournament import GameResult, GameSpec, Scheduler, SerialExecutor
+import pytest
+
+
+def outcomes(results: list) -> list:
+    return [(r.spec, r.spies_win, r.missions_lost, r.failed_rounds) for r in results]
+
+
+def test_put_and_get(tmp_path) -> None:
+    cache = ResultCache(str(tmp_path / 'cache.db'))
+    spec = GameSpec((0, 1, 2, 3, 4), (1, 3), 7)
+    key = cache.key([b'a', b'b', b'c', b'd', b'e'], spec)
+    assert cache.get(key, spec) is None
+    cache.put(key, GameResult(spec, True, 3, ((0.5, 10, (1,)),) * 5, 0b10110, 1.25))
+    # replayed results carry no timings
+    assert cache.get(key, spec) == GameResult(spec, True, 3, None, 0b10110, 0.0)
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+    reopened = ResultCache(str(tmp_path / 'cache.db'))
+    assert reopened.get(key, spec) is not None
+
+
+def test_keys_depend_on_seats_spies_and_seed(tmp_path) -> None:
+    cache = ResultCache(str(tmp_path / 'cache.db'))
+    fingerprints = [b'a', b'b', b'c', b'd', b'e', b'f']
+    spec = GameSpec((0, 1, 2, 3, 4), (1, 3), 7)
+    keys = {cache.key(fingerprints, s) for s in (spec, spec._replace(seating=(5, 1, 2, 3, 4)),
+                                                  spec._replace(spies=(0, 3)), spec._replace(seed=8))}
+    assert len(keys) == 4
+
+
+def test_eviction(tmp_path) -> None:
+    cache = ResultCache(str(tmp_path / 'cache.db'), max_bytes=4000)
+    specs = [GameSpec((0, 1, 2, 3, 4), (1, 3), seed) for seed in range(200)]
+    keys = [cache.key([b'a'] * 5, spec) for spec in specs]
+    for key, spec in zip(keys, specs):
+        cache.put(key, GameResult(spec, False, 1))
+        cache.get(keys[0], specs[0])
+    assert cache.size <= 4000
+    # the most recently used results are kept
+    assert cache.get(keys[0], specs[0]) is not None
+    assert cache.get(keys[-1], specs[-1]) is not None
+    assert cache.get(keys[1], specs[1]) is None
+
+
+def test_caching_executor_replays_results_in_order(tmp_path) -> None:
+    agents = parse_roster(['random:4', 'bayes:2'])
+    specs = [*Scheduler(len(agents), [5, 6], seed=1).specs(100)]
+    played = [*SerialExecutor().run(agents, specs)]
+
+    cache = ResultCache(str(tmp_path / 'cache.db'))
+    first = [*CachingExecutor(SerialExecutor(), cache).run(agents, specs[::2])]
+    assert outcomes(first) == outcomes(played[::2])
+    second = [*CachingExecutor(SerialExecutor(timed=True), cache).run(agents, specs)]
+    assert outcomes(second) == outcomes(played)
+    assert cache.hits == 50
+    assert all(result.timings is None for result in second[::2])
+    assert all(result.timings is not None for result in second[1::2])
+
+
+def test_learning_agents_are_not_cached(tmp_path) -> None:
+    agents = parse_roster(['random:5'])
+    agents.specs[0] = agents.specs[0]._replace(key='bayes', kwargs={'model_path': str(tmp_path / 'model.rom')})
+    specs = [*Scheduler(len(agents), [5], seed=1).specs(10)]
+    cache = ResultCache(str(tmp_path / 'cache.db'))
+    for _ in range(2):
+        [*CachingExecutor(SerialExecutor(), cache).run(agents, specs)]
+    assert cache.hits == 0
+
+
+def test_caching_needs_a_roster(tmp_path) -> None:
+    cache = ResultCache(str(tmp_path / 'cache.db'))
+    with pytest.raises(Exception, match='Roster'):
+        [*CachingExecutor(SerialExecutor(), cache).run([], [])]
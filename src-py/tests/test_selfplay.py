@@ -0,0 +1,42 @@
+from registry import parse_roster
+from selfplay import DESCR, LABELS, RECORD_SIZE, ShardWriter, generate
+from tournament import Scheduler
+import npy
+import os
+
+
+def games(directory: str) -> list:
+    numbers = []
+    for name in sorted(os.listdir(directory)):
+        descr, shape, data = npy.read(os.path.join(directory, name))
+        assert descr == DESCR
+        assert len(data) == shape[0] * RECORD_SIZE
+        numbers += [LABELS.unpack_from(data, offset + RECORD_SIZE - LABELS.size)[-1]
+                    for offset in range(0, len(data), RECORD_SIZE)]
+    return numbers
+
+
+def test_shards_are_full_and_numbered(tmp_path) -> None:
+    writer = ShardWriter(str(tmp_path), shard_size=100)
+    generate(parse_roster(['random:5']), Scheduler(5, [5], 1), 10, writer)
+    writer.close()
+    sizes = [npy.read(str(tmp_path / name))[1][0] for name in sorted(os.listdir(tmp_path))]
+    assert sizes[:-1] == [100] * (len(sizes) - 1)
+    assert sum(sizes) == writer.records
+    assert sorted(set(games(str(tmp_path)))) == [*range(10)]
+
+
+def test_resume_fills_up_the_last_shard(tmp_path) -> None:
+    agents = parse_roster(['random:5'])
+    scheduler = Scheduler(5, [5], 1)
+    writer = ShardWriter(str(tmp_path), shard_size=1000)
+    generate(agents, scheduler, 5, writer)
+    writer.close()
+    assert os.listdir(tmp_path) == ['shard-000000.npy']
+
+    resumed = ShardWriter(str(tmp_path), shard_size=1000)
+    assert resumed.next_game == 5
+    generate(agents, scheduler, 5, resumed)
+    resumed.close()
+    assert os.listdir(tmp_path) == ['shard-000000.npy']
+    assert sorted(set(games(str(tmp_path)))) == [*range(10)]
@@ -0,0 +1,129 @@
+from registry import parse_roster
+from result_store import ResultStore
+from tournament import Checkpoint, GameSpec, Scheduler, SerialExecutor, Tournament
+from typing import List
+import pytest
+
+
+def standings(tournament: Tournament) -> List[dict]:
+    return [vars(standing) for standing in tournament.standings]
+
+
+def test_schedule_is_seeded() -> None:
+    first = [*Scheduler(8, range(5, 9), seed=3).specs(50)]
+    assert first == [*Scheduler(8, range(5, 9), seed=3).specs(50)]
+    assert first != [*Scheduler(8, range(5, 9), seed=4).specs(50)]
+
+
+def test_specs_are_valid() -> None:
+    for spec in Scheduler(12, range(5, 11), seed=1).specs(200):
+        n = len(spec.seating)
+        assert 5 <= n <= 10
+        assert len(set(spec.seating)) == n
+        assert len(spec.spies) == {5: 2, 6: 2, 7: 3, 8: 3, 9: 3, 10: 4}[n]
+        assert all(0 <= seat < n for seat in spec.spies)
+
+
+def test_pairs_swap_roles() -> None:
+    specs = [*Scheduler(7, [5, 7], seed=2).specs(100)]
+    for first, second in zip(specs[::2], specs[1::2]):
+        assert second.seating == first.seating and second.seed == first.seed
+        assert not set(first.spies) & set(second.spies)
+
+
+def test_unpaired() -> None:
+    specs = [*Scheduler(7, [5], seed=2, paired=False).specs(20)]
+    assert len({spec.seed for spec in specs}) == 20
+
+
+def test_coverage_is_balanced() -> None:
+    scheduler = Scheduler(7, [5], seed=1)
+    for _ in scheduler.specs(2000):
+        pass
+    assert max(scheduler.games) - min(scheduler.games) <= 5
+    assert max(scheduler.spy_games) - min(scheduler.spy_games) <= 5
+    for seats in scheduler.seat_games:
+        assert max(seats[:5]) - min(seats[:5]) <= 5
+
+
+def test_mirror_counts_the_first_game() -> None:
+    # The mirror of a deal is chosen from coverage counts that include the deal.
+    scheduler = Scheduler(7, [5], seed=1)
+    counted = []
+    mirror = scheduler.mirror
+
+    def counting_mirror(spec: GameSpec) -> GameSpec:
+        counted.append(sum(scheduler.games))
+        return mirror(spec)
+
+    scheduler.mirror = counting_mirror  # type: ignore[assignment]
+    for _ in scheduler.specs(6):
+        pass
+    assert counted == [5, 15, 25]
+
+
+def test_invalid_table_sizes() -> None:
+    with pytest.raises(Exception):
+        Scheduler(6, [7])
+    with pytest.raises(Exception):
+        Scheduler(6, [])
+
+
+def test_checkpoint_resume_matches_uninterrupted_run(tmp_path) -> None:
+    whole = Tournament(parse_roster(['random:4', 'bayes:2']), Scheduler(6, [5, 6], seed=5))
+    whole.run(60)
+
+    path = str(tmp_path / 'checkpoint')
+    first = Tournament(parse_roster(['random:4', 'bayes:2']), Scheduler(6, [5, 6], seed=5))
+    first.run(25, checkpoint=Checkpoint(path, interval=0))
+    resumed = Tournament(parse_roster(['random:4', 'bayes:2']), Scheduler(6, [5, 6], seed=5))
+    resumed.run(60, checkpoint=Checkpoint(path, interval=0))
+    assert resumed.played == 60
+    assert standings(resumed) == standings(whole)
+
+
+def test_checkpoint_rolls_back_result_store(tmp_path) -> None:
+    agents = parse_roster(['random:5'])
+    names = [spec.name for spec in agents.specs]
+    store = ResultStore(str(tmp_path / 'results'))
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint'), interval=0, results=store)
+    tournament = Tournament(agents, Scheduler(5, [5], seed=1))
+    tournament.run(10, store.recorder(names), checkpoint)
+    # games recorded after the last checkpoint, as if the run was killed before saving again
+    for spec in Scheduler(5, [5], seed=9).specs(7):
+        store.add(SerialExecutor().run(agents, [spec]).__next__(), names)
+    store.close()
+
+    store = ResultStore(str(tmp_path / 'results'))
+    resumed = Tournament(parse_roster(['random:5']), Scheduler(5, [5], seed=1))
+    resumed.run(20, store.recorder(names), Checkpoint(str(tmp_path / 'checkpoint'), interval=0, results=store))
+    assert len(store) == 20
+    store.close()
+
+
+def test_restore_creates_no_agents(tmp_path) -> None:
+    path = str(tmp_path / 'checkpoint')
+    Tournament(parse_roster(['random:5', 'monte']), Scheduler(6, [5], seed=1)).run(4, checkpoint=Checkpoint(path, 0))
+    agents = parse_roster(['random:5', 'monte'])
+    tournament = Tournament(agents, Scheduler(6, [5], seed=1))
+    state = Checkpoint(path, 0).load()
+    assert state is not None
+    tournament.restore(state)
+    assert tournament.played == 4
+    assert agents.created() == [None] * 6
+
+
+def test_restore_rejects_another_pool(tmp_path) -> None:
+    path = str(tmp_path / 'checkpoint')
+    Tournament(parse_roster(['random:6']), Scheduler(6, [5], seed=1)).run(4, checkpoint=Checkpoint(path, 0))
+    state = Checkpoint(path, 0).load()
+    other = Tournament(parse_roster(['random:5', 'bayes']), Scheduler(6, [5], seed=1))
+    with pytest.raises(Exception, match='different pool'):
+        other.restore(state)  # type: ignore[arg-type]
+
+
+def test_serial_games_are_seeded() -> None:
+    agents = parse_roster(['random:5'])
+    spec = GameSpec((0, 1, 2, 3, 4), (1, 3), 42)
+    results = [next(SerialExecutor().run(agents, [spec])) for _ in range(2)]
+    assert results[0].failed_rounds == results[1].failed_rounds
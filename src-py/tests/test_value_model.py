@@ -0,0 +1,52 @@
+from array import array
+from features import FEATURES, encode
+from history import GameHistory, bitmask
+from value_model import ValueModel, fit_linear
+import pytest
+import random
+
+
+def random_model(hidden: int, seed: int = 0) -> ValueModel:
+    rng = random.Random(seed)
+    return ValueModel([(array('f', [rng.uniform(-0.1, 0.1) for _ in range(FEATURES * hidden)]),
+                        array('f', [rng.uniform(-0.1, 0.1) for _ in range(hidden)])),
+                       (array('f', [rng.uniform(-1, 1) for _ in range(hidden)]), array('f', [0.25]))])
+
+
+def features() -> list:
+    history = GameHistory(5)
+    history.propose(0, [1, 2], [0, 1, 2])
+    history.mission(1)
+    return [bytes(encode(history.view(), seat, bitmask([1, 3]) if seat in (1, 3) else 0)) for seat in range(5)]
+
+
+def test_save_and_load_round_trip(tmp_path) -> None:
+    path = str(tmp_path / 'value.npz')
+    model = random_model(8)
+    model.save(path)
+    loaded = ValueModel.load(path)
+    assert [(list(w), list(b)) for w, b in loaded.layers] == [(list(w), list(b)) for w, b in model.layers]
+    assert loaded.predict(features()) == pytest.approx(model.predict(features()))
+
+
+def test_predict_matches_predict_one() -> None:
+    model = random_model(4)
+    batch = features()
+    assert model.predict(batch) == pytest.approx([model.predict_one(x) for x in batch], abs=1e-6)
+    assert all(0 < p < 1 for p in model.predict(batch))
+
+
+def test_layer_shapes_are_checked() -> None:
+    with pytest.raises(Exception, match='weights'):
+        ValueModel([(array('f', [0.0] * (FEATURES - 1)), array('f', [0.0]))])
+    with pytest.raises(Exception, match='one output'):
+        ValueModel([(array('f', [0.0] * FEATURES * 2), array('f', [0.0, 0.0]))])
+
+
+def test_fit_linear_learns_a_separable_feature(tmp_path) -> None:
+    batch = features()
+    labels = [int(x[FEATURES - 1 - 9] == 0) for x in batch]
+    model = fit_linear(batch * 50, labels * 50, epochs=5, rate=0.1)
+    model.save(str(tmp_path / 'linear.npz'))
+    predictions = ValueModel.load(str(tmp_path / 'linear.npz')).predict(batch)
+    assert [p > 0.5 for p in predictions] == [bool(y) for y in labels]